@@ -1,95 +1,244 @@
-from dataclasses import dataclass
-from queue import PriorityQueue
-from typing import List, Optional, Tuple, Union
+import collections
+import heapq
+import math
+import threading
+from typing import Callable, List, Optional, Tuple, Union
 
 from character import Character
-from geometry import pdist, Point
+from geometry import Point
+from terrain import Terrain
 
 
-def successors(world_map: List[str],
-               src: Point,
-               impassable: Optional[Union[str, Character]] = None):
+# A map is a Terrain or, for small maps and tests, rows of map characters.
+WorldMap = Union[Terrain, List[str]]
 
-    if impassable is None:
-        impassable = ''
 
-    height = len(world_map)
-    width = len(world_map[0])
+# Offsets to the eight neighbours of a cell, in the same (x-major) order
+# that successors() yields them, paired with the cost of the step.
+NEIGHBOUR_OFFSETS: List[Tuple[int, int, float]] = [
+    (dx, dy, math.sqrt(dx*dx + dy*dy))
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx != 0 or dy != 0]
 
-    def valid_successor(p: Point):
-        if p.x == src.x and p.y == src.y:
-            return False
-        if p.x < 0 or p.y < 0 or p.x >= width or p.y >= height:
-            return False
+# A cell's parent is only replaced by a route that is cheaper by more than
+# this, so that equal-cost routes summed in a different order keep the
+# first route found rather than flip-flopping on rounding error.
+COST_EPSILON = 1e-9
 
-        if isinstance(impassable, str):
-            return world_map[p.y][p.x] not in impassable
-        elif isinstance(impassable, Character):
-            return impassable.can_move_to(p)
+# Searches on maps with more cells than this are confined to a window
+# around the start and destination, so that a query needs memory in
+# proportion to its own length rather than to the size of the map.
+MAX_FULL_SEARCH_CELLS = 256 * 256
+# How far such a window reaches past the start and destination.
+SEARCH_WINDOW_MARGIN = 32
+# How many SearchGrids to keep for reuse. Only grids of up to
+# MAX_FULL_SEARCH_CELLS are kept; larger ones are allocated per search.
+SEARCH_GRID_CACHE_SIZE = 8
 
-    successors = [Point(x, y) for x in range(src.x-1, src.x+2)
-                  for y in range(src.y-1, src.y+2)]
 
-    successors = list(filter(valid_successor, successors))
-    return successors
+def successors(world_map: WorldMap,
+               src: Point,
+               impassable: Optional[Union[str, Character]] = None):
+
+    (width, height) = _map_size(world_map)
+    passable = _passable_fn(world_map, impassable)
 
+    successors = []
+    for (dx, dy, _) in NEIGHBOUR_OFFSETS:
+        x, y = src.x + dx, src.y + dy
+        if 0 <= x < width and 0 <= y < height and passable(x, y):
+            successors.append(Point(x, y))
+    return successors
 
-@dataclass
-class VisitState:
-    visited: bool = False
-    cost: float = 0
-    parent: Optional[Point] = None
 
+def _map_size(world_map: WorldMap) -> Tuple[int, int]:
+    if isinstance(world_map, Terrain):
+        return (world_map.width, world_map.height)
+    return (len(world_map[0]), len(world_map))
+
+
+def _passable_fn(world_map: WorldMap,
+                 impassable: Optional[Union[str, Character]]) \
+        -> Callable[[int, int], bool]:
+    if isinstance(impassable, Character):
+        character = impassable
+        return lambda x, y: character.can_move_to(Point(x, y))
+    elif impassable and isinstance(world_map, Terrain):
+        blocked_cells, width = world_map.mask(impassable), world_map.width
+        return lambda x, y: not blocked_cells[y * width + x]
+    elif impassable:
+        blocked = impassable
+        return lambda x, y: world_map[y][x] not in blocked
+    else:
+        return lambda x, y: True
+
+
+class SearchGrid:
+    """Preallocated per-cell A* state for a ``width`` x ``height`` map.
+
+    Cells are addressed by their flat index ``y * width + x``. Rather than
+    reallocating or clearing the arrays, every search bumps ``generation``;
+    an entry is only meaningful while its stamp matches the current
+    generation, so the same grid is reused for every query on a map.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        n = width * height
+        self.cost = [0.0] * n
+        self.parent = [-1] * n
+        # Generation in which a cell was first reached / expanded.
+        self.seen = [0] * n
+        self.closed = [0] * n
+        # +generation if the cell was found passable during this search,
+        # -generation if it was found impassable.
+        self.probed = [0] * n
+        self.generation = 0
+
+    def search(self,
+               src: Point,
+               dst: Point,
+               passable: Callable[[int, int], bool],
+               within: int = 0) -> Optional[List[Point]]:
+        self.generation += 1
+        gen = self.generation
+        width, height = self.width, self.height
+        cost, parent = self.cost, self.parent
+        seen, closed, probed = self.seen, self.closed, self.probed
+        dstx, dsty = dst.x, dst.y
+        within_sq = within * within
+        hypot = math.hypot
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        src_idx = src.y * width + src.x
+        seen[src_idx] = gen
+        cost[src_idx] = 0.0
+        parent[src_idx] = -1
+
+        # Entries are (f, x, y) so that ties break on position exactly
+        # like the Point ordering did. Cells that are reached again via a
+        # cheaper route are simply pushed again; stale entries are skipped
+        # once the cell has been closed.
+        fringe = [(0.0, src.x, src.y)]
+        while fringe:
+            (_, x, y) = heappop(fringe)
+            idx = y * width + x
+            if closed[idx] == gen:
+                continue
+            closed[idx] = gen
+
+            if (x - dstx)**2 + (y - dsty)**2 <= within_sq:
+                return self._reconstruct_path(idx)
+
+            g = cost[idx]
+            for (dx, dy, step) in NEIGHBOUR_OFFSETS:
+                nx, ny = x + dx, y + dy
+                if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                    continue
+                nidx = ny * width + nx
+                if closed[nidx] == gen:
+                    continue
+                p = probed[nidx]
+                if p == -gen:
+                    continue
+                if p != gen:
+                    if not passable(nx, ny):
+                        probed[nidx] = -gen
+                        continue
+                    probed[nidx] = gen
+                ng = g + step
+                if seen[nidx] != gen or ng < cost[nidx] - COST_EPSILON:
+                    seen[nidx] = gen
+                    cost[nidx] = ng
+                    parent[nidx] = idx
+                    heappush(fringe,
+                             (ng + hypot(nx - dstx, ny - dsty), nx, ny))
+        return None
 
-def visit(visited: List[List[VisitState]],
-          pos: Point,
-          parent: Optional[Point] = None):
-    visited[pos.y][pos.x] = VisitState(True, 0, parent)
-    if parent is not None:
-        visited[pos.y][pos.x].cost = visited[parent.y][parent.x].cost + \
-            pdist(parent, pos)
+    def _reconstruct_path(self, idx: int) -> List[Point]:
+        width, parent = self.width, self.parent
+        path = []
+        while idx != -1:
+            path.append(Point.from_cell(idx, width))
+            idx = parent[idx]
+        path.reverse()
+        return path
+
+
+# Each thread keeps its own grids, so that searches on PathService worker
+# threads never share state with the game's.
+_local = threading.local()
+
+
+def _search_grids() -> 'collections.OrderedDict[Tuple[int, int], SearchGrid]':
+    grids = getattr(_local, 'grids', None)
+    if grids is None:
+        grids = _local.grids = collections.OrderedDict()
+    return grids
+
+
+def search_grid(width: int, height: int) -> SearchGrid:
+    """Returns a SearchGrid for a ``width`` x ``height`` map, reusing a
+    recent one if it is small enough to have been kept.
+    """
+    if width * height > MAX_FULL_SEARCH_CELLS:
+        return SearchGrid(width, height)
+    grids = _search_grids()
+    key = (width, height)
+    grid = grids.get(key)
+    if grid is None:
+        grid = grids[key] = SearchGrid(width, height)
+        if len(grids) > SEARCH_GRID_CACHE_SIZE:
+            grids.popitem(last=False)
+    else:
+        grids.move_to_end(key)
+    return grid
 
 
-def reconstruct_path(visited: List[List[VisitState]],
+def find_path_window(passable: Callable[[int, int], bool],
                      src: Point,
-                     dst: Point):
-    pos = Point(dst.x, dst.y)
-    path = [pos]
-    while pos != src:
-        parent = visited[pos.y][pos.x].parent
-        assert parent is not None
-        pos = parent
-        path.append(pos)
-    path.reverse()
-    return path
-
-
-def find_path_astar(world_map: List[str],
+                     dst: Point,
+                     x0: int, y0: int, x1: int, y1: int,
+                     within: int = 0) -> Optional[List[Point]]:
+    """Like find_path_astar(), but only searches the cells with x0 <= x <
+    x1 and y0 <= y < y1, so that its cost doesn't grow with the map.
+    """
+    grid = search_grid(x1 - x0, y1 - y0)
+    path = grid.search(Point(src.x - x0, src.y - y0),
+                       Point(dst.x - x0, dst.y - y0),
+                       lambda x, y: passable(x + x0, y + y0), within)
+    if path is None:
+        return None
+    return [Point(p.x + x0, p.y + y0) for p in path]
+
+
+def find_path_bounded(passable: Callable[[int, int], bool],
+                      width: int, height: int,
+                      src: Point,
+                      dst: Point,
+                      within: int = 0) -> Optional[List[Point]]:
+    """Like find_path_astar() on a ``width`` x ``height`` map, but on maps
+    of more than MAX_FULL_SEARCH_CELLS only searches within
+    SEARCH_WINDOW_MARGIN of the rectangle spanned by ``src`` and ``dst``,
+    so that no path is found that would have to detour further than that.
+    """
+    if width * height <= MAX_FULL_SEARCH_CELLS:
+        return search_grid(width, height).search(src, dst, passable, within)
+    margin = SEARCH_WINDOW_MARGIN
+    return find_path_window(passable, src, dst,
+                            max(0, min(src.x, dst.x) - margin),
+                            max(0, min(src.y, dst.y) - margin),
+                            min(width, max(src.x, dst.x) + margin + 1),
+                            min(height, max(src.y, dst.y) + margin + 1),
+                            within)
+
+
+def find_path_astar(world_map: WorldMap,
                     src: Point,
                     dst: Point,
                     impassable: Optional[Union[str, Character]] = None,
                     within: int = 0):
 
-    if impassable is None:
-        impassable = ''
-
-    visited = [[VisitState() for x in range(len(world_map[0]))]
-               for y in range(len(world_map))]
-    visit(visited, src)
-    fringe: PriorityQueue[Tuple[int, Point]] = PriorityQueue()
-    fringe.put((0, src))
-    while not fringe.empty():
-        (_, pos) = fringe.get()
-        if pdist(pos, dst) <= within:
-            break
-        succs = successors(world_map, pos, impassable)
-        for succ in succs:
-            if not visited[succ.y][succ.x].visited:
-                visit(visited, succ, pos)
-                hcost = visited[succ.y][succ.x].cost + \
-                    pdist(succ, dst)
-                fringe.put((hcost, succ))
-    if pdist(pos, dst) <= within:
-        return reconstruct_path(visited, src, pos)
-    else:
-        return None
+    (width, height) = _map_size(world_map)
+    return find_path_bounded(_passable_fn(world_map, impassable), width,
+                             height, src, dst, within)
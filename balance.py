@@ -0,0 +1,294 @@
+"""Monte Carlo batch simulation for level balancing.
+
+Plays many headless games with a scripted or random player across a pool
+of worker processes and summarises the resulting Stats and causes of
+death, optionally sweeping one Game parameter over several values:
+
+    python -m balance --games 2000 --policy forager \\
+        --sweep ENERGY_LOSS_PER_SEC=12,16,20 \\
+        --set "number_foxes_for_level=level"
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import random
+import statistics
+from typing import Any, Callable, Dict, List, Tuple
+
+from game import Game, GameState, Input, Season
+from geometry import Direction, Point
+
+
+# How long a game may run, in game milliseconds, before it is stopped.
+DEFAULT_MAX_GAME_MS = 30 * 60 * 1000
+SURVIVED = "Survived to the time limit"
+
+
+class RandomPolicy:
+    """Mashes keys at random."""
+
+    INPUTS = [Input.FACE_UP, Input.FACE_DOWN, Input.FACE_LEFT,
+              Input.FACE_RIGHT, Input.ROTATE_CLOCKWISE,
+              Input.ROTATE_COUNTER_CLOCKWISE, Input.SPACE, Input.F, Input.C]
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def __call__(self, game):
+        inputs = []
+        if self.rng.random() < 0.1:
+            inputs.append(self.rng.choice(self.INPUTS))
+        held = [d for d in Direction if self.rng.random() < 0.1]
+        return inputs, held
+
+
+_FACE_INPUT = {
+    Direction.UP: Input.FACE_UP,
+    Direction.DOWN: Input.FACE_DOWN,
+    Direction.LEFT: Input.FACE_LEFT,
+    Direction.RIGHT: Input.FACE_RIGHT,
+}
+
+
+def _direction_towards(src, dst):
+    dx, dy = dst.x - src.x, dst.y - src.y
+    if abs(dx) >= abs(dy):
+        return Direction.RIGHT if dx > 0 else Direction.LEFT
+    return Direction.DOWN if dy > 0 else Direction.UP
+
+
+class ForagerPolicy:
+    """Walks to the nearest nut and eats it, and climbs the nearest tree
+    when a fox comes close or the season is about to end.
+    """
+
+    # Head for a tree once this much of the season is left.
+    SHELTER_MS = 8000
+    FOX_DANGER_DISTANCE = 6
+
+    def __init__(self, rng):
+        self.rng = rng
+        self._trees_world = None
+        self._trees = []
+
+    def _nearest(self, pos, points):
+        return min(points, default=None,
+                   key=lambda p: abs(p.x - pos.x) + abs(p.y - pos.y))
+
+    def _trees_of(self, world):
+        if world is not self._trees_world:
+            self._trees_world = world
+            self._trees = [Point(x, y)
+                           for y in range(world.HEIGHT_TILES)
+                           for x in range(world.WIDTH_TILES)
+                           if world.is_tree(Point(x, y))]
+        return self._trees
+
+    def _in_danger(self, game):
+        pos = game.world.squirrel.pos
+        remaining = game.ROUND_DURATION[game.current_season] - \
+            game.current_round_elapsed
+        if remaining < self.SHELTER_MS:
+            return True
+        return any(max(abs(fox.pos.x - pos.x), abs(fox.pos.y - pos.y))
+                   <= self.FOX_DANGER_DISTANCE
+                   for fox in game.world.foxes)
+
+    def __call__(self, game):
+        world = game.world
+        pos = world.squirrel.pos
+
+        if self._in_danger(game) or game.current_season == Season.WINTER:
+            if world.is_tree(pos):
+                return [], []
+            tree = self._nearest(pos, self._trees_of(world))
+            if tree is None:
+                return [], []
+            return [], [_direction_towards(pos, tree)]
+
+        nut = self._nearest(pos, [nut.pos for nut in world.active_nuts()])
+        if nut is None:
+            return [], []
+        if abs(nut.x - pos.x) + abs(nut.y - pos.y) == 1:
+            return [_FACE_INPUT[_direction_towards(pos, nut)],
+                    Input.SPACE], []
+        direction = _direction_towards(pos, nut)
+        if self.rng.random() < 0.2:
+            # Jiggle around whatever is in the way.
+            direction = self.rng.choice(list(Direction))
+        return [], [direction]
+
+
+# A policy is called with the game once per step and returns the inputs
+# to send and the directions to hold.
+Policy = Callable[[Game], Tuple[List[Input], List[Direction]]]
+
+POLICIES: Dict[str, Callable[[random.Random], Policy]] = {
+    'random': RandomPolicy,
+    'forager': ForagerPolicy,
+}
+
+
+def game_class(overrides):
+    """Returns a Game subclass with ``overrides`` applied.
+
+    Each override maps a Game attribute to a string: for methods such as
+    number_foxes_for_level it is a Python expression of ``level``, and for
+    constants such as ENERGY_LOSS_PER_SEC it is a Python literal.
+    """
+    if not overrides:
+        return Game
+    attrs = {}
+    for (name, value) in overrides.items():
+        current = getattr(Game, name, None)
+        if current is None:
+            raise ValueError(f"Game has no attribute {name}")
+        if callable(current):
+            code = compile(value, f"<{name}>", 'eval')
+            attrs[name] = (lambda code: lambda self:
+                           eval(code, {}, {'level': self.level}))(code)
+        else:
+            attrs[name] = type(current)(eval(value, {}, {}))
+    return type('TunedGame', (Game,), attrs)
+
+
+def play_game(task):
+    """Plays one game headlessly and returns its outcome. Runs in a worker
+    process, so takes and returns only plain data.
+    """
+    (seed, policy_name, overrides, max_game_ms, timestep_ms) = task
+    game = game_class(overrides)(seed=seed)
+    policy = POLICIES[policy_name](random.Random(seed))
+
+    game.input(Input.START)
+    while game.state == GameState.STARTED \
+            and game.time.current_time_ms() < max_game_ms:
+        (inputs, held) = policy(game)
+        for player_input in inputs:
+            game.input(player_input)
+        game.step(timestep_ms, held)
+
+    return {
+        'seed': seed,
+        'seasons_survived': game.stats.seasons_survived,
+        'nuts_eaten': game.stats.nuts_eaten,
+        'nuts_buried': len(game.stats.nuts_buried),
+        'level': game.level,
+        'game_ms': game.time.current_time_ms(),
+        'cause': game.game_over_message or SURVIVED,
+    }
+
+
+def run_batch(games, policy_name='forager', overrides=None, seed=0,
+              workers=None, max_game_ms=DEFAULT_MAX_GAME_MS,
+              timestep_ms=Game.FIXED_TIMESTEP):
+    """Plays ``games`` games, seeded seed, seed + 1, ..., across
+    ``workers`` processes (all cores by default), and returns their
+    outcomes in seed order.
+    """
+    tasks = [(seed + i, policy_name, dict(overrides or {}), max_game_ms,
+              timestep_ms) for i in range(games)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [play_game(task) for task in tasks]
+    # Large chunks keep inter-process traffic negligible next to the
+    # games themselves.
+    chunksize = max(1, games // (workers * 8))
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(play_game, tasks, chunksize=chunksize))
+
+
+def summarise(results):
+    summary: Dict[str, Any] = collections.OrderedDict()
+    summary['games'] = len(results)
+    for stat in ['seasons_survived', 'nuts_eaten', 'nuts_buried', 'level']:
+        values = sorted(result[stat] for result in results)
+        summary[stat] = {
+            'mean': statistics.mean(values),
+            'median': statistics.median(values),
+            'p90': values[min(len(values) - 1, int(len(values) * 0.9))],
+            'max': values[-1],
+        }
+    causes = collections.Counter(result['cause'] for result in results)
+    summary['causes'] = {cause: count / len(results)
+                         for (cause, count) in causes.most_common()}
+    return summary
+
+
+def print_summaries(summaries):
+    causes = sorted({cause for summary in summaries.values()
+                     for cause in summary['causes']})
+    stats = ['seasons_survived', 'nuts_eaten', 'nuts_buried']
+    header = f"{'config':<30}{'games':>7}" + \
+        "".join(f"{stat + ' mean/p90':>26}" for stat in stats)
+    print(header)
+    for (config, summary) in summaries.items():
+        row = f"{config:<30}{summary['games']:>7}"
+        for stat in stats:
+            cell = f"{summary[stat]['mean']:.2f}/{summary[stat]['p90']}"
+            row += f"{cell:>26}"
+        print(row)
+    print()
+    print(f"{'config':<30}" + "".join(f"{cause[:28]:>30}" for cause in causes))
+    for (config, summary) in summaries.items():
+        print(f"{config:<30}" + "".join(
+            f"{summary['causes'].get(cause, 0):>30.1%}" for cause in causes))
+
+
+def _parse_assignment(text):
+    (name, sep, value) = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text}")
+    return (name.strip(), value.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=1000,
+                        help="games to play per configuration")
+    parser.add_argument('--policy', choices=sorted(POLICIES),
+                        default='forager')
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the first game")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument('--max-minutes', type=float,
+                        default=DEFAULT_MAX_GAME_MS / 60000,
+                        help="game minutes after which a game is stopped")
+    parser.add_argument('--set', dest='overrides', action='append',
+                        type=_parse_assignment, default=[],
+                        metavar='NAME=VALUE',
+                        help="override a Game constant, or a per-level "
+                             "method with an expression of level")
+    parser.add_argument('--sweep', type=_parse_assignment,
+                        metavar='NAME=V1,V2,...',
+                        help="run one configuration per value of NAME")
+    parser.add_argument('--json', metavar='PATH',
+                        help="also write the summaries to PATH")
+    args = parser.parse_args()
+
+    base = dict(args.overrides)
+    configs = collections.OrderedDict()
+    if args.sweep:
+        (name, values) = args.sweep
+        for value in values.split(','):
+            configs[f"{name}={value}"] = dict(base, **{name: value})
+    else:
+        configs['default' if not base else 'custom'] = base
+
+    summaries = collections.OrderedDict()
+    for (config, overrides) in configs.items():
+        results = run_batch(args.games, args.policy, overrides, args.seed,
+                            args.workers, int(args.max_minutes * 60000))
+        summaries[config] = summarise(results)
+
+    print_summaries(summaries)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+"""Benchmarks for the game's hot paths.
+
+Run ``python -m benchmark`` to time pathfinding, world queries and
+rendering. ``--save PATH`` writes the results to a JSON baseline and
+``--compare PATH`` reports each result against a previously saved one.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+from astar import find_path_astar
+from geometry import Direction, pdist, Point
+from hpa import HierarchicalPathfinder
+from mapgen import generate_map
+from nut import Nut
+from squirrel import Squirrel
+from fox import Fox
+from world import World
+
+
+# Results slower than the baseline by more than this fraction are reported
+# as regressions.
+REGRESSION_THRESHOLD = 0.10
+
+# Benchmark name to its setup, which returns the function to time.
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name):
+    """Registers a benchmark. The decorated function does any setup and
+    returns a callable that runs one iteration of the measured work.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def random_map(width, height, density, seed=0):
+    rng = random.Random(seed)
+    return [''.join('#' if rng.random() < density else '.'
+                    for x in range(width))
+            for y in range(height)]
+
+
+def _clear(world_map, points):
+    rows = [list(row) for row in world_map]
+    for p in points:
+        rows[p.y][p.x] = '.'
+    return [''.join(row) for row in rows]
+
+
+def _astar_setup(size, density):
+    src, dst = Point(1, 1), Point(size - 2, size - 2)
+    world_map = _clear(random_map(size, size, density), [src, dst])
+    return lambda: find_path_astar(world_map, src, dst, '#')
+
+
+def _astar_unreachable_setup(size):
+    # Wall the destination in so that the search floods everything else.
+    src, dst = Point(1, 1), Point(size - 3, size - 3)
+    rows = [list(row) for row in random_map(size, size, 0.1)]
+    for y in range(dst.y - 1, dst.y + 2):
+        for x in range(dst.x - 1, dst.x + 2):
+            rows[y][x] = '#'
+    rows[dst.y][dst.x] = '.'
+    rows[src.y][src.x] = '.'
+    world_map = [''.join(row) for row in rows]
+    return lambda: find_path_astar(world_map, src, dst, '#')
+
+
+for size in [40, 100, 200]:
+    for density in [0.0, 0.1, 0.25]:
+        benchmark(f"astar/{size}x{size}/trees={density:.2f}")(
+            lambda size=size, density=density: _astar_setup(size, density))
+    benchmark(f"astar/{size}x{size}/unreachable")(
+        lambda size=size: _astar_unreachable_setup(size))
+
+
+class _BenchGame:
+    def __init__(self, world):
+        self.world = world
+
+
+def _populated_world(size, nnuts, nsquirrels, nfoxes):
+    rng = random.Random(0)
+    world = World(random_map(size, size, 0.1))
+    game = _BenchGame(world)
+
+    def random_point():
+        return Point(rng.randrange(size), rng.randrange(size))
+    for i in range(nnuts):
+        p = random_point()
+        state = Nut.NutState.ACTIVE if i % 2 else Nut.NutState.BURIED
+        world.add_nut(Nut(p.x, p.y, state))
+    for i in range(nsquirrels):
+        world.add_squirrel(Squirrel(game, random_point(), Direction.DOWN))
+    for i in range(nfoxes):
+        world.add_fox(Fox(game, random_point(), Direction.DOWN))
+    points = [random_point() for i in range(1000)]
+    return world, points
+
+
+def _world_queries_setup(size, nnuts, nsquirrels):
+    world, points = _populated_world(size, nnuts, nsquirrels, nsquirrels)
+
+    def run():
+        for p in points:
+            world.can_move_to(p)
+            world.is_nut(p)
+            world.is_npc(p)
+            world.can_bury_nut(p)
+    return run
+
+
+def _world_nut_choice_setup(nnuts):
+    world, points = _populated_world(200, nnuts, 0, 0)
+
+    def run():
+        for i in range(1000):
+            world.nuts.random(Nut.NutState.BURIED)
+            world.nuts.random(Nut.NutState.ACTIVE)
+    return run
+
+
+def _world_new_setup(size):
+    world_map = random_map(size, size, 0.1)
+    rng = random.Random(0)
+    return lambda: World(world_map, 30, rng)
+
+
+for size in [200, 1000]:
+    benchmark(f"world/new/{size}x{size}")(
+        lambda size=size: _world_new_setup(size))
+for size in [1000, 4000]:
+    benchmark(f"mapgen/{size}x{size}")(
+        lambda size=size: lambda: generate_map(size, size, seed=0))
+
+
+def _long_path_setup(size, hierarchical):
+    # Corner to corner across a generated map. The hierarchical pathfinder
+    # is laid out beforehand, as it would be after a few queries in game.
+    src, dst = Point(1, 1), Point(size - 2, size - 2)
+    terrain = generate_map(size, size, seed=0, density=0.15).terrain
+    for p in [src, dst]:
+        terrain.set(p.x, p.y, '.')
+    if not hierarchical:
+        return lambda: find_path_astar(terrain, src, dst, '#')
+    pathfinder = HierarchicalPathfinder(size, size, terrain.trees)
+    pathfinder.precompute()
+    return lambda: pathfinder.find_path(
+        src, dst, lambda x, y: terrain[y][x] != '#')
+
+
+for size in [256, 512]:
+    benchmark(f"astar/{size}x{size}/mapgen")(
+        lambda size=size: _long_path_setup(size, False))
+    benchmark(f"hpa/{size}x{size}/mapgen")(
+        lambda size=size: _long_path_setup(size, True))
+for (nnuts, nnpcs) in [(100, 10), (1000, 100), (10000, 1000)]:
+    benchmark(f"world/queries/nuts={nnuts}/npcs={nnpcs}")(
+        lambda nnuts=nnuts, nnpcs=nnpcs:
+            _world_queries_setup(200, nnuts, nnpcs))
+for nnuts in [100, 10000]:
+    benchmark(f"world/random_nut/nuts={nnuts}")(
+        lambda nnuts=nnuts: _world_nut_choice_setup(nnuts))
+
+
+def _npc_tick_setup(nsquirrels, npc_arrays):
+    from game import Game
+    game = Game(seed=0, npc_arrays=npc_arrays)
+    game.world = World(random_map(200, 200, 0.1), 1, game.rng, npc_arrays)
+    game._init_squirrels(nsquirrels)
+    game._init_foxes(nsquirrels // 10)
+
+    def run():
+        game.tick_squirrels(None, 0)
+        game.tick_foxes(None, 0)
+    return run
+
+
+def _npc_arrays_setup(nsquirrels):
+    # Report a missing NumPy as a skipped benchmark.
+    import numpy  # noqa: F401
+    return _npc_tick_setup(nsquirrels, True)
+
+
+for nsquirrels in [100, 1000, 5000]:
+    benchmark(f"npcs/tick/squirrels={nsquirrels}/objects")(
+        lambda nsquirrels=nsquirrels: _npc_tick_setup(nsquirrels, False))
+    benchmark(f"npcs/tick/squirrels={nsquirrels}/arrays")(
+        lambda nsquirrels=nsquirrels: _npc_arrays_setup(nsquirrels))
+
+
+def _pursuit_setup(nfoxes):
+    # Foxes spread around the squirrel, all within attack range, chasing it
+    # along paths (re)planned through character-aware passability.
+    from game import Game
+    game = Game(seed=0)
+    world = game.world = World(random_map(60, 60, 0.1), 1, game.rng)
+    rng = random.Random(0)
+    target = Point(30, 30)
+    world.move_character(world.squirrel, target)
+    starts: List[Point] = []
+    while len(starts) < nfoxes:
+        p = Point(target.x + rng.randint(-8, 8), target.y + rng.randint(-8, 8))
+        if 4 < pdist(p, target) <= Fox.ATTACK_DISTANCE \
+                and not world.is_tree(p):
+            starts.append(p)
+    foxes = [Fox(game, p, Direction.DOWN) for p in starts]
+
+    def run():
+        world.clear_foxes()
+        for (fox, p) in zip(foxes, starts):
+            fox.pos = p
+            fox._route = None
+            world.add_fox(fox)
+        for i in range(4):
+            game.pursuit.invalidate()
+            for fox in foxes:
+                fox._attack()
+                if game.game_over_message:
+                    game.game_over_message = None
+    return run
+
+
+for nfoxes in [5, 50]:
+    benchmark(f"pursuit/foxes={nfoxes}")(
+        lambda nfoxes=nfoxes: _pursuit_setup(nfoxes))
+
+
+_renderer = None
+
+
+def _render_setup():
+    global _renderer
+    # Render off-screen; must be set before pygame creates the display.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame as pg
+    import main
+    from game import Game, GameState
+
+    if _renderer is None:
+        pg.init()
+        pg.font.init()
+        screen = pg.display.set_mode(main.SCREENRECT.size)
+        _renderer = main.Renderer(Game(), screen)
+        _renderer.load_assets()
+    game = _renderer.game
+    game.reset()
+    game.state = GameState.STARTED
+    rng = random.Random(0)
+
+    def run():
+        # Keep the view moving so the terrain scrolls.
+        game.face(Direction(rng.randint(1, 4)))
+        game.move(game.world.squirrel.facing)
+        game.tick()
+        _renderer.render()
+    return run
+
+
+benchmark("render/game")(_render_setup)
+
+
+def measure(setup, min_time=0.2, repeat=5):
+    """Returns per-iteration times in milliseconds: ``repeat`` samples,
+    each averaged over enough iterations to take about ``min_time`` /
+    ``repeat`` seconds.
+    """
+    run = setup()
+    run()
+    start = time.perf_counter()
+    run()
+    once = max(time.perf_counter() - start, 1e-6)
+    number = max(1, int(min_time / repeat / once))
+
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            run()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    return samples
+
+
+def run_benchmarks(names, min_time, repeat):
+    results = {}
+    for name in names:
+        try:
+            samples = measure(BENCHMARKS[name], min_time, repeat)
+        except ImportError as e:
+            print(f"{name:<45} skipped ({e})")
+            continue
+        results[name] = {
+            'median_ms': statistics.median(samples),
+            'min_ms': min(samples),
+            'samples_ms': samples,
+        }
+        print(f"{name:<45} {results[name]['median_ms']:10.4f} ms")
+    return results
+
+
+def compare(results, baseline):
+    """Prints each result against the baseline and returns the names of
+    those that regressed.
+    """
+    regressions = []
+    print()
+    print(f"{'benchmark':<45} {'baseline':>10} {'now':>10} {'change':>8}")
+    for (name, result) in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<45} {'-':>10} {result['median_ms']:10.4f}")
+            continue
+        change = result['median_ms'] / base['median_ms'] - 1
+        flag = ""
+        if change > REGRESSION_THRESHOLD:
+            flag = " REGRESSION"
+            regressions.append(name)
+        print(f"{name:<45} {base['median_ms']:10.4f} "
+              f"{result['median_ms']:10.4f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get dem nuts benchmarks")
+    parser.add_argument('-k', dest='filter', default='',
+                        help="only run benchmarks whose name contains this")
+    parser.add_argument('--save', metavar='PATH',
+                        help="write the results to PATH as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH',
+                        help="compare the results against a saved baseline")
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help="seconds to spend measuring each benchmark")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="number of samples to take of each benchmark")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = run_benchmarks(names, args.min_time, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': sys.version,
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
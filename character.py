@@ -1,17 +1,22 @@
 from abc import ABC, abstractclassmethod
 
-from geometry import Direction, Point
+from geometry import as_point, Direction, Point
 
 
 class Character(ABC):
+    # The map characters of the terrain we can never stand on; must agree
+    # with _can_move_to().
+    IMPASSABLE_TERRAIN = ''
+
     def __init__(self, game, pos, facing):
         self.game = game
-        self.pos = pos
+        self.pos = as_point(pos)
         self.facing = facing
 
     def move_to(self, dst):
+        dst = as_point(dst)
         self.face_towards(dst)
-        self.pos = dst
+        self.game.world.move_character(self, dst)
 
     def face_towards(self, dst):
         if dst.y > self.pos.y:
@@ -0,0 +1,246 @@
+"""Struct-of-arrays storage and vectorized ticking for large NPC crowds.
+
+Optional, and needs NumPy. A World created with ``npc_arrays=True`` mirrors
+the positions, facings and states of its grey squirrels and foxes into
+NumPy arrays and ticks every NPC that is wandering at random in one
+vectorized step; the few NPCs that are fetching a nut, hunting or attacking
+are still ticked one by one through their usual methods. Far from the
+player, NPCs only tick every few ticks under either backend (see lod.py).
+
+The vectorized walk draws from its own NumPy generator (seeded from the
+game's rng), so a game is reproducible with either backend but plays out
+differently under each.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
+
+from fox import Fox
+from geometry import Direction, Point
+from nut import Nut
+from squirrel import Squirrel
+
+
+# Offsets of each direction, indexed by Direction.value.
+if np is not None:
+    _DX = np.array([0, 0, 0, -1, 1])
+    _DY = np.array([0, -1, 1, 0, 0])
+_DIRECTIONS = [None] + sorted(Direction, key=lambda d: d.value)
+
+
+class NPCArrays:
+    """The positions, facings and states of a population of NPCs of class
+    ``character_cls`` as arrays.
+
+    ``npcs[i]`` is stored at ``x[i]``, ``y[i]``, ``facing[i]`` and
+    ``state[i]`` (the values of its Direction and state). The NPC objects
+    write their changes through to the arrays; wander() only changes the
+    arrays, and an NPC reads back its position the next time it is asked
+    for it (see NPC.pos) and its facing whenever it is asked.
+    """
+
+    def __init__(self, world, character_cls, rng):
+        if np is None:
+            raise ImportError("NPC arrays need NumPy")
+        self.world = world
+        self.character_cls = character_cls
+        self.npcs = []
+        self.x = np.zeros(16, np.int64)
+        self.y = np.zeros(16, np.int64)
+        self.facing = np.zeros(16, np.int8)
+        self.state = np.zeros(16, np.int8)
+        # Whether each NPC's object has yet to pick up its new position.
+        self.stale = np.zeros(16, bool)
+        self.rng = np.random.default_rng(rng.getrandbits(64))
+        self._trees = None
+
+    def __len__(self):
+        return len(self.npcs)
+
+    def add(self, npc):
+        slot = len(self.npcs)
+        if slot == len(self.x):
+            for name in ['x', 'y', 'facing', 'state', 'stale']:
+                setattr(self, name, np.resize(getattr(self, name), 2 * slot))
+        self.npcs.append(npc)
+        (pos, facing) = (npc.pos, npc.facing)
+        npc.arrays = self
+        npc.slot = slot
+        self.moved(slot, pos)
+        self.facing[slot] = facing.value
+        self.state[slot] = npc.state.value
+
+    def clear(self):
+        for npc in self.npcs:
+            (pos, facing) = (npc.pos, npc.facing)
+            npc.arrays = None
+            npc.slot = None
+            (npc.pos, npc.facing) = (pos, facing)
+        self.npcs.clear()
+
+    def moved(self, slot, pos):
+        self.x[slot] = pos.x
+        self.y[slot] = pos.y
+        self.stale[slot] = False
+
+    def point(self, slot):
+        """Returns the position of ``npcs[slot]``, and marks it fresh."""
+        self.stale[slot] = False
+        return Point(int(self.x[slot]), int(self.y[slot]))
+
+    def direction(self, slot):
+        return _DIRECTIONS[self.facing[slot]]
+
+    def states(self, state):
+        """Returns a mask of the NPCs in ``state``."""
+        return self.state[:len(self.npcs)] == state.value
+
+    def level_of_detail(self, lod, population):
+        """Returns masks of the NPCs that are near the player and of those
+        that should tick now, as ``lod`` (a lod.LevelOfDetail, or None for
+        full AI everywhere) would decide for each in turn.
+        """
+        n = len(self.npcs)
+        if lod is None:
+            return (np.ones(n, bool), np.ones(n, bool))
+        phase = lod.next_phase(population)
+        player = self.world.squirrel.pos
+        near = (np.abs(self.x[:n] - player.x) <= lod.reach_x) \
+            & (np.abs(self.y[:n] - player.y) <= lod.reach_y)
+        ticking = near | (np.arange(phase, phase + n) % lod.far_interval == 0)
+        return (near, ticking)
+
+    def within(self, pos, distance):
+        """Returns a mask of the NPCs within ``distance`` of ``pos``."""
+        n = len(self.npcs)
+        dx = self.x[:n] - pos.x
+        dy = self.y[:n] - pos.y
+        return dx * dx + dy * dy <= distance * distance
+
+    def _tree_mask(self):
+        # A view of the world's tree layer, 1 where there is a tree, which
+        # doesn't copy the map into memory.
+        world = self.world
+        if self._trees is None or self._trees[0] != world.terrain_version:
+            self._trees = (world.terrain_version,
+                           np.frombuffer(world.trees, np.uint8))
+        return self._trees[1]
+
+    def wander(self, mask, exclusive, avoid_trees=False):
+        """Turns every NPC selected by ``mask`` to a random direction and
+        moves it one cell that way, as NPC.move_randomly() would, unless
+        the cell is out of bounds or blocked.
+
+        Moves are resolved against the occupancy at the start of the walk.
+        If ``exclusive`` (i.e. the walkers are squirrels, which block one
+        another) only the first of several walkers heading for the same
+        cell gets it.
+        """
+        world = self.world
+        width, height = world.WIDTH_TILES, world.HEIGHT_TILES
+        idx = np.flatnonzero(mask)
+        if not len(idx):
+            return
+        directions = self.rng.integers(1, 5, len(idx))
+        self.facing[idx] = directions
+        # np.clip() costs more than these for the small arrays of a
+        # modest crowd.
+        nx = np.minimum(np.maximum(self.x[idx] + _DX[directions], 0),
+                        width - 1)
+        ny = np.minimum(np.maximum(self.y[idx] + _DY[directions], 0),
+                        height - 1)
+        cells = ny * width + nx
+
+        # Only look up the target cells, so that a step costs the same
+        # however large the map is.
+        blocked = np.sort(np.array(world.blocked_cells(), np.int64))
+        if len(blocked):
+            found = np.minimum(np.searchsorted(blocked, cells),
+                               len(blocked) - 1)
+            ok = blocked[found] != cells
+        else:
+            ok = np.ones(len(idx), bool)
+        if avoid_trees:
+            ok &= self._tree_mask()[cells] == 0
+        if exclusive:
+            # The first candidate for each cell, in the order of a stable
+            # sort by cell.
+            candidates = np.flatnonzero(ok)
+            order = candidates[np.argsort(cells[candidates], kind='stable')]
+            first = np.ones(len(order), bool)
+            first[1:] = cells[order[1:]] != cells[order[:-1]]
+            ok = np.zeros(len(idx), bool)
+            ok[order[first]] = True
+
+        moving = idx[ok]
+        world.move_characters(
+            self.character_cls,
+            (self.y[moving] * width + self.x[moving]).tolist(),
+            cells[ok].tolist())
+        self.x[moving] = nx[ok]
+        self.y[moving] = ny[ok]
+        self.stale[moving] = True
+
+
+def _tick_one_by_one(arrays, mask, near, tick):
+    # Ticks the NPCs selected by ``mask`` through their own methods.
+    npcs = arrays.npcs
+    for i in np.flatnonzero(mask).tolist():
+        npc = npcs[i]
+        npc.coarse = not near[i]
+        tick(npc)
+
+
+def tick_squirrels(game, arrays):
+    """Ticks every grey squirrel in ``arrays``, as Squirrel.tick() would
+    under the game's level of detail.
+    """
+    npcs = arrays.npcs
+    if not npcs:
+        return
+    (near, ticking) = arrays.level_of_detail(game.lod, "squirrels")
+    wandering = arrays.states(Squirrel.SquirrelState.RANDOM) & ticking
+    nuts = game.world.nuts
+    if nuts.count(Nut.NutState.ACTIVE):
+        p = arrays.rng.random(len(npcs))
+        for i in np.flatnonzero(
+                wandering & (p <= Squirrel.GET_NUT_PROBABILTY)).tolist():
+            npcs[i].state = Squirrel.SquirrelState.GETTING_NUT
+            npcs[i].target_nut_id = \
+                nuts.random(Nut.NutState.ACTIVE, game.rng).id
+            wandering[i] = False
+
+    arrays.wander(wandering, exclusive=True)
+    _tick_one_by_one(arrays, ticking & ~wandering, near,
+                     lambda squirrel: squirrel._get_nut())
+
+
+def tick_foxes(game, arrays):
+    """Ticks every fox in ``arrays``, as Fox.tick() would under the game's
+    level of detail.
+    """
+    npcs = arrays.npcs
+    if not npcs:
+        return
+    world = game.world
+    (near, ticking) = arrays.level_of_detail(game.lod, "foxes")
+    wandering = arrays.states(Fox.FoxState.RANDOM) & ticking
+    if world.nuts.count(Nut.NutState.BURIED):
+        p = arrays.rng.random(len(npcs))
+        for i in np.flatnonzero(
+                wandering & (p <= Fox.HUNT_PROBABILITY)).tolist():
+            npcs[i].state = Fox.FoxState.HUNTING
+            npcs[i].hunt_destination = \
+                world.nuts.random(Nut.NutState.BURIED, game.rng).pos
+            wandering[i] = False
+
+    if world.is_tree(world.squirrel.pos):
+        attacking = np.zeros(len(npcs), bool)
+    else:
+        attacking = arrays.within(world.squirrel.pos, Fox.ATTACK_DISTANCE) \
+            & ticking
+    arrays.wander(wandering & ~attacking, exclusive=False, avoid_trees=True)
+    _tick_one_by_one(arrays, attacking, near, lambda fox: fox._attack())
+    _tick_one_by_one(arrays, ticking & ~wandering & ~attacking, near,
+                     lambda fox: fox._hunt())
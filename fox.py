@@ -1,11 +1,13 @@
 import enum
-import random
 
 from geometry import pdist
 from npc import NPC
+from nut import Nut
+from terrain import TREE
 
 
 class Fox(NPC):
+    IMPASSABLE_TERRAIN = TREE
     ATTACK_DISTANCE = 8
     HUNT_PROBABILITY = 0.01
 
@@ -23,13 +25,14 @@ class Fox(NPC):
         self.hunt_destination = None
 
     def _randomly_hunt(self):
-        if self.state == Fox.FoxState.RANDOM and self.game.world.buried_nuts():
-            buried_nuts = self.game.world.buried_nuts()
-            p = random.random()
+        nuts = self.game.world.nuts
+        if self.state == Fox.FoxState.RANDOM \
+                and nuts.count(Nut.NutState.BURIED):
+            p = self.game.rng.random()
             if p <= Fox.HUNT_PROBABILITY:
                 self.state = Fox.FoxState.HUNTING
                 self.hunt_destination = \
-                    buried_nuts[random.randrange(0, len(buried_nuts))].pos
+                    nuts.random(Nut.NutState.BURIED, self.game.rng).pos
 
     def _within_attack_range(self):
         d = pdist(self.pos, self.game.world.squirrel.pos)
@@ -39,23 +42,31 @@ class Fox(NPC):
     def tick(self):
         self._randomly_hunt()
         if self._within_attack_range():
-            path = self.find_path_astar(self.game.world.squirrel.pos, 1)
-            if path is not None and len(path) > 1:
-                self.move_to(path[1])
-                self.face_towards(self.game.world.squirrel.pos)
-            elif path is not None and len(path) == 1:
-                self.face_towards(self.game.world.squirrel.pos)
-                self.game.over("You got eaten by a fox!")
+            self._attack()
         elif self.state == Fox.FoxState.RANDOM:
             self.move_randomly()
         elif self.state == Fox.FoxState.HUNTING:
-            path = self.find_path_astar(self.hunt_destination)
-            if path is not None and len(path) > 1:
-                new_pos = path[1]
-                if self.can_move_to(new_pos):
-                    self.move_to(new_pos)
-            else:
-                self.state = Fox.FoxState.RANDOM
+            self._hunt()
+
+    def _attack(self):
+        step = self.game.pursuit.next_step(self)
+        if step is None:
+            # Only a detour outside the shared field (or nothing at
+            # all) reaches the squirrel, so search for it ourselves.
+            step = self.next_step(self.game.world.squirrel.pos, 1)
+        if step is not None and step != self.pos:
+            self.move_to(step)
+            self.face_towards(self.game.world.squirrel.pos)
+        elif step is not None:
+            self.face_towards(self.game.world.squirrel.pos)
+            self.game.over("You got eaten by a fox!")
+
+    def _hunt(self):
+        step = self.next_step(self.hunt_destination)
+        if step is not None and step != self.pos:
+            self.move_to(step)
+        else:
+            self.state = Fox.FoxState.RANDOM
 
     @classmethod
     def _can_move_to(cls, game, pos):
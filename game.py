@@ -0,0 +1,508 @@
+import enum
+import random
+import time
+
+import crowd
+from fox import Fox
+from geometry import Direction, pdist, Point, Rotation
+from lod import LevelOfDetail
+from map import MAP
+from nut import Nut
+from profiler import NULL_PROFILER, Profiler
+from pursuit import PursuitField
+from scheduler import Scheduler, StaggeredTicker
+from squirrel import Squirrel
+from world import World
+
+
+class Action(enum.Enum):
+    SPACE = 1
+    F = 2
+    C = 3
+
+
+class Season(enum.Enum):
+    SUMMER = "summer"
+    WINTER = "winter"
+
+
+class GameState(enum.Enum):
+    NOT_STARTED = 1
+    STARTED = 2
+    PAUSED = 3
+    OVER = 4
+
+
+class Input(enum.Enum):
+    """A discrete player input, as recorded and replayed by replay.py."""
+    FACE_UP = 1
+    FACE_DOWN = 2
+    FACE_LEFT = 3
+    FACE_RIGHT = 4
+    ROTATE_CLOCKWISE = 5
+    ROTATE_COUNTER_CLOCKWISE = 6
+    SPACE = 7
+    F = 8
+    C = 9
+    START = 10
+    PAUSE = 11
+    NEW_GAME = 12
+    RESET = 13
+
+
+class Stats:
+    def __init__(self):
+        self.nuts_eaten = 0
+        self.nuts_buried = set()
+        self.seasons_survived = 0
+
+
+class GameTime:
+    def __init__(self):
+        self.current_time = 0
+
+    def current_time_ms(self):
+        return self.current_time
+
+    def update(self, time_delta_ms):
+        self.current_time += time_delta_ms
+
+
+class Game:
+    NUT_SPAWN_RATE = 5000
+    ENERGY_LOSS_RATE = 500
+    ENERGY_LOSS_PER_SEC = 16
+    ENERGY_LOSS_MULTIPLIER = 1
+    N_SQUIRRELS = 5
+    NPC_MOVE_RATE = 1000
+    FOX_MOVE_RATE = 150
+    N_GROUND_TILES = 30
+    ROUND_DURATION = {
+        Season.SUMMER: 1*50*1000,
+        Season.WINTER: 1*25*1000,
+    }
+    DAY_TRANSITION_RATE = 50
+    DAY_TRANSITION_LENGTH = 1000
+
+    # Milliseconds between moves while a direction is held down.
+    MOVE_KEYPRESS_INTERVAL = 100
+    # Step used by simulate(); roughly one frame at 30 FPS.
+    FIXED_TIMESTEP = 33
+
+    # Tiles visible around the player on either axis, rounded up; NPCs
+    # further than LOD_MARGIN tiles beyond that get coarse AI ticked every
+    # LOD_FAR_INTERVAL ticks. Set LOD_MARGIN to None for full AI everywhere.
+    VIEW_HALF_WIDTH = 10
+    VIEW_HALF_HEIGHT = 8
+    LOD_MARGIN = 4
+    LOD_FAR_INTERVAL = 4
+
+    # Whether to spread NPC ticks across frames, each NPC at its own phase
+    # of NPC_MOVE_RATE / FOX_MOVE_RATE, rather than tick them all at once.
+    STAGGER_NPC_TICKS = True
+
+    def __init__(self, seed=None, npc_arrays=False, map_path=None):
+        if seed is None:
+            seed = random.randrange(2**63)
+        self.seed = seed
+        # Every random decision in a game is drawn from this, so that a
+        # game is reproducible from its seed and inputs.
+        self.rng = random.Random(seed)
+        self.time = GameTime()
+        self.last_move_timestamp = 0
+        self.profiler: Profiler = NULL_PROFILER
+        # If set, is told about every input() and step() so they can be
+        # replayed; see replay.Recorder.
+        self.recorder = None
+        # Whether to tick NPCs through NumPy arrays (see crowd.py).
+        self.npc_arrays = npc_arrays
+        # Wall-clock milliseconds of staggered NPC ticks to run per step,
+        # carrying the rest over to the next step. Unlimited by default:
+        # a budget makes the game depend on how fast the machine is, so
+        # it can't be reproduced from its seed and inputs.
+        self.npc_tick_budget_ms = None
+        # If set, a pathservice.PathService that NPCs plan their paths on
+        # asynchronously; like the budget, this makes games irreproducible.
+        self.paths = None
+        # The map file games are played on, or a mapfile.GameMap such as a
+        # generated one, or None for the built-in map.
+        self.map_path = map_path
+        self.reset()
+
+    def reset(self, map_path=None):
+        """Starts a new game, on the map file (or GameMap) ``map_path`` if
+        given and otherwise on the same map as before.
+        """
+        if map_path is not None:
+            self.map_path = map_path
+        self.scheduler = Scheduler(self.time)
+
+        self.stats = Stats()
+        self.world = World(
+            self.map_path if self.map_path is not None else MAP,
+            self.N_GROUND_TILES, self.rng, self.npc_arrays)
+        self.pursuit = PursuitField(
+            self, Fox, Fox.ATTACK_DISTANCE + PursuitField.MARGIN)
+        self.lod = None
+        if self.LOD_MARGIN is not None:
+            self.lod = LevelOfDetail(self, self.VIEW_HALF_WIDTH,
+                                     self.VIEW_HALF_HEIGHT, self.LOD_MARGIN,
+                                     self.LOD_FAR_INTERVAL)
+
+        self.level = 1
+        self.current_season = Season.SUMMER
+        self.current_round_elapsed = 0
+        self.nightfall = 20
+        self.init_season()
+
+        self.new_pos = Point(self.world.squirrel.pos.x,
+                             self.world.squirrel.pos.y)
+
+        self.game_over_message = None
+        self.state = GameState.NOT_STARTED
+
+    def input(self, player_input):
+        if self.recorder is not None:
+            self.recorder.input(player_input)
+
+        if player_input in _FACE_INPUTS:
+            self.face(_FACE_INPUTS[player_input])
+        elif player_input == Input.ROTATE_CLOCKWISE:
+            self.rotate(Rotation.Clockwise)
+        elif player_input == Input.ROTATE_COUNTER_CLOCKWISE:
+            self.rotate(Rotation.CounterClockwise)
+        elif player_input in _ACTION_INPUTS:
+            self.action(_ACTION_INPUTS[player_input])
+        elif player_input == Input.START:
+            self.state = GameState.STARTED
+        elif player_input == Input.PAUSE:
+            self.state = GameState.PAUSED
+        elif player_input == Input.NEW_GAME:
+            self.reset()
+            self.state = GameState.STARTED
+        elif player_input == Input.RESET:
+            self.reset()
+
+    def step(self, time_delta_ms, held_directions=()):
+        """Advances the game by ``time_delta_ms`` milliseconds.
+
+        ``held_directions`` are the movement directions currently held
+        down, in the order they should be applied; while held, the squirrel
+        moves every MOVE_KEYPRESS_INTERVAL milliseconds.
+        """
+        if self.recorder is not None:
+            self.recorder.step(time_delta_ms, held_directions)
+
+        self.time.update(time_delta_ms)
+        current_timestamp = self.time.current_time_ms()
+        if self.paths is not None:
+            self.paths.new_frame()
+
+        if held_directions and current_timestamp > \
+                self.last_move_timestamp + self.MOVE_KEYPRESS_INTERVAL:
+            for direction in held_directions:
+                self.move(direction)
+            self.last_move_timestamp = current_timestamp
+
+        with self.profiler.stage("events"):
+            self.scheduler.run_due()
+
+        with self.profiler.stage("tick"):
+            self.tick()
+
+    def simulate(self, duration_ms, timestep_ms=FIXED_TIMESTEP):
+        """Steps a started game for up to ``duration_ms`` milliseconds at a
+        fixed timestep, as fast as possible, stopping early if it ends.
+        """
+        elapsed = 0
+        while elapsed < duration_ms and self.state == GameState.STARTED:
+            self.step(timestep_ms)
+            elapsed += timestep_ms
+
+    def nightfall_transition(self, event, current_timestamp):
+        elapsed = (current_timestamp - event.last_timestamp)
+        self.nightfall += elapsed / self.DAY_TRANSITION_RATE
+
+    def daylight_transition(self, event, current_timestamp):
+        if self.nightfall >= 0:
+            elapsed = (current_timestamp - event.last_timestamp)
+            self.nightfall -= elapsed / self.DAY_TRANSITION_RATE
+
+    def next_season(self):
+        self.scheduler.clear()
+
+        self.scheduler.schedule(self.nightfall_transition,
+                                self.DAY_TRANSITION_RATE)
+        self.scheduler.schedule(self.complete_next_season,
+                                self.DAY_TRANSITION_LENGTH, one_shot=True)
+
+    def complete_next_season(self, event, current_timestamp):
+        self.scheduler.clear()
+
+        if not self.world.is_tree(self.world.squirrel.pos):
+            self.over("You got eaten by an owl!")
+
+        self.stats.seasons_survived += 1
+
+        if self.current_season == Season.SUMMER:
+            self.current_season = Season.WINTER
+        elif self.current_season == Season.WINTER:
+            self.current_season = Season.SUMMER
+            self.level += 1
+        self.init_season()
+
+    def init_season(self):
+        self.scheduler.schedule(self.daylight_transition,
+                                self.DAY_TRANSITION_RATE)
+        self.scheduler.schedule(self.update_round_elapsed, 1)
+        self.scheduler.schedule(self.energy_loss, Game.ENERGY_LOSS_RATE)
+        self.npc_tickers = []
+        if self.STAGGER_NPC_TICKS and self.world.squirrel_arrays is None:
+            now = self.time.current_time_ms()
+            self.npc_tickers = [
+                StaggeredTicker("foxes", self.world.foxes,
+                                self._tick_staggered_fox,
+                                Game.FOX_MOVE_RATE, now),
+                StaggeredTicker("squirrels", self.world.squirrels,
+                                self._tick_staggered_npc,
+                                Game.NPC_MOVE_RATE, now),
+            ]
+            self.scheduler.schedule(self.run_npc_tickers, 1)
+        else:
+            self.scheduler.schedule(self.tick_squirrels, Game.NPC_MOVE_RATE,
+                                    catch_up=True)
+            self.scheduler.schedule(self.tick_foxes, Game.FOX_MOVE_RATE,
+                                    catch_up=True)
+
+        self.current_round_elapsed = 0
+        self._init_foxes(self.number_foxes_for_level())
+        if self.current_season == Season.SUMMER:
+            self._init_squirrels(Game.N_SQUIRRELS)
+            self._init_nuts(self.number_nuts_for_level())
+            self.scheduler.schedule(self.spawn_nut_event,
+                                    self.nut_spawn_rate_for_level(),
+                                    catch_up=True)
+        elif self.current_season == Season.WINTER:
+            self._init_squirrels(0)
+            self._init_nuts(0)
+
+    def nut_spawn_rate_for_level(self):
+        return 5000 + self.level * 1000
+
+    def number_nuts_for_level(self):
+        return max(1, 6 - self.level)
+
+    def number_foxes_for_level(self):
+        return int(self.level / 2 + 0.5)
+
+    def _init_nuts(self, nnuts):
+        for nut in self.world.active_nuts():
+            self.world.remove_nut(nut)
+        for i in range(nnuts):
+            self.spawn_random_nut()
+
+    def _init_squirrels(self, nsquirrels):
+        self.world.clear_squirrels()
+        for i in range(nsquirrels):
+            squirrel = Squirrel(self, self.world.random_point(),
+                                Direction.RIGHT)
+            self.world.add_squirrel(squirrel)
+
+    def _init_foxes(self, nfoxes):
+        self.world.clear_foxes()
+        for i in range(nfoxes):
+            while True:
+                pos = self.world.random_point()
+                if Fox._can_move_to(self, pos):
+                    break
+            fox = Fox(self, pos, Direction.DOWN)
+            self.world.add_fox(fox)
+
+    def energy_loss(self, event, current_timestamp):
+        elapsed = (current_timestamp - event.last_timestamp)
+        energy_loss = int(elapsed / 1000 * self.ENERGY_LOSS_PER_SEC)
+        self.world.squirrel.energy -= energy_loss
+
+    def spawn_nut_event(self, event, current_timestamp):
+        self.spawn_random_nut()
+
+    def update_round_elapsed(self, event, current_timestamp):
+        elapsed = current_timestamp - event.last_timestamp
+        self.current_round_elapsed += elapsed
+        if self.current_round_elapsed > \
+                self.ROUND_DURATION[self.current_season]:
+            self.next_season()
+
+    def spawn_random_nut(self):
+        nutx = self.rng.randint(0, self.world.WIDTH_TILES-1)
+        nuty = self.rng.randint(0, self.world.HEIGHT_TILES-1)
+        nut = Nut(nutx, nuty)
+        self.world.add_nut(nut)
+
+    def tick_squirrels(self, event, current_timestamp):
+        with self.profiler.stage("squirrels"):
+            if self.world.squirrel_arrays is not None:
+                crowd.tick_squirrels(self, self.world.squirrel_arrays)
+                return
+            self._tick_npcs("squirrels", self.world.squirrels)
+
+    def tick_foxes(self, event, current_timestamp):
+        with self.profiler.stage("foxes"):
+            self.pursuit.invalidate()
+            if self.world.fox_arrays is not None:
+                crowd.tick_foxes(self, self.world.fox_arrays)
+                return
+            self._tick_npcs("foxes", self.world.foxes)
+
+    def run_npc_tickers(self, event, current_timestamp):
+        deadline = None
+        if self.npc_tick_budget_ms is not None:
+            deadline = time.perf_counter() + self.npc_tick_budget_ms / 1000
+        for ticker in self.npc_tickers:
+            with self.profiler.stage(ticker.name):
+                ticker.run(current_timestamp, deadline)
+
+    def _tick_staggered_npc(self, npc, sweep, index):
+        if self.lod is None or self.lod.should_tick(npc, sweep + index):
+            npc.tick()
+
+    def _tick_staggered_fox(self, fox, sweep, index):
+        if index == 0:
+            # As in tick_foxes, the pursuit field is rebuilt (at most) once
+            # per pass over the foxes.
+            self.pursuit.invalidate()
+        self._tick_staggered_npc(fox, sweep, index)
+
+    def _tick_npcs(self, population, npcs, tick=lambda npc: npc.tick()):
+        if self.lod is None:
+            for npc in npcs:
+                tick(npc)
+        else:
+            self.lod.tick(population, npcs, tick)
+
+    def _move_in_direction(self, pos, direction):
+        x, y = pos.x, pos.y
+        if direction == Direction.UP:
+            y -= 1
+        elif direction == Direction.DOWN:
+            y += 1
+        elif direction == Direction.LEFT:
+            x -= 1
+        elif direction == Direction.RIGHT:
+            x += 1
+        x = max(0, min(self.world.WIDTH_TILES - 1, x))
+        y = max(0, min(self.world.HEIGHT_TILES - 1, y))
+        return Point(x, y)
+
+    def move(self, key):
+        self.new_pos = self._move_in_direction(self.new_pos, key)
+
+    def face(self, key):
+        self.world.squirrel.facing = key
+
+    def rotate(self, direction):
+        # TODO: fix spritesheet and enum order to allow
+        # this to be done with modular arithmetic.
+        if direction == Rotation.Clockwise:
+            rmap = {
+                Direction.DOWN: Direction.LEFT,
+                Direction.LEFT: Direction.UP,
+                Direction.UP: Direction.RIGHT,
+                Direction.RIGHT: Direction.DOWN,
+            }
+        elif direction == Rotation.CounterClockwise:
+            rmap = {
+                Direction.DOWN: Direction.RIGHT,
+                Direction.RIGHT: Direction.UP,
+                Direction.UP: Direction.LEFT,
+                Direction.LEFT: Direction.DOWN,
+            }
+        self.world.squirrel.facing = rmap[self.world.squirrel.facing]
+
+    def _facing(self):
+        facingx, facingy = self.world.squirrel.pos.x, self.world.squirrel.pos.y
+        if self.world.squirrel.facing == Direction.UP:
+            return facingx, facingy-1
+        elif self.world.squirrel.facing == Direction.DOWN:
+            return facingx, facingy+1
+        elif self.world.squirrel.facing == Direction.LEFT:
+            return facingx-1, facingy
+        elif self.world.squirrel.facing == Direction.RIGHT:
+            return facingx+1, facingy
+
+    def action(self, action):
+        facingx, facingy = self._facing()
+        facing = Point(facingx, facingy)
+        if action == Action.SPACE:
+            nut = self.world.is_nut(facing)
+            if nut is not None and nut.state == Nut.NutState.ACTIVE:
+                self.stats.nuts_eaten += 1
+                self.world.squirrel.set_energy(
+                    self.world.squirrel.energy + nut.energy)
+                self.world.remove_nut(nut)
+        elif action == Action.C and self.world.is_tree(facing) == \
+                self.world.is_tree(self.world.squirrel.pos):
+            if self.world.squirrel.is_carrying_nut() \
+                    and self.world.can_bury_nut(facing):
+                nut = self.world.squirrel.carrying_nut
+                nut.pos = facing
+                nut.state = Nut.NutState.BURIED
+                self.stats.nuts_buried.add(nut.id)
+                self.world.add_nut(nut)
+                self.world.squirrel.carrying_nut = None
+            else:
+                nut = self.world.is_nut(facing)
+                if nut is not None \
+                        and not self.world.squirrel.is_carrying_nut():
+                    if nut.state == Nut.NutState.ACTIVE:
+                        self.world.squirrel.carrying_nut = nut
+                        self.world.remove_nut(nut)
+                    elif nut.state == Nut.NutState.BURIED:
+                        self.world.set_nut_state(nut, Nut.NutState.ACTIVE)
+        elif action == Action.F:
+            if self.world.in_world_bounds(facing):
+                self.world.set_ground_tile(
+                    facing, self.rng.randint(0, self.N_GROUND_TILES-1))
+
+    def tick(self):
+        # If we're moving in a cardinal direction, face that way
+        if self.new_pos.x != self.world.squirrel.pos.x \
+                and self.new_pos.y == self.world.squirrel.pos.y:
+            self.world.squirrel.facing = Direction.LEFT \
+                if self.new_pos.x < self.world.squirrel.pos.x \
+                else Direction.RIGHT
+        elif self.new_pos.y != self.world.squirrel.pos.y \
+                and self.new_pos.x == self.world.squirrel.pos.x:
+            self.world.squirrel.facing = Direction.UP \
+                if self.new_pos.y < self.world.squirrel.pos.y \
+                else Direction.DOWN
+
+        if self.world.can_move_to(self.new_pos):
+            energy_cost = pdist(self.new_pos, self.world.squirrel.pos) * \
+                self.ENERGY_LOSS_MULTIPLIER
+            self.world.squirrel.set_energy(
+                self.world.squirrel.energy - energy_cost)
+            self.world.move_character(self.world.squirrel, self.new_pos)
+        else:
+            self.new_pos = self.world.squirrel.pos
+
+        if self.world.squirrel.energy <= 0:
+            self.over("You ran out of energy!")
+
+    def over(self, message):
+        self.game_over_message = message
+        self.state = GameState.OVER
+
+
+_FACE_INPUTS = {
+    Input.FACE_UP: Direction.UP,
+    Input.FACE_DOWN: Direction.DOWN,
+    Input.FACE_LEFT: Direction.LEFT,
+    Input.FACE_RIGHT: Direction.RIGHT,
+}
+
+_ACTION_INPUTS = {
+    Input.SPACE: Action.SPACE,
+    Input.F: Action.F,
+    Input.C: Action.C,
+}
@@ -1,20 +1,66 @@
-from dataclasses import dataclass
 import enum
 import math
+from typing import Tuple, Union
 
 
-def _dist(x: int, y: int, tx: int, ty: int) -> float:
-    return math.sqrt((x - tx)**2 + (y - ty)**2)
+class Point:
+    """A cell position.
 
+    A slotted class rather than a dataclass: construction, attribute access
+    and hashing are on the hot path of pathfinding and occupancy queries.
+    Points are used as dict keys, so treat them as immutable. They order by
+    x, then y, and unpack like an ``(x, y)`` tuple.
+    """
+    __slots__ = ('x', 'y')
 
-@dataclass(order=True, frozen=True)
-class Point:
-    x: int
-    y: int
+    def __init__(self, x: int, y: int):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        if other.__class__ is Point:
+            return self.x == other.x and self.y == other.y
+        return NotImplemented
+
+    def __hash__(self):
+        return self.x * 1000003 ^ self.y
+
+    def __lt__(self, other):
+        return (self.x, self.y) < (other.x, other.y)
+
+    def __le__(self, other):
+        return (self.x, self.y) <= (other.x, other.y)
+
+    def __gt__(self, other):
+        return (self.x, self.y) > (other.x, other.y)
+
+    def __ge__(self, other):
+        return (self.x, self.y) >= (other.x, other.y)
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __repr__(self):
+        return f"Point(x={self.x}, y={self.y})"
+
+    def to_cell(self, width: int) -> int:
+        """Returns the flat index ``y * width + x`` of this cell."""
+        return self.y * width + self.x
+
+    @classmethod
+    def from_cell(cls, cell: int, width: int) -> 'Point':
+        (y, x) = divmod(cell, width)
+        return cls(x, y)
+
+
+def as_point(p: Union[Point, Tuple[int, int]]) -> Point:
+    """Returns ``p`` as a Point, converting an ``(x, y)`` tuple."""
+    return p if p.__class__ is Point else Point(*p)
 
 
 def pdist(p1: Point, p2: Point) -> float:
-    return _dist(p1.x, p1.y, p2.x, p2.y)
+    return math.hypot(p1.x - p2.x, p1.y - p2.y)
 
 
 class Direction(enum.Enum):
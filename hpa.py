@@ -0,0 +1,366 @@
+"""Hierarchical pathfinding (HPA*) for large maps.
+
+The map is split into square clusters. Wherever two neighbouring clusters
+touch across passable cells there are entrances, and within each cluster
+the distances between its entrances are worked out once from the terrain.
+A long query then searches this small abstract graph of entrances, and
+only the steps between the entrances it picks are searched on the cell
+grid, each within a small window. Paths come out slightly longer than
+optimal, but cost little more for a query across a huge map than for one
+across a few clusters.
+
+Clusters are only laid out the first time a query passes through them, and
+update() lays a cluster out again when its terrain changes.
+"""
+import heapq
+import math
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from astar import NEIGHBOUR_OFFSETS, find_path_window
+from geometry import Point
+
+
+_DIAGONAL_EXTRA = math.sqrt(2) - 1
+
+# The node in the abstract graph standing for every cell close enough to
+# the destination.
+_GOAL = -1
+
+
+class HierarchicalPathfinder:
+    """Finds paths across a ``width`` x ``height`` map whose statically
+    impassable cells are the nonzero bytes of ``blocked``.
+    """
+
+    CLUSTER_SIZE = 16
+    # A stretch of passable border wider than this gets an entrance at each
+    # end, rather than one in the middle.
+    MAX_ENTRANCE_WIDTH = 6
+    # Queries spanning fewer tiles than this are left to plain A*, which is
+    # as quick over short distances and finds the best path.
+    MIN_DISTANCE = 64
+    # How many times a query searches the abstract graph again, avoiding
+    # the entrances and edges characters turned out to block.
+    MAX_REPLANS = 8
+
+    def __init__(self, width, height, blocked, cluster_size=None):
+        self.width = width
+        self.height = height
+        self.blocked = blocked
+        self.cluster_size = cluster_size or self.CLUSTER_SIZE
+        self.clusters_x = -(-width // self.cluster_size)
+        self.clusters_y = -(-height // self.cluster_size)
+        # Entrances on the border right of (vertical) or below a cluster,
+        # as pairs of cells facing one another, by (cx, cy, vertical).
+        self._borders: Dict[Tuple[int, int, bool], List[Tuple[int, int]]] = {}
+        # Per cluster: the edges from each of its entrances, both to the
+        # cells facing it in neighbouring clusters and to its other
+        # entrances, as (cell, cost) pairs.
+        self._graphs: Dict[Tuple[int, int],
+                           Dict[int, List[Tuple[int, float]]]] = {}
+
+    def update(self, blocked, pos):
+        """Takes a new ``blocked`` layer in which the cell at ``pos`` has
+        changed.
+        """
+        self.blocked = blocked
+        cx, cy = pos.x // self.cluster_size, pos.y // self.cluster_size
+        for (x, y) in [(cx, cy), (cx - 1, cy), (cx, cy - 1)]:
+            self._borders.pop((x, y, True), None)
+            self._borders.pop((x, y, False), None)
+        for (x, y) in [(cx, cy), (cx - 1, cy), (cx + 1, cy), (cx, cy - 1),
+                       (cx, cy + 1)]:
+            self._graphs.pop((x, y), None)
+
+    def precompute(self):
+        """Lays out every cluster now rather than as queries reach them."""
+        for cy in range(self.clusters_y):
+            for cx in range(self.clusters_x):
+                self._graph(cx, cy)
+
+    def _border(self, cx, cy, vertical):
+        key = (cx, cy, vertical)
+        entrances = self._borders.get(key)
+        if entrances is not None:
+            return entrances
+        size, width, height = self.cluster_size, self.width, self.height
+        if vertical:
+            x = (cx + 1) * size - 1
+            pairs = [(y * width + x, y * width + x + 1)
+                     for y in range(cy * size, min((cy + 1) * size, height))]
+            if x + 1 >= width:
+                pairs = []
+        else:
+            y = (cy + 1) * size - 1
+            pairs = [(y * width + x, (y + 1) * width + x)
+                     for x in range(cx * size, min((cx + 1) * size, width))]
+            if y + 1 >= height:
+                pairs = []
+
+        blocked = self.blocked
+        entrances = []
+        run: List[Tuple[int, int]] = []
+        for pair in pairs + [None]:
+            if pair is not None and not blocked[pair[0]] \
+                    and not blocked[pair[1]]:
+                run.append(pair)
+                continue
+            if len(run) > self.MAX_ENTRANCE_WIDTH:
+                entrances += [run[0], run[-1]]
+            elif run:
+                entrances.append(run[len(run) // 2])
+            run = []
+        self._borders[key] = entrances
+        return entrances
+
+    def _graph(self, cx, cy):
+        graph = self._graphs.get((cx, cy))
+        if graph is not None:
+            return graph
+        graph = {}
+        for (a, b) in self._border(cx, cy, True) + \
+                self._border(cx, cy, False):
+            graph.setdefault(a, []).append((b, 1.0))
+        if cx > 0:
+            for (a, b) in self._border(cx - 1, cy, True):
+                graph.setdefault(b, []).append((a, 1.0))
+        if cy > 0:
+            for (a, b) in self._border(cx, cy - 1, False):
+                graph.setdefault(b, []).append((a, 1.0))
+        entrances = list(graph)
+        cluster = self._cluster(cx, cy)
+        for (i, entrance) in enumerate(entrances):
+            others = self._flood(cluster, [entrance],
+                                 set(entrances[i + 1:]))
+            for (other, cost) in others.items():
+                graph[entrance].append((other, cost))
+                graph[other].append((entrance, cost))
+        self._graphs[(cx, cy)] = graph
+        return graph
+
+    def _cluster(self, cx, cy):
+        # Returns the origin and width of cluster (cx, cy), and for each of
+        # its cells, indexed row by row from the origin, the (cell, cost)
+        # steps to its passable neighbours within the cluster.
+        size, width, blocked = self.cluster_size, self.width, self.blocked
+        x0, y0 = cx * size, cy * size
+        cw = min(x0 + size, width) - x0
+        ch = min(y0 + size, self.height) - y0
+        passable = []
+        for y in range(y0, y0 + ch):
+            passable += [not b for b in
+                         blocked[y * width + x0:y * width + x0 + cw]]
+        offsets = [(dx, dy, dy * cw + dx, step)
+                   for (dx, dy, step) in NEIGHBOUR_OFFSETS]
+        neighbours: List[List[Tuple[int, float]]] = []
+        for i in range(cw * ch):
+            if not passable[i]:
+                neighbours.append([])
+                continue
+            x, y = i % cw, i // cw
+            neighbours.append([(i + di, step) for (dx, dy, di, step) in offsets
+                               if 0 <= x + dx < cw and 0 <= y + dy < ch
+                               and passable[i + di]])
+        return (x0, y0, cw, neighbours)
+
+    def _flood(self, cluster, sources, targets) -> Dict[int, float]:
+        # Returns the costs of the shortest paths from the nearest of
+        # ``sources`` to those of ``targets`` it can reach without leaving
+        # ``cluster``.
+        (x0, y0, cw, neighbours) = cluster
+        width = self.width
+        origin = y0 * width + x0
+
+        def local(cell):
+            (y, x) = divmod(cell - origin, width)
+            return y * cw + x
+        local_targets = {local(target): target for target in targets}
+        heappush, heappop = heapq.heappush, heapq.heappop
+        cost = [math.inf] * len(neighbours)
+        fringe = []
+        for source in sources:
+            cost[local(source)] = 0.0
+            fringe.append((0.0, local(source)))
+        found: Dict[int, float] = {}
+        while fringe and len(found) < len(targets):
+            (d, i) = heappop(fringe)
+            if d > cost[i]:
+                continue
+            if i in local_targets:
+                found[local_targets[i]] = d
+            for (n, step) in neighbours[i]:
+                nd = d + step
+                if nd < cost[n]:
+                    cost[n] = nd
+                    heappush(fringe, (nd, n))
+        return found
+
+    def _goal_cells(self, dst, within) -> List[int]:
+        # The statically passable cells within ``within`` of ``dst``.
+        width, height, blocked = self.width, self.height, self.blocked
+        cells = []
+        for y in range(max(0, dst.y - within),
+                       min(height, dst.y + within + 1)):
+            for x in range(max(0, dst.x - within),
+                           min(width, dst.x + within + 1)):
+                if (x - dst.x)**2 + (y - dst.y)**2 <= within * within \
+                        and not blocked[y * width + x]:
+                    cells.append(y * width + x)
+        return cells
+
+    def find_path(self, src: Point, dst: Point,
+                  passable: Callable[[int, int], bool],
+                  within: int = 0) -> Optional[List[Point]]:
+        """Returns a path from ``src`` to within ``within`` of ``dst``
+        through the cells for which ``passable(x, y)`` is true, like
+        astar.find_path_astar(), or None if none was found.
+
+        The abstract graph only knows the static terrain. Where
+        ``passable`` rules out cells a path relies on, it is routed around
+        them within the clusters they are in and the ones next to those.
+        Failing that, the abstract graph is searched again without the
+        entrance or edge that was in the way, up to MAX_REPLANS times,
+        before None is returned.
+        """
+        if (src.x - dst.x)**2 + (src.y - dst.y)**2 <= within * within:
+            return [src]
+        size, width = self.cluster_size, self.width
+        start = src.y * width + src.x
+        if self.blocked[start]:
+            return None
+        goals: Dict[Tuple[int, int], List[int]] = {}
+        for cell in self._goal_cells(dst, within):
+            key = ((cell % width) // size, (cell // width) // size)
+            goals.setdefault(key, []).append(cell)
+        if not goals:
+            return None
+
+        # Edges from the start to its cluster's entrances, and to the goal
+        # if it is in the same cluster.
+        scx, scy = src.x // size, src.y // size
+        start_goals = set(goals.get((scx, scy), []))
+        reached = self._flood(self._cluster(scx, scy), [start],
+                              set(self._graph(scx, scy)) | start_goals)
+        start_edges = [(cell, cost) for (cell, cost) in reached.items()
+                       if cell not in start_goals]
+        start_edges += self._graph(scx, scy).get(start, [])
+        goal_costs = [cost for (cell, cost) in reached.items()
+                      if cell in start_goals]
+        if goal_costs:
+            start_edges.append((_GOAL, min(goal_costs)))
+        # The cost to the goal from each entrance of a cluster it is in.
+        to_goal: Dict[int, float] = {}
+        for ((cx, cy), cells) in goals.items():
+            reached = self._flood(self._cluster(cx, cy), cells,
+                                  set(self._graph(cx, cy)))
+            for (entrance, cost) in reached.items():
+                to_goal[entrance] = min(cost, to_goal.get(entrance, math.inf))
+
+        banned_cells: Set[int] = set()
+        banned_edges: Set[Tuple[int, int]] = set()
+        for _ in range(self.MAX_REPLANS + 1):
+            waypoints = self._search(start, dst, within, start_edges, to_goal,
+                                     banned_cells, banned_edges)
+            if waypoints is None:
+                return None
+            path = self._refine(waypoints, dst, passable, within,
+                                banned_cells, banned_edges)
+            if path is not None:
+                return path
+        return None
+
+    def _search(self, start, dst, within, start_edges, to_goal, banned_cells,
+                banned_edges) -> Optional[List[int]]:
+        # A* over the entrances, from ``start`` to the virtual _GOAL node,
+        # avoiding the banned entrances and edges.
+        size, width = self.cluster_size, self.width
+        heappush, heappop = heapq.heappush, heapq.heappop
+        cost = {start: 0.0}
+        parent: Dict[int, Optional[int]] = {start: None}
+        closed = set()
+        fringe = [(0.0, start)]
+        while fringe:
+            (_, cell) = heappop(fringe)
+            if cell == _GOAL:
+                waypoints = []
+                node: Optional[int] = cell
+                while node is not None:
+                    waypoints.append(node)
+                    node = parent[node]
+                waypoints.reverse()
+                return waypoints
+            if cell in closed:
+                continue
+            closed.add(cell)
+
+            x, y = cell % width, cell // width
+            if cell == start:
+                edges = start_edges
+            else:
+                edges = self._graph(x // size, y // size)[cell]
+                if cell in to_goal:
+                    edges = edges + [(_GOAL, to_goal[cell])]
+            for (n, step) in edges:
+                if n in banned_cells or (cell, n) in banned_edges:
+                    continue
+                nc = cost[cell] + step
+                if n not in closed and nc < cost.get(n, math.inf):
+                    cost[n] = nc
+                    parent[n] = cell
+                    if n == _GOAL:
+                        h = 0.0
+                    else:
+                        dx = abs(n % width - dst.x)
+                        dy = abs(n // width - dst.y)
+                        h = max(0.0, max(dx, dy) + _DIAGONAL_EXTRA *
+                                min(dx, dy) - within)
+                    heappush(fringe, (nc + h, n))
+        return None
+
+    def _refine(self, waypoints, dst, passable, within, banned_cells,
+                banned_edges) -> Optional[List[Point]]:
+        # Searches the cells between each pair of consecutive waypoints.
+        # Waypoints that aren't next to one another, and the last one and
+        # the goal, are in the same cluster, and the cost of the edge
+        # between them was found without leaving it, so that is where to
+        # search. If a step can't be made, bans the waypoint it led to if
+        # that is blocked, or else the edge, and returns None.
+        width = self.width
+        path = [Point(waypoints[0] % width, waypoints[0] // width)]
+        within_sq = within * within
+        for (prev, cell) in zip(waypoints, waypoints[1:]):
+            a = path[-1]
+            segment: Optional[List[Point]]
+            if cell == _GOAL:
+                segment = self._segment(a, dst, passable, within)
+            else:
+                b = Point(cell % width, cell // width)
+                if not passable(b.x, b.y):
+                    banned_cells.add(cell)
+                    return None
+                if max(abs(a.x - b.x), abs(a.y - b.y)) <= 1:
+                    segment = [a, b]
+                else:
+                    segment = self._segment(a, b, passable, 0)
+            if segment is None:
+                banned_edges.add((prev, cell))
+                return None
+            for p in segment[1:]:
+                path.append(p)
+                if (p.x - dst.x)**2 + (p.y - dst.y)**2 <= within_sq:
+                    return path
+        return path
+
+    def _segment(self, a, b, passable, within) -> Optional[List[Point]]:
+        # Searches a's cluster, then if characters are in the way, that
+        # cluster and the ones around it.
+        size, width, height = self.cluster_size, self.width, self.height
+        x0, y0 = a.x // size * size, a.y // size * size
+        for margin in [0, size]:
+            segment = find_path_window(
+                passable, a, b, max(0, x0 - margin), max(0, y0 - margin),
+                min(width, x0 + size + margin),
+                min(height, y0 + size + margin), within)
+            if segment is not None:
+                return segment
+        return None
@@ -0,0 +1,47 @@
+from typing import Dict
+
+
+class LevelOfDetail:
+    """Decides how much AI each NPC gets from how far it is from the view.
+
+    NPCs within ``margin`` tiles of the player's view are near and get full
+    AI every tick. Far NPCs are coarse: they only tick every
+    ``far_interval`` ticks, staggered by their place in the population so
+    that they don't all tick together, and step in straight lines instead
+    of planning paths (see NPC.next_step). An NPC is promoted back to full
+    AI on the first tick it is near again.
+    """
+
+    def __init__(self, game, half_width, half_height, margin=4,
+                 far_interval=4):
+        self.game = game
+        self.reach_x = half_width + margin
+        self.reach_y = half_height + margin
+        self.far_interval = far_interval
+        self._phases: Dict[str, int] = {}
+
+    def next_phase(self, population):
+        """Returns the phase of the next tick of ``population``."""
+        phase = self._phases.get(population, -1) + 1
+        self._phases[population] = phase
+        return phase
+
+    def is_near(self, npc):
+        (pos, player) = (npc.pos, self.game.world.squirrel.pos)
+        return abs(pos.x - player.x) <= self.reach_x \
+            and abs(pos.y - player.y) <= self.reach_y
+
+    def should_tick(self, npc, turn):
+        """Updates ``npc``'s level of detail and returns whether it should
+        tick on this ``turn``.
+        """
+        near = self.is_near(npc)
+        npc.coarse = not near
+        return near or turn % self.far_interval == 0
+
+    def tick(self, population, npcs, tick):
+        """Calls ``tick`` on those of ``npcs`` that should tick now."""
+        phase = self.next_phase(population)
+        for (i, npc) in enumerate(npcs):
+            if self.should_tick(npc, phase + i):
+                tick(npc)
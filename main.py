@@ -1,19 +1,21 @@
-import enum
-import io
+import argparse
+import collections
+import math
+import multiprocessing
 import os
-import random
 import sys
-import time
+from typing import Dict
 
 import pygame as pg
 
 from abc import abstractmethod
-from geometry import Direction, pdist, Point, Rotation
-from fox import Fox
-from map import MAP
+from game import Game, GameState, Input, Season
+from geometry import Direction
+from mapgen import generate_map, parse_size
 from nut import Nut
-from squirrel import Squirrel
-from world import World
+from pathservice import PathService
+from profiler import FrameProfiler, NULL_PROFILER, Profiler
+from replay import Player, Recorder
 
 
 # Logical screen dimensions. This will be scaled to fit the display window.
@@ -25,6 +27,20 @@ TILE_HEIGHT = 32
 SCREEN_WIDTH_TILES = int(SCREENRECT.width / TILE_WIDTH)
 SCREEN_HEIGHT_TILES = int(SCREENRECT.height / TILE_HEIGHT)
 WHITE_COLOR = (255, 255, 255)
+# Tiles shown left of and above the squirrel, which is centred in the view.
+TERRAIN_BORDER_LEFT = int(SCREEN_WIDTH_TILES / 2)
+TERRAIN_BORDER_TOP = int(SCREEN_HEIGHT_TILES / 2 - 1)
+# Terrain is rendered and cached in square chunks of this many tiles a side,
+# so that only the parts of the map near the view take up memory. A view
+# needs at most six chunks at a time.
+TERRAIN_CHUNK_TILES = 16
+TERRAIN_CHUNK_CACHE_SIZE = 32
+# Wall-clock milliseconds of NPC AI to run per frame; a quarter of a frame
+# at 30 FPS. Not applied to recorded or replayed games, which must not
+# depend on the machine's speed.
+NPC_TICK_BUDGET_MS = 8
+# How many rendered strings of text to keep for reuse.
+TEXT_CACHE_SIZE = 256
 
 ASSETS = [
     {'name': "squirrel", 'tiles': True},
@@ -52,43 +68,6 @@ def resource_dir():
     return os.path.join(base_path, 'assets')
 
 
-class Action(enum.Enum):
-    SPACE = 1
-    F = 2
-    C = 3
-
-
-class Season(enum.Enum):
-    SUMMER = "summer"
-    WINTER = "winter"
-
-
-class GameState(enum.Enum):
-    NOT_STARTED = 1
-    STARTED = 2
-    PAUSED = 3
-    OVER = 4
-
-
-class Stats:
-    def __init__(self):
-        self.nuts_eaten = 0
-        self.nuts_buried = set()
-        self.seasons_survived = 0
-
-
-class GameTime:
-    current_time = 0
-
-    @classmethod
-    def current_time_ms(cls):
-        return cls.current_time
-
-    @classmethod
-    def update(cls, time_delta_ms):
-        cls.current_time += time_delta_ms
-
-
 class Controller:
     @abstractmethod
     def handle(self, event, game):
@@ -103,7 +82,7 @@ class MainMenuController(Controller):
     def handle(self, event, game):
         if event.type == pg.KEYDOWN:
             if event.key == pg.K_n:
-                game.state = GameState.STARTED
+                game.input(Input.START)
             elif event.key in [pg.K_x, pg.K_ESCAPE]:
                 return True
 
@@ -112,72 +91,51 @@ class MainMenuController(Controller):
 
 
 class GameController(Controller):
-    MOVE_KEYPRESS_INTERVAL = 100
-
-    def __init__(self):
-        self.last_move_timestamp = 0
-
     def handle(self, event, game):
         if event.type == pg.KEYDOWN:
             if event.key == pg.K_q:
-                game.rotate(Rotation.CounterClockwise)
+                game.input(Input.ROTATE_COUNTER_CLOCKWISE)
             if event.key == pg.K_e:
-                game.rotate(Rotation.Clockwise)
+                game.input(Input.ROTATE_CLOCKWISE)
             if event.key in [pg.K_UP, pg.K_w]:
-                game.face(Direction.UP)
+                game.input(Input.FACE_UP)
             if event.key in [pg.K_DOWN, pg.K_s]:
-                game.face(Direction.DOWN)
+                game.input(Input.FACE_DOWN)
             if event.key in [pg.K_LEFT, pg.K_a]:
-                game.face(Direction.LEFT)
+                game.input(Input.FACE_LEFT)
             if event.key in [pg.K_RIGHT, pg.K_d]:
-                game.face(Direction.RIGHT)
+                game.input(Input.FACE_RIGHT)
             if event.key == pg.K_SPACE:
-                game.action(Action.SPACE)
+                game.input(Input.SPACE)
             if event.key == pg.K_f:
-                game.action(Action.F)
+                game.input(Input.F)
             if event.key == pg.K_c:
-                game.action(Action.C)
+                game.input(Input.C)
             if event.key == pg.K_ESCAPE:
-                game.state = GameState.PAUSED
+                game.input(Input.PAUSE)
 
     def tick(self, game, clock):
-        GameTime.update(clock.get_time())
-        current_timestamp = GameTime.current_time_ms()
-
-        if current_timestamp > self.last_move_timestamp + \
-                GameController.MOVE_KEYPRESS_INTERVAL:
-            keystate = pg.key.get_pressed()
-            direction = None
-            if keystate[pg.K_UP] or keystate[pg.K_w]:
-                game.move(Direction.UP)
-                self.last_move_timestamp = current_timestamp
-            if keystate[pg.K_DOWN] or keystate[pg.K_s]:
-                game.move(Direction.DOWN)
-                self.last_move_timestamp = current_timestamp
-            if keystate[pg.K_LEFT] or keystate[pg.K_a]:
-                game.move(Direction.LEFT)
-                self.last_move_timestamp = current_timestamp
-            if keystate[pg.K_RIGHT] or keystate[pg.K_d]:
-                game.move(Direction.RIGHT)
-                self.last_move_timestamp = current_timestamp
-
-        for scheduled_event in game.scheduled_events:
-            if current_timestamp > scheduled_event.last_timestamp + \
-                                    scheduled_event.period:
-                scheduled_event.action(scheduled_event, current_timestamp)
-                scheduled_event.last_timestamp = current_timestamp
-
-        game.tick()
+        keystate = pg.key.get_pressed()
+        held_directions = []
+        if keystate[pg.K_UP] or keystate[pg.K_w]:
+            held_directions.append(Direction.UP)
+        if keystate[pg.K_DOWN] or keystate[pg.K_s]:
+            held_directions.append(Direction.DOWN)
+        if keystate[pg.K_LEFT] or keystate[pg.K_a]:
+            held_directions.append(Direction.LEFT)
+        if keystate[pg.K_RIGHT] or keystate[pg.K_d]:
+            held_directions.append(Direction.RIGHT)
+
+        game.step(clock.get_time(), held_directions)
 
 
 class PauseMenuController(Controller):
     def handle(self, event, game):
         if event.type == pg.KEYDOWN:
             if event.key in [pg.K_r, pg.K_ESCAPE]:
-                game.state = GameState.STARTED
+                game.input(Input.START)
             if event.key == pg.K_n:
-                game.reset()
-                game.state = GameState.STARTED
+                game.input(Input.NEW_GAME)
             elif event.key == pg.K_x:
                 return True
 
@@ -188,33 +146,37 @@ class PauseMenuController(Controller):
 class GameOverController(Controller):
     def handle(self, event, game):
         if event.type == pg.KEYDOWN:
-            game.reset()
+            game.input(Input.RESET)
 
     def tick(self, game, clock):
         pass
 
 
-class Game:
-    NUT_SPAWN_RATE = 5000
-    ENERGY_LOSS_RATE = 500
-    ENERGY_LOSS_PER_SEC = 16
-    ENERGY_LOSS_MULTIPLIER = 1
-    N_SQUIRRELS = 5
-    NPC_MOVE_RATE = 1000
-    FOX_MOVE_RATE = 150
-    N_GROUND_TILES = 30
-    ROUND_DURATION = {
-        Season.SUMMER: 1*50*1000,
-        Season.WINTER: 1*25*1000,
-    }
-    DAY_TRANSITION_RATE = 50
-    DAY_TRANSITION_LENGTH = 1000
-
-    def __init__(self, screen):
+class ReplayController(Controller):
+    """Drives the game from a recording instead of the keyboard."""
+
+    def __init__(self, player):
+        self.player = player
+
+    def handle(self, event, game):
+        if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
+            return True
+
+    def tick(self, game, clock):
+        self.player.play_step(game)
+
+
+class Renderer:
+    """Draws a Game onto the pygame display."""
+
+    def __init__(self, game, screen):
+        self.game = game
+
         font_path = os.path.join(resource_dir(), "freesansbold.ttf")
         self.title_font = pg.font.Font(font_path, 48)
         self.stats_font = pg.font.Font(font_path, 28)
         self.score_font = pg.font.Font(font_path, 24)
+        self.profiler_font = pg.font.Font(font_path, 12)
 
         self.screen = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
         self.display_screen = screen
@@ -225,147 +187,37 @@ class Game:
         self.nightfall_overlay = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT),
                                             pg.SRCALPHA)
 
-        self.controllers = {
-            GameState.NOT_STARTED: MainMenuController(),
-            GameState.STARTED: GameController(),
-            GameState.PAUSED: PauseMenuController(),
-            GameState.OVER: GameOverController(),
-        }
-
-        self.reset()
-
-    def reset(self):
-        self.scheduled_events = []
-
-        self.stats = Stats()
-        self.world = World(MAP, self.N_GROUND_TILES)
-
-        self.level = 1
-        self.current_season = Season.SUMMER
-        self.current_round_elapsed = 0
-        self.nightfall = 20
-        self.init_season()
-
-        self.new_pos = Point(self.world.squirrel.pos.x,
-                             self.world.squirrel.pos.y)
-
-        self.state = GameState.NOT_STARTED
-
-    def nightfall_transition(self, event, current_timestamp):
-        elapsed = (current_timestamp - event.last_timestamp)
-        self.nightfall += elapsed / self.DAY_TRANSITION_RATE
-
-    def daylight_transition(self, event, current_timestamp):
-        if self.nightfall >= 0:
-            elapsed = (current_timestamp - event.last_timestamp)
-            self.nightfall -= elapsed / self.DAY_TRANSITION_RATE
-
-    def next_season(self):
-        self.scheduled_events.clear()
-
-        self._schedule_event(self.nightfall_transition,
-                             self.DAY_TRANSITION_RATE)
-        self._schedule_event(self.complete_next_season,
-                             self.DAY_TRANSITION_LENGTH)
-
-    def complete_next_season(self, event, current_timestamp):
-        self.scheduled_events.clear()
-
-        if not self.world.is_tree(self.world.squirrel.pos):
-            self.over("You got eaten by an owl!")
-
-        self.stats.seasons_survived += 1
-
-        if self.current_season == Season.SUMMER:
-            self.current_season = Season.WINTER
-        elif self.current_season == Season.WINTER:
-            self.current_season = Season.SUMMER
-            self.level += 1
-        self.init_season()
-
-    def init_season(self):
-        self._schedule_event(self.daylight_transition,
-                             self.DAY_TRANSITION_RATE)
-        self._schedule_event(self.update_round_elapsed, 1)
-        self._schedule_event(self.energy_loss, Game.ENERGY_LOSS_RATE)
-        self._schedule_event(self.tick_squirrels, Game.NPC_MOVE_RATE)
-        self._schedule_event(self.tick_foxes, Game.FOX_MOVE_RATE)
-
-        self.current_round_elapsed = 0
-        self._init_foxes(self.number_foxes_for_level())
-        if self.current_season == Season.SUMMER:
-            self._init_squirrels(Game.N_SQUIRRELS)
-            self._init_nuts(self.number_nuts_for_level())
-            self._schedule_event(self.spawn_nut_event,
-                                 self.nut_spawn_rate_for_level())
-        elif self.current_season == Season.WINTER:
-            self._init_squirrels(0)
-            self._init_nuts(0)
-
-    def nut_spawn_rate_for_level(self):
-        return 5000 + self.level * 1000
-
-    def number_nuts_for_level(self):
-        return max(1, 6 - self.level)
-
-    def number_foxes_for_level(self):
-        return int(self.level / 2 + 0.5)
-
-    def _init_nuts(self, nnuts):
-        for nut in self.world.active_nuts():
-            del self.world.nuts[nut.id]
-        for i in range(nnuts):
-            self.spawn_random_nut()
-
-    def _init_squirrels(self, nsquirrels):
-        self.world.squirrels.clear()
-        for i in range(nsquirrels):
-            squirrel = Squirrel(self, self.world.random_point(),
-                                Direction.RIGHT)
-            self.world.squirrels.append(squirrel)
-
-    def _init_foxes(self, nfoxes):
-        self.world.foxes.clear()
-        for i in range(nfoxes):
-            while True:
-                pos = self.world.random_point()
-                if Fox._can_move_to(self, pos):
-                    break
-            fox = Fox(self, pos, Direction.DOWN)
-            self.world.foxes.append(fox)
-
-    def _schedule_event(self, action, period):
-        event = ScheduledEvent(action, period)
-        self.scheduled_events.append(event)
-
-    def energy_loss(self, event, current_timestamp):
-        elapsed = (current_timestamp - event.last_timestamp)
-        energy_loss = int(elapsed / 1000 * self.ENERGY_LOSS_PER_SEC)
-        self.world.squirrel.energy -= energy_loss
-
-    def spawn_nut_event(self, event, current_timestamp):
-        self.spawn_random_nut()
-
-    def update_round_elapsed(self, event, current_timestamp):
-        elapsed = current_timestamp - event.last_timestamp
-        self.current_round_elapsed += elapsed
-        if self.current_round_elapsed > \
-                self.ROUND_DURATION[self.current_season]:
-            self.next_season()
-
-    def spawn_random_nut(self):
-        nutx = random.randint(0, self.world.WIDTH_TILES-1)
-        nuty = random.randint(0, self.world.HEIGHT_TILES-1)
-        nut = Nut(nutx, nuty)
-        self.world.nuts[nut.id] = nut
-
-    def tick_squirrels(self, event, current_timestamp):
-        for squirrel in self.world.squirrels:
-            squirrel.tick()
-
-    def tick_foxes(self, event, current_timestamp):
-        for fox in self.world.foxes:
-            fox.tick()
+        self.profiler: Profiler = NULL_PROFILER
+        self.show_profiler = False
+
+        # Square chunks of terrain, TERRAIN_CHUNK_TILES tiles a side,
+        # rendered as the view reaches them for self.game.world, keyed by
+        # (season, chunk x, chunk y) and least recently used first.
+        self.terrain = collections.OrderedDict()
+        self.terrain_world = None
+
+        # If set, only the parts of the screen that changed since the last
+        # frame are redrawn and pushed to the display. Each frame is drawn
+        # from a list of (key, image, pos) items, where the key identifies
+        # what the image shows; the items of the last frame are kept to
+        # diff against.
+        self.dirty_rects = False
+        self._items = []
+        self._drawn = {}
+        self._view = None
+
+        # Recently rendered text, least recently used first, and the last
+        # composited overlay of each kind, with the key it was made for.
+        self._text = collections.OrderedDict()
+        self._overlays = {}
+
+        # How self.screen is scaled to fit the display, and the surface it
+        # is scaled into; worked out again by fit_display() when the window
+        # is resized.
+        self._display_size = None
+        self._scale = 1
+        self._screen_pos = (0, 0)
+        self._scaled_screen = self.screen
 
     def load_assets(self):
         assets_path = resource_dir()
@@ -392,6 +244,7 @@ class Game:
                 self.assets[asset_filename] = surface.convert_alpha()
 
     def _draw_image_at(self, image, x, y, frame=None):
+        key = image
         if isinstance(image, str):
             image = self.assets[image]
         px = x * TILE_WIDTH
@@ -400,51 +253,146 @@ class Game:
         if frame is not None:
             image = image[frame]
 
-        self.screen.blit(image, (px, py))
-
-    def render_map(self):
-        for x in range(SCREEN_WIDTH_TILES):
-            for y in range(SCREEN_HEIGHT_TILES):
-                (mapx, mapy) = (self.world.squirrel.pos.x + x -
-                                int(SCREEN_WIDTH_TILES / 2),
-                                self.world.squirrel.pos.y + y -
-                                int(SCREEN_HEIGHT_TILES / 2 - 1))
-                if mapx < 0 or mapx >= self.world.WIDTH_TILES or mapy < 0 \
-                        or mapy >= self.world.HEIGHT_TILES:
-                    self._draw_image_at('water', x, y)
-                elif self.world.MAP[mapy][mapx] == '.':
-                    frame = self.world.GROUND_LAYER[mapy][mapx]['tileidx']
-                    ground = 'summerground' \
-                        if self.current_season == Season.SUMMER \
-                        else 'winterground'
-                    self._draw_image_at(ground, x, y, frame=frame)
-                elif self.world.MAP[mapy][mapx] == '#':
-                    tree = 'tree' if self.current_season == Season.SUMMER \
-                                  else 'wintertree'
-                    self._draw_image_at(tree, x, y)
+        self._draw((key, frame), image, (px, py))
+
+    def _draw(self, key, image, pos):
+        self._items.append((key, image, pos))
+
+    def _draw_terrain_tile(self, surface, season, mapx, mapy, origin):
+        world = self.game.world
+        if mapx < 0 or mapx >= world.WIDTH_TILES or mapy < 0 \
+                or mapy >= world.HEIGHT_TILES:
+            image = self.assets['water']
+        elif world.trees[mapy * world.WIDTH_TILES + mapx]:
+            image = self.assets['tree' if season == Season.SUMMER
+                                else 'wintertree']
+        else:
+            frame = world.ground[mapy * world.WIDTH_TILES + mapx]
+            image = self.assets['summerground' if season == Season.SUMMER
+                                else 'winterground'][frame]
+        # Ground tiles are partly transparent, so clear whatever was drawn
+        # here before.
+        rect = pg.rect.Rect((mapx - origin[0]) * TILE_WIDTH,
+                            (mapy - origin[1]) * TILE_HEIGHT,
+                            TILE_WIDTH, TILE_HEIGHT)
+        surface.fill((0, 0, 0), rect)
+        surface.blit(image, rect)
+
+    def update_terrain(self):
+        """Brings the cached terrain chunks up to date with the world."""
+        world = self.game.world
+        if world is not self.terrain_world:
+            self.terrain.clear()
+            self.terrain_world = world
+
+        for pos in world.changed_tiles:
+            (cx, cy) = (pos.x // TERRAIN_CHUNK_TILES,
+                        pos.y // TERRAIN_CHUNK_TILES)
+            for season in Season:
+                surface = self.terrain.get((season, cx, cy))
+                if surface is not None:
+                    self._draw_terrain_tile(
+                        surface, season, pos.x, pos.y,
+                        (cx * TERRAIN_CHUNK_TILES, cy * TERRAIN_CHUNK_TILES))
+        world.changed_tiles.clear()
+
+    def terrain_chunk(self, season, cx, cy):
+        """Returns chunk (cx, cy) of the map rendered for ``season``. Chunks
+        off the edges of the map are water.
+        """
+        key = (season, cx, cy)
+        surface = self.terrain.get(key)
+        if surface is not None:
+            self.terrain.move_to_end(key)
+            return surface
+        size = TERRAIN_CHUNK_TILES
+        surface = pg.Surface((size * TILE_WIDTH, size * TILE_HEIGHT))
+        origin = (cx * size, cy * size)
+        for mapy in range(origin[1], origin[1] + size):
+            for mapx in range(origin[0], origin[0] + size):
+                self._draw_terrain_tile(surface, season, mapx, mapy, origin)
+        self.terrain[key] = surface
+        if len(self.terrain) > TERRAIN_CHUNK_CACHE_SIZE:
+            self.terrain.popitem(last=False)
+        return surface
+
+    def render_map(self, season, rect=SCREENRECT):
+        # The visible window starts TERRAIN_BORDER_LEFT/TOP tiles up and
+        # left of the squirrel.
+        pos = self.game.world.squirrel.pos
+        left = (pos.x - TERRAIN_BORDER_LEFT) * TILE_WIDTH
+        top = (pos.y - TERRAIN_BORDER_TOP) * TILE_HEIGHT
+        area = rect.move(left, top)
+        chunk_width = TERRAIN_CHUNK_TILES * TILE_WIDTH
+        chunk_height = TERRAIN_CHUNK_TILES * TILE_HEIGHT
+        for cy in range(area.top // chunk_height,
+                        (area.bottom - 1) // chunk_height + 1):
+            for cx in range(area.left // chunk_width,
+                            (area.right - 1) // chunk_width + 1):
+                chunk = pg.rect.Rect(cx * chunk_width, cy * chunk_height,
+                                     chunk_width, chunk_height)
+                part = area.clip(chunk)
+                self.screen.blit(self.terrain_chunk(season, cx, cy),
+                                 (part.x - left, part.y - top),
+                                 part.move(-chunk.x, -chunk.y))
 
     def render(self):
-        self.render_map()
+        with self.profiler.stage("render"):
+            dirty = self.render_screen()
+        with self.profiler.stage("scale"):
+            if self.display_screen.get_size() != self._display_size:
+                self.fit_display()
+                dirty = None
+            scaled_screen, screen_pos = self.scale_screen(dirty)
+        with self.profiler.stage("display"):
+            if dirty is None:
+                self.display_screen.fill((0, 0, 0))
+                self.display_screen.blit(scaled_screen, screen_pos)
+                pg.display.update()
+            elif dirty:
+                scaled_rect = scaled_screen.get_rect(topleft=screen_pos)
+                scale = self._scale
+                rects = []
+                for rect in dirty:
+                    rect = pg.rect.Rect(
+                        screen_pos[0] + int(rect.left * scale),
+                        screen_pos[1] + int(rect.top * scale),
+                        math.ceil(rect.width * scale) + 1,
+                        math.ceil(rect.height * scale) + 1).clip(scaled_rect)
+                    self.display_screen.blit(
+                        scaled_screen, rect,
+                        rect.move(-screen_pos[0], -screen_pos[1]))
+                    rects.append(rect)
+                pg.display.update(rects)
+
+    def render_screen(self):
+        """Draws the current frame onto self.screen. Returns the rects of
+        it that changed, or None if all of it may have.
+        """
+        world = self.game.world
+        changed_tiles = list(world.changed_tiles)
+        self.update_terrain()
+        self._items = []
 
         # Render nuts
-        for nut in self.world.nuts.values():
+        for nut in world.nuts.values():
             if nut.state != Nut.NutState.ACTIVE:
                 continue
             sx = nut.pos.x + int(SCREEN_WIDTH_TILES / 2) - \
-                self.world.squirrel.pos.x
+                world.squirrel.pos.x
             sy = nut.pos.y + int(SCREEN_HEIGHT_TILES / 2 - 1) - \
-                self.world.squirrel.pos.y
+                world.squirrel.pos.y
             if sx < 0 or sx >= SCREEN_WIDTH_TILES or sy < 0 \
                     or sy >= SCREEN_HEIGHT_TILES:
                 continue
             self._draw_image_at('nut', sx, sy)
 
         # Draw other squirrels
-        for squirrel in self.world.squirrels:
+        for squirrel in world.squirrels:
             sx = squirrel.pos.x + int(SCREEN_WIDTH_TILES / 2) - \
-                self.world.squirrel.pos.x
+                world.squirrel.pos.x
             sy = squirrel.pos.y + int(SCREEN_HEIGHT_TILES / 2 - 1) - \
-                self.world.squirrel.pos.y
+                world.squirrel.pos.y
             if sx < 0 or sx >= SCREEN_WIDTH_TILES or sy < 0 \
                     or sy >= SCREEN_HEIGHT_TILES:
                 continue
@@ -452,11 +400,11 @@ class Game:
                                 frame=squirrel.facing.value-1)
 
         # Draw foxes
-        for fox in self.world.foxes:
+        for fox in world.foxes:
             sx = fox.pos.x + int(SCREEN_WIDTH_TILES / 2) - \
-                self.world.squirrel.pos.x
+                world.squirrel.pos.x
             sy = fox.pos.y + int(SCREEN_HEIGHT_TILES / 2 - 1) - \
-                self.world.squirrel.pos.y
+                world.squirrel.pos.y
             if sx < 0 or sx >= SCREEN_WIDTH_TILES or sy < 0 \
                     or sy >= SCREEN_HEIGHT_TILES:
                 continue
@@ -467,96 +415,216 @@ class Game:
             'squirrel',
             int(SCREEN_WIDTH_TILES / 2),
             int(SCREEN_HEIGHT_TILES / 2 - 1),
-            frame=self.world.squirrel.facing.value-1)
+            frame=world.squirrel.facing.value-1)
 
         # Draw energy bar
         self.energy_bar.fill((0, 0, 128))
-        fill_width = (self.world.squirrel.energy / 1000) * 196
+        fill_width = (world.squirrel.energy / 1000) * 196
         self.energy_bar.fill(WHITE_COLOR, pg.rect.Rect(2, 2, fill_width, 26))
-        self.screen.blit(self.energy_bar, (20, 466))
+        self._draw(('energy', int(fill_width)), self.energy_bar, (20, 466))
 
         self.render_sunlight_bar()
 
         self.render_inventory()
 
-        if self.nightfall > 0:
+        if self.game.nightfall > 0:
             nightfall_alpha = \
-                (self.nightfall / (self.DAY_TRANSITION_LENGTH /
-                                   self.DAY_TRANSITION_RATE)) * 255
+                (self.game.nightfall / (self.game.DAY_TRANSITION_LENGTH /
+                                        self.game.DAY_TRANSITION_RATE)) * 255
             nightfall_alpha = max(0, min(255, int(nightfall_alpha)))
             self.nightfall_overlay.fill((0, 0, 0, nightfall_alpha))
-            self.screen.blit(self.nightfall_overlay, (0, 0))
+            self._draw(('nightfall', nightfall_alpha),
+                       self.nightfall_overlay, (0, 0))
 
         # TODO: this is blatent polymorphism.
-        if self.state == GameState.NOT_STARTED:
+        if self.game.state == GameState.NOT_STARTED:
             self.render_menu()
-        elif self.state == GameState.PAUSED:
+        elif self.game.state == GameState.PAUSED:
             self.render_pause_menu()
-        elif self.state == GameState.OVER:
+        elif self.game.state == GameState.OVER:
             self.render_game_over()
 
-        # Scale logical screen to fit window display.
-        display_width = self.display_screen.get_width()
-        display_height = self.display_screen.get_height()
-        scale_x = display_width / SCREEN_WIDTH
-        scale_y = display_height / SCREEN_HEIGHT
-        scale = min(scale_x, scale_y)
-
-        if scale != 1:
-            scaled_width = int(SCREEN_WIDTH * scale)
-            scaled_height = int(SCREEN_HEIGHT * scale)
-            screen_x = int((display_width - scaled_width) / 2)
-            screen_y = int((display_height - scaled_height) / 2)
-
-            scaled_screen = pg.transform.scale(
-                self.screen, (scaled_width, scaled_height))
+        if self.show_profiler:
+            self.render_profiler()
+
+        return self._draw_items(changed_tiles)
+
+    def _draw_items(self, changed_tiles):
+        world = self.game.world
+        items = self._items
+        drawn = {(key, pos): image.get_rect(topleft=pos)
+                 for (key, image, pos) in items}
+        previous, self._drawn = self._drawn, drawn
+
+        # Scrolling or a change of season or world changes everything.
+        view = (world, world.squirrel.pos, self.game.current_season)
+        if not self.dirty_rects or view != self._view:
+            self._view = view
+            self.render_map(self.game.current_season)
+            for (key, image, pos) in items:
+                self.screen.blit(image, pos)
+            return None
+
+        dirty = [drawn.get(item) or previous[item]
+                 for item in drawn.keys() ^ previous.keys()]
+        for pos in changed_tiles:
+            sx = pos.x + int(SCREEN_WIDTH_TILES / 2) - world.squirrel.pos.x
+            sy = pos.y + int(SCREEN_HEIGHT_TILES / 2 - 1) - \
+                world.squirrel.pos.y
+            rect = pg.rect.Rect(sx * TILE_WIDTH, sy * TILE_HEIGHT,
+                                TILE_WIDTH, TILE_HEIGHT)
+            if rect.colliderect(SCREENRECT):
+                dirty.append(rect)
+        # Redraw each dirty rect from the terrain up, clipped so that items
+        # overlapping its edges aren't drawn twice over the rest.
+        for rect in dirty:
+            self.screen.set_clip(rect)
+            self.render_map(self.game.current_season, rect)
+            for (key, image, pos) in items:
+                if image.get_rect(topleft=pos).colliderect(rect):
+                    self.screen.blit(image, pos)
+        self.screen.set_clip(None)
+        return dirty
+
+    def fit_display(self):
+        """Works out how to scale the logical screen to fit the display;
+        call whenever the window is resized.
+        """
+        display_width, display_height = self.display_screen.get_size()
+        scale = min(display_width / SCREEN_WIDTH,
+                    display_height / SCREEN_HEIGHT)
+        scaled_width = int(SCREEN_WIDTH * scale)
+        scaled_height = int(SCREEN_HEIGHT * scale)
+        self._display_size = (display_width, display_height)
+        self._scale = scale
+        self._view = None
+        self._screen_pos = (int((display_width - scaled_width) / 2),
+                            int((display_height - scaled_height) / 2))
+        if scale == 1:
+            self._scaled_screen = self.screen
         else:
-            screen_x, screen_y = 0, 0
-            scaled_screen = self.screen
-
-        self.display_screen.fill((0, 0, 0))
-        self.display_screen.blit(scaled_screen, (screen_x, screen_y))
-
-        pg.display.update()
+            self._scaled_screen = pg.Surface((scaled_width, scaled_height),
+                                             0, self.screen)
+
+    def scale_screen(self, dirty=None):
+        """Scales the logical screen to fit the display and returns it with
+        its position there. If ``dirty`` is a list of rects of the screen,
+        only those have changed since the last call.
+        """
+        if self._display_size is None:
+            self.fit_display()
+        scale = self._scale
+        if scale != 1:
+            scaled_screen = self._scaled_screen
+            if dirty is not None and scale == int(scale):
+                # At whole-number scales each pixel becomes a square block,
+                # so changed parts can be scaled on their own.
+                scale = int(scale)
+                for rect in dirty:
+                    rect = rect.clip(SCREENRECT)
+                    target = pg.rect.Rect(rect.x * scale, rect.y * scale,
+                                          rect.width * scale,
+                                          rect.height * scale)
+                    pg.transform.scale(self.screen.subsurface(rect),
+                                       target.size,
+                                       scaled_screen.subsurface(target))
+            else:
+                pg.transform.scale(self.screen, scaled_screen.get_size(),
+                                   scaled_screen)
+        return self._scaled_screen, self._screen_pos
+
+    def render_profiler(self):
+        name_width, value_width = 70, 50
+        rows = [["ms"] + [f"p{p}" for p in self.profiler.PERCENTILES]]
+        for (name, values) in self.profiler.summary().items():
+            rows.append([name] + [f"{value:.2f}" for value in values])
+
+        line_height = self.profiler_font.get_linesize()
+        s = pg.Surface((name_width + value_width * (len(rows[0]) - 1) + 8,
+                        line_height * len(rows) + 8), pg.SRCALPHA)
+        s.fill((0, 0, 0, 160))
+        for (i, row) in enumerate(rows):
+            y = 4 + i * line_height
+            s.blit(self.profiler_font.render(row[0], True, WHITE_COLOR),
+                   (4, y))
+            for (j, cell) in enumerate(row[1:]):
+                # Right-align the numbers in their columns.
+                txt = self.profiler_font.render(cell, True, WHITE_COLOR)
+                s.blit(txt, (4 + name_width + (j + 1) * value_width -
+                             txt.get_width(), y))
+        self._draw(('profiler', tuple(map(tuple, rows))), s, (0, 0))
 
     def render_sunlight_bar(self):
         self.sunlight_bar.fill((0, 0, 128))
-        score_txt = f"Lvl {self.level}"
-        txt = self.score_font.render(score_txt, True, WHITE_COLOR)
+        txt = self.render_text(self.score_font, f"Lvl {self.game.level}")
         y = (self.sunlight_bar.get_height() - txt.get_height()) / 2
         self.sunlight_bar.blit(txt, (8, y))
         txt_width = txt.get_width() + 16
 
-        season_icon = 'sun' if self.current_season == Season.SUMMER else 'snow'
+        season = self.game.current_season
+        season_icon = 'sun' if season == Season.SUMMER else 'snow'
         progress_width = self.sunlight_bar.get_width() - txt_width
-        x = (self.current_round_elapsed /
-             self.ROUND_DURATION[self.current_season]) * \
+        x = (self.game.current_round_elapsed /
+             self.game.ROUND_DURATION[season]) * \
             (progress_width - self.assets[season_icon].get_width()) + txt_width
         self.sunlight_bar.blit(self.assets[season_icon], (x, 0))
-        self.screen.blit(self.sunlight_bar, (240, 466))
+        self._draw(('sunlight', self.game.level, season, int(x)),
+                   self.sunlight_bar, (240, 466))
 
     def render_inventory(self):
-        if self.world.squirrel.is_carrying_nut():
+        world = self.game.world
+        if world.squirrel.is_carrying_nut():
             nut_image = self.assets['bignut']
         else:
             nut_image = self.assets['bignutgrey']
-        self.screen.blit(nut_image, (620, 464))
+        self._draw(('inventory', world.squirrel.is_carrying_nut()),
+                   nut_image, (620, 464))
+
+    def render_text(self, font, text, colour=WHITE_COLOR):
+        """Returns ``text`` rendered in ``font`` and ``colour``, from the
+        cache of recently rendered text if it is there.
+        """
+        key = (font, text, colour)
+        txt = self._text.get(key)
+        if txt is None:
+            txt = font.render(text, True, colour)
+            self._text[key] = txt
+            if len(self._text) > TEXT_CACHE_SIZE:
+                self._text.popitem(last=False)
+        else:
+            self._text.move_to_end(key)
+        return txt
+
+    def _draw_overlay(self, key, build):
+        # Overlays are only composited again when their key, which
+        # identifies their content, changes.
+        overlay = self._overlays.get(key[0])
+        if overlay is None or overlay[0] != key:
+            overlay = self._overlays[key[0]] = (key, build())
+        self._draw(key, overlay[1], (0, 0))
 
     def render_game_over(self):
+        stats = self.game.stats
+        self._draw_overlay(('game_over', self.game.game_over_message,
+                            stats.seasons_survived, stats.nuts_eaten,
+                            len(stats.nuts_buried)),
+                           self._build_game_over)
+
+    def _build_game_over(self):
         s = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pg.SRCALPHA)
         s.fill((50, 50, 50, 224))
 
-        txt = self.title_font.render(self._game_over_message, True,
-                                     WHITE_COLOR)
-        stat1_txt = self.stats_font.render(
-            f"Seasons survived: {self.stats.seasons_survived}", True,
-            WHITE_COLOR)
-        stat2_txt = self.stats_font.render(
-            f"Nuts eaten: {self.stats.nuts_eaten}", True, WHITE_COLOR)
-        stat3_txt = self.stats_font.render(
-            f"Nuts buried: {len(self.stats.nuts_buried)}", True, WHITE_COLOR)
-        continue_txt = self.stats_font.render(
-            f"Press any key to return to main menu...", True, WHITE_COLOR)
+        txt = self.render_text(self.title_font, self.game.game_over_message)
+        stat1_txt = self.render_text(
+            self.stats_font,
+            f"Seasons survived: {self.game.stats.seasons_survived}")
+        stat2_txt = self.render_text(
+            self.stats_font, f"Nuts eaten: {self.game.stats.nuts_eaten}")
+        stat3_txt = self.render_text(
+            self.stats_font,
+            f"Nuts buried: {len(self.game.stats.nuts_buried)}")
+        continue_txt = self.render_text(
+            self.stats_font, "Press any key to return to main menu...")
 
         x = (SCREEN_WIDTH - txt.get_width())/2
         y = (SCREEN_HEIGHT - txt.get_height() - stat1_txt.get_height() -
@@ -571,190 +639,74 @@ class Game:
         s.blit(stat3_txt, (x, y))
         y += stat1_txt.get_height()
         s.blit(continue_txt, (x, y))
-
-        self.screen.blit(s, (0, 0))
+        return s
 
     def render_menu(self):
-        s = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pg.SRCALPHA)
-        s.fill((50, 50, 50, 120))
-
         self._draw_image_at("menu", 0, 0)
-
-        txt1 = self.title_font.render("get dem nuts", True,
-                                      WHITE_COLOR)
-        txt2 = self.stats_font.render("Start (N)ew Game", True,
-                                      WHITE_COLOR)
-        txt3 = self.stats_font.render("E(x)it", True,
-                                      WHITE_COLOR)
-
-        x1 = (SCREEN_WIDTH - txt1.get_width())/2
-        y = (SCREEN_HEIGHT - txt1.get_height() - txt2.get_height() -
-             txt2.get_height())/2 - 20
-        s.blit(txt1, (x1, y))
-        x2 = (SCREEN_WIDTH - txt2.get_width())/2
-        y += txt1.get_height() + 15
-        s.blit(txt2, (x2, y))
-        x3 = (SCREEN_WIDTH - txt3.get_width())/2
-        y += txt2.get_height() + 5
-        s.blit(txt3, (x3, y))
-
-        self.screen.blit(s, (0, 0))
+        self._draw_overlay(('main_menu',), lambda: self._build_menu(
+            ["Start (N)ew Game", "E(x)it"]))
 
     def render_pause_menu(self):
-        s = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pg.SRCALPHA)
-        s.fill((50, 50, 50, 120))
-
         self._draw_image_at("menu", 0, 0)
+        self._draw_overlay(('pause_menu',), lambda: self._build_menu(
+            ["(R)esume Game", "Start (N)ew Game", "E(x)it"]))
 
-        txt1 = self.title_font.render("get dem nuts", True,
-                                      WHITE_COLOR)
-        txt2 = self.stats_font.render("(R)esume Game", True,
-                                      WHITE_COLOR)
-        txt3 = self.stats_font.render("Start (N)ew Game", True,
-                                      WHITE_COLOR)
-        txt4 = self.stats_font.render("E(x)it", True,
-                                      WHITE_COLOR)
-
-        x1 = (SCREEN_WIDTH - txt1.get_width())/2
-        y = (SCREEN_HEIGHT - txt1.get_height() - txt2.get_height() -
-             txt3.get_height() - txt4.get_height())/2 - 20
-        s.blit(txt1, (x1, y))
-        x2 = (SCREEN_WIDTH - txt2.get_width())/2
-        y += txt1.get_height() + 15
-        s.blit(txt2, (x2, y))
-        x3 = (SCREEN_WIDTH - txt3.get_width())/2
-        y += txt2.get_height() + 5
-        s.blit(txt3, (x3, y))
-        x4 = (SCREEN_WIDTH - txt4.get_width())/2
-        y += txt3.get_height() + 5
-        s.blit(txt4, (x4, y))
-
-        self.screen.blit(s, (0, 0))
-
-    def _move_in_direction(self, pos, direction):
-        x, y = pos.x, pos.y
-        if direction == Direction.UP:
-            y -= 1
-        elif direction == Direction.DOWN:
-            y += 1
-        elif direction == Direction.LEFT:
-            x -= 1
-        elif direction == Direction.RIGHT:
-            x += 1
-        x = max(0, min(self.world.WIDTH_TILES - 1, x))
-        y = max(0, min(self.world.HEIGHT_TILES - 1, y))
-        return Point(x, y)
-
-    def move(self, key):
-        self.new_pos = self._move_in_direction(self.new_pos, key)
-
-    def face(self, key):
-        self.world.squirrel.facing = key
-
-    def rotate(self, direction):
-        # TODO: fix spritesheet and enum order to allow
-        # this to be done with modular arithmetic.
-        if direction == Rotation.Clockwise:
-            rmap = {
-                Direction.DOWN: Direction.LEFT,
-                Direction.LEFT: Direction.UP,
-                Direction.UP: Direction.RIGHT,
-                Direction.RIGHT: Direction.DOWN,
-            }
-        elif direction == Rotation.CounterClockwise:
-            rmap = {
-                Direction.DOWN: Direction.RIGHT,
-                Direction.RIGHT: Direction.UP,
-                Direction.UP: Direction.LEFT,
-                Direction.LEFT: Direction.DOWN,
-            }
-        self.world.squirrel.facing = rmap[self.world.squirrel.facing]
-
-    def _facing(self):
-        facingx, facingy = self.world.squirrel.pos.x, self.world.squirrel.pos.y
-        if self.world.squirrel.facing == Direction.UP:
-            return facingx, facingy-1
-        elif self.world.squirrel.facing == Direction.DOWN:
-            return facingx, facingy+1
-        elif self.world.squirrel.facing == Direction.LEFT:
-            return facingx-1, facingy
-        elif self.world.squirrel.facing == Direction.RIGHT:
-            return facingx+1, facingy
-
-    def action(self, action):
-        facingx, facingy = self._facing()
-        facing = Point(facingx, facingy)
-        if action == Action.SPACE:
-            nut = self.world.is_nut(facing)
-            if nut is not None and nut.state == Nut.NutState.ACTIVE:
-                self.stats.nuts_eaten += 1
-                self.world.squirrel.set_energy(
-                    self.world.squirrel.energy + nut.energy)
-                del self.world.nuts[nut.id]
-        elif action == Action.C and self.world.is_tree(facing) == \
-                self.world.is_tree(self.world.squirrel.pos):
-            if self.world.squirrel.is_carrying_nut() \
-                    and self.world.can_bury_nut(facing):
-                nut = self.world.squirrel.carrying_nut
-                nut.pos = facing
-                nut.state = Nut.NutState.BURIED
-                self.stats.nuts_buried.add(nut.id)
-                self.world.nuts[nut.id] = nut
-                self.world.squirrel.carrying_nut = None
-            else:
-                nut = self.world.is_nut(facing)
-                if nut is not None \
-                        and not self.world.squirrel.is_carrying_nut():
-                    if nut.state == Nut.NutState.ACTIVE:
-                        self.world.squirrel.carrying_nut = nut
-                        del self.world.nuts[nut.id]
-                    elif nut.state == Nut.NutState.BURIED:
-                        nut.state = Nut.NutState.ACTIVE
-        elif action == Action.F:
-            if facingx >= 0 and facingy >= 0 \
-                    and facingx < self.world.WIDTH_TILES \
-                    and facingy < self.world.HEIGHT_TILES:
-                self.world.GROUND_LAYER[facingy][facingx]['tileidx'] = \
-                    random.randint(0, self.N_GROUND_TILES-1)
-
-    def tick(self):
-        # If we're moving in a cardinal direction, face that way
-        if self.new_pos.x != self.world.squirrel.pos.x \
-                and self.new_pos.y == self.world.squirrel.pos.y:
-            self.world.squirrel.facing = Direction.LEFT \
-                if self.new_pos.x < self.world.squirrel.pos.x \
-                else Direction.RIGHT
-        elif self.new_pos.y != self.world.squirrel.pos.y \
-                and self.new_pos.x == self.world.squirrel.pos.x:
-            self.world.squirrel.facing = Direction.UP \
-                if self.new_pos.y < self.world.squirrel.pos.y \
-                else Direction.DOWN
-
-        if self.world.can_move_to(self.new_pos):
-            energy_cost = pdist(self.new_pos, self.world.squirrel.pos) * \
-                self.ENERGY_LOSS_MULTIPLIER
-            self.world.squirrel.set_energy(
-                self.world.squirrel.energy - energy_cost)
-            self.world.squirrel.pos = self.new_pos
-        else:
-            self.new_pos = self.world.squirrel.pos
-
-        if self.world.squirrel.energy <= 0:
-            self.over("You ran out of energy!")
-
-    def over(self, message):
-        self._game_over_message = message
-        self.state = GameState.OVER
+    def _build_menu(self, options):
+        s = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pg.SRCALPHA)
+        s.fill((50, 50, 50, 120))
 
+        title = self.render_text(self.title_font, "get dem nuts")
+        lines = [self.render_text(self.stats_font, option)
+                 for option in options]
 
-class ScheduledEvent:
-    def __init__(self, action, period):
-        self.action = action
-        self.period = period
-        self.last_timestamp = GameTime.current_time_ms()
+        y = (SCREEN_HEIGHT - title.get_height() -
+             sum(txt.get_height() for txt in lines))/2 - 20
+        s.blit(title, ((SCREEN_WIDTH - title.get_width())/2, y))
+        y += title.get_height() + 15
+        for txt in lines:
+            s.blit(txt, ((SCREEN_WIDTH - txt.get_width())/2, y))
+            y += txt.get_height() + 5
+        return s
 
 
 def main():
+    parser = argparse.ArgumentParser(description="get dem nuts")
+    parser.add_argument(
+        '--profile', metavar='PATH',
+        help="write per-frame stage timings to PATH (.json or .csv) on exit")
+    parser.add_argument(
+        '--seed', type=int,
+        help="seed the game's random number generator")
+    parser.add_argument(
+        '--record', metavar='PATH',
+        help="record the game's inputs and frame times to PATH")
+    parser.add_argument(
+        '--replay', metavar='PATH',
+        help="replay a recording made with --record")
+    parser.add_argument(
+        '--map', metavar='PATH',
+        help="play on a map file made with mapfile.py or mapgen.py")
+    parser.add_argument(
+        '--generate', type=parse_size, metavar='WxH',
+        help="play on a procedurally generated map of this size")
+    parser.add_argument(
+        '--density', type=float, default=0.1,
+        help="fraction of a generated map covered by trees (default: 0.1)")
+    parser.add_argument(
+        '--map-seed', type=int, default=0,
+        help="seed for the generated map (default: 0)")
+    parser.add_argument(
+        '--dirty-rects', action='store_true',
+        help="only redraw the parts of the screen that change each frame")
+    args = parser.parse_args()
+    if args.map is not None and args.generate is not None:
+        parser.error("--map and --generate can't be used together")
+    game_map = args.map
+    if args.generate is not None:
+        (width, height) = args.generate
+        game_map = generate_map(width, height, seed=args.map_seed,
+                                density=args.density)
+
     pg.init()
     pg.font.init()
 
@@ -763,26 +715,74 @@ def main():
 
     pg.display.set_caption('get dem nuts')
 
-    game = Game(screen)
-    game.load_assets()
+    player = None
+    if args.replay is not None:
+        player = Player(args.replay)
+        game = player.new_game(game_map)
+    else:
+        game = Game(seed=args.seed, map_path=game_map)
+    recorder = None
+    if args.record is not None:
+        recorder = Recorder(args.record, game)
+    if args.record is None and args.replay is None:
+        game.npc_tick_budget_ms = NPC_TICK_BUDGET_MS
+        game.paths = PathService(game)
+
+    renderer = Renderer(game, screen)
+    renderer.dirty_rects = args.dirty_rects
+    renderer.load_assets()
+
+    profiler = FrameProfiler(record=args.profile is not None)
+    game.profiler = profiler
+    renderer.profiler = profiler
+
+    if player is not None:
+        replay_controller = ReplayController(player)
+        controllers: Dict[GameState, Controller] = \
+            {state: replay_controller for state in GameState}
+    else:
+        controllers = {
+            GameState.NOT_STARTED: MainMenuController(),
+            GameState.STARTED: GameController(),
+            GameState.PAUSED: PauseMenuController(),
+            GameState.OVER: GameOverController(),
+        }
 
     doquit = False
     while not doquit:
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                doquit = True
-            if game.controllers[game.state].handle(event, game):
-                doquit = True
-                break
-
-        game.controllers[game.state].tick(game, clock)
-
-        game.render()
+        with profiler.stage("frame"):
+            with profiler.stage("input"):
+                for event in pg.event.get():
+                    if event.type == pg.QUIT:
+                        doquit = True
+                    if event.type == pg.VIDEORESIZE:
+                        renderer.fit_display()
+                    if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                        renderer.show_profiler = not renderer.show_profiler
+                        continue
+                    if controllers[game.state].handle(event, game):
+                        doquit = True
+                        break
+
+            with profiler.stage("update"):
+                controllers[game.state].tick(game, clock)
+
+            renderer.render()
+        profiler.end_frame()
 
         clock.tick(30)
 
     pg.quit()
 
+    if recorder is not None:
+        recorder.close()
+    if game.paths is not None:
+        game.paths.close()
+    if args.profile is not None:
+        profiler.dump(args.profile)
+
 
 if __name__ == '__main__':
+    # The path service's worker processes re-run this module when frozen.
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,157 @@
+"""A binary map format that can be memory-mapped.
+
+A map file is a header followed by one section after another:
+
+* the terrain, one map character per cell, row by row;
+* the tree mask, one byte per cell, 1 where there is a tree;
+* if the header's HAS_GROUND flag is set, the ground tile variant of each
+  cell, one byte per cell;
+* the spawn points, each a pair of little-endian uint32 coordinates. The
+  first is where the player starts.
+
+load_map() maps the file rather than reading it, so even a huge map opens
+at once and the OS only pages in what is used. Convert a text map (rows of
+'.' and '#', like map.py's) with::
+
+    python -m mapfile map.txt map.gdnm --spawn 23,22
+"""
+import argparse
+import mmap
+import random
+import struct
+from typing import List, Optional, Sequence
+
+from geometry import Point
+from terrain import Terrain, random_ground
+
+
+MAGIC = b'GDNM'
+VERSION = 1
+
+# Flags.
+HAS_GROUND = 1
+
+_HEADER = struct.Struct('<4sBBxxIII')
+_SPAWN = struct.Struct('<II')
+
+
+class GameMap:
+    """A map loaded with load_map(): its terrain, plus the ground tile
+    variants if it has them and its spawn points.
+    """
+
+    def __init__(self, terrain: Terrain, ground=None,
+                 spawns: Sequence[Point] = ()):
+        self.terrain = terrain
+        self.ground = ground
+        self.spawns: List[Point] = list(spawns)
+
+
+def save_map(path, terrain: Terrain, ground=None,
+             spawns: Sequence[Point] = ()):
+    """Writes a map file."""
+    flags = HAS_GROUND if ground is not None else 0
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, flags, terrain.width,
+                             terrain.height, len(spawns)))
+        f.write(terrain.cells)
+        f.write(terrain.trees)
+        if ground is not None:
+            if len(ground) != len(terrain.cells):
+                raise ValueError(
+                    f"{terrain.width}x{terrain.height} map needs "
+                    f"{len(terrain.cells)} ground tiles, got {len(ground)}")
+            f.write(ground)
+        for spawn in spawns:
+            f.write(_SPAWN.pack(spawn.x, spawn.y))
+
+
+def load_map(path, copy_on_write=False) -> GameMap:
+    """Opens a map file. The terrain, tree mask and ground of the returned
+    map are views of the mapped file: read-only, or if ``copy_on_write``,
+    writable, with each page copied into memory the first time it is
+    written and the file itself left untouched.
+    """
+    access = mmap.ACCESS_COPY if copy_on_write else mmap.ACCESS_READ
+    with open(path, 'rb') as f:
+        try:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=access))
+        except ValueError:
+            # An empty file can't be mapped.
+            raise ValueError(f"{path} is not a map") from None
+    if len(data) < _HEADER.size:
+        raise ValueError(f"{path} is not a map")
+    (magic, version, flags, width, height, nspawns) = \
+        _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a map")
+    if version != VERSION:
+        raise ValueError(
+            f"{path} is a version {version} map, expected version {VERSION}")
+    ncells = width * height
+    nlayers = 3 if flags & HAS_GROUND else 2
+    size = _HEADER.size + nlayers * ncells + nspawns * _SPAWN.size
+    if len(data) != size:
+        raise ValueError(
+            f"Corrupt map {path}: expected {size} bytes, got {len(data)}")
+
+    offset = _HEADER.size
+    cells = data[offset:offset + ncells]
+    offset += ncells
+    trees = data[offset:offset + ncells]
+    offset += ncells
+    ground = None
+    if flags & HAS_GROUND:
+        ground = data[offset:offset + ncells]
+        offset += ncells
+    spawns = [Point(*_SPAWN.unpack_from(data, offset + i * _SPAWN.size))
+              for i in range(nspawns)]
+    return GameMap(Terrain(width, height, cells, trees), ground, spawns)
+
+
+def read_text_map(path) -> Terrain:
+    with open(path) as f:
+        return Terrain.from_rows(f.read().strip().splitlines())
+
+
+def _point(text):
+    (x, y) = text.split(',')
+    return Point(int(x), int(y))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="convert a text map to a binary map file")
+    parser.add_argument(
+        'src', nargs='?',
+        help="text map, rows of '.' and '#' (default: the built-in map)")
+    parser.add_argument('dst', help="map file to write")
+    parser.add_argument(
+        '--spawn', type=_point, action='append', default=[], metavar='X,Y',
+        help="add a spawn point; the first is where the player starts")
+    parser.add_argument(
+        '--ground-tiles', type=int, metavar='N',
+        help="store random ground tile variants below N in the map")
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help="seed for the ground tile variants")
+    args = parser.parse_args()
+
+    if args.src is None:
+        from map import MAP
+        terrain = Terrain.from_rows(MAP)
+    else:
+        terrain = read_text_map(args.src)
+    for spawn in args.spawn:
+        if not (0 <= spawn.x < terrain.width
+                and 0 <= spawn.y < terrain.height):
+            parser.error(f"spawn point {spawn.x},{spawn.y} is off the map")
+    ground: Optional[bytearray] = None
+    if args.ground_tiles is not None:
+        ground = random_ground(len(terrain.cells), args.ground_tiles,
+                               random.Random(args.seed))
+    save_map(args.dst, terrain, ground, args.spawn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Seeded procedural maps, for testing at scale.
+
+generate_map() scatters round clusters of trees, like the hand-drawn ones in
+map.py, over an open map. Each cluster is written a row at a time with
+bytearray slice assignment, so even a 10000x10000 map only takes a few
+seconds. The same arguments always give the same map.
+
+Write a generated map to a file with::
+
+    python -m mapgen forest.gdnm --size 2000x2000 --density 0.15 --seed 1
+
+or play on one directly with ``python -m main --generate 2000x2000``.
+"""
+import argparse
+import math
+import random
+import struct
+from typing import List, Tuple
+
+from geometry import Point
+from mapfile import GameMap, save_map
+from terrain import GROUND, TREE, Terrain, random_ground
+
+
+def _spans(radius) -> List[Tuple[int, int]]:
+    # The rows of a cluster of ``radius`` as (dy, half width) pairs.
+    return [(dy, int(math.sqrt((radius + 0.5)**2 - dy*dy)))
+            for dy in range(-radius, radius + 1)]
+
+
+def generate_map(width, height, seed=0, density=0.1, min_radius=1,
+                 max_radius=3) -> GameMap:
+    """Returns a ``width`` x ``height`` map on which roughly ``density`` of
+    the cells are trees, in clusters of ``min_radius`` to ``max_radius``
+    tiles. The player spawns in the middle, which is always clear.
+    """
+    if width <= 0 or height <= 0:
+        raise ValueError(f"can't generate a {width}x{height} map")
+    if not 0 <= density < 1:
+        raise ValueError(f"tree density must be in [0, 1), not {density}")
+    if not 0 <= min_radius <= max_radius:
+        raise ValueError(
+            f"bad cluster radii {min_radius} to {max_radius}")
+    rng = random.Random(seed)
+    ncells = width * height
+    cells = bytearray(GROUND, 'ascii') * ncells
+    trees = bytearray(TREE, 'ascii') * width
+
+    # Each cluster's rows as (offset of its start from the centre cell,
+    # row of trees), and the same as (dy, half width) for the edges.
+    spans = [_spans(r) for r in range(min_radius, max_radius + 1)]
+    rows = [[(dy * width - half, trees[:2 * half + 1])
+             for (dy, half) in cluster] for cluster in spans]
+    mean_area = sum(2 * half + 1 for cluster in spans
+                    for (_, half) in cluster) / len(spans)
+    # Clusters overlap, so for the trees to cover ``density`` of the map in
+    # expectation the clusters have to cover more than that between them.
+    nclusters = round(-math.log(1 - density) * ncells / mean_area)
+    # Draw three 32-bit numbers per cluster at once, for its centre and
+    # size, rather than make millions of calls into the rng.
+    nbytes = 12 * nclusters
+    # getrandbits(0) is an error before Python 3.9.
+    noise = rng.getrandbits(8 * nbytes).to_bytes(nbytes, 'little') \
+        if nbytes else b''
+    for (a, b, c) in struct.iter_unpack('<III', noise):
+        cx, cy, size = a % width, b % height, c % len(spans)
+        if max_radius <= cx < width - max_radius \
+                and max_radius <= cy < height - max_radius:
+            centre = cy * width + cx
+            for (offset, row) in rows[size]:
+                start = centre + offset
+                cells[start:start + len(row)] = row
+            continue
+        for (dy, half) in spans[size]:
+            y = cy + dy
+            if 0 <= y < height:
+                x0, x1 = max(0, cx - half), min(width, cx + half + 1)
+                cells[y * width + x0:y * width + x1] = trees[:x1 - x0]
+
+    spawn = Point(width // 2, height // 2)
+    cells[spawn.y * width + spawn.x] = ord(GROUND)
+    return GameMap(Terrain(width, height, cells), None, [spawn])
+
+
+def parse_size(text) -> Tuple[int, int]:
+    """Parses a map size given as WIDTHxHEIGHT."""
+    (width, height) = text.lower().split('x')
+    return (int(width), int(height))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate a map file")
+    parser.add_argument('dst', help="map file to write")
+    parser.add_argument(
+        '--size', type=parse_size, default=(1000, 1000), metavar='WxH',
+        help="map size in tiles (default: 1000x1000)")
+    parser.add_argument(
+        '--density', type=float, default=0.1,
+        help="fraction of the map covered by trees (default: 0.1)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--ground-tiles', type=int, metavar='N',
+        help="store random ground tile variants below N in the map")
+    args = parser.parse_args()
+
+    (width, height) = args.size
+    game_map = generate_map(width, height, seed=args.seed,
+                            density=args.density)
+    ground = None
+    if args.ground_tiles is not None:
+        ground = random_ground(len(game_map.terrain.cells),
+                               args.ground_tiles, random.Random(args.seed))
+    save_map(args.dst, game_map.terrain, ground, game_map.spawns)
+
+
+if __name__ == '__main__':
+    main()
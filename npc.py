@@ -1,20 +1,168 @@
-import random
-
 from astar import find_path_astar
 from character import Character
 from geometry import Direction, Point
+from hpa import HierarchicalPathfinder
 
 
 class NPC(Character):
     def __init__(self, game, pos, facing):
+        # The crowd.NPCArrays holding our position, facing and state, if
+        # any, and our slot in it. While we are in one, our position and
+        # facing are read from it.
+        self.arrays = None
+        self.slot = None
+        self._state = None
         super().__init__(game, pos, facing)
+        # Cached route towards _route_goal, reversed so that the next step
+        # is route[-1]. It is only valid while we are still standing at
+        # _route_origin, i.e. we have only moved along it.
+        self._route = None
+        self._route_goal = None
+        self._route_origin = None
+        # Set by lod.LevelOfDetail while we are far from the player; we
+        # then step in straight lines rather than planning paths.
+        self.coarse = False
+        # The pathservice.PathRequest we are waiting on, if any.
+        self._path_request = None
+
+    @property
+    def pos(self):
+        arrays = self.arrays
+        if arrays is not None and arrays.stale[self.slot]:
+            # Moved by a vectorized walk since we last looked.
+            self._pos = arrays.point(self.slot)
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos):
+        self._pos = pos
+        if self.arrays is not None:
+            self.arrays.moved(self.slot, pos)
+
+    @property
+    def facing(self):
+        if self.arrays is not None:
+            return self.arrays.direction(self.slot)
+        return self._facing
+
+    @facing.setter
+    def facing(self, facing):
+        self._facing = facing
+        if self.arrays is not None:
+            self.arrays.facing[self.slot] = facing.value
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        self._state = state
+        if self.arrays is not None:
+            self.arrays.state[self.slot] = state.value
+
+    def move_to(self, dst):
+        super().move_to(dst)
+        route = self._route
+        if route and route[-1] == dst:
+            route.pop()
+            self._route_origin = dst
 
     def move_randomly(self):
-        self.facing = Direction(random.randint(1, 4))
+        self.facing = Direction(self.game.rng.randint(1, 4))
         new_pos = self.game._move_in_direction(self.pos, self.facing)
         if self.can_move_to(new_pos):
-            self.pos = new_pos
+            self.game.world.move_character(self, new_pos)
 
     def find_path_astar(self, dst, within=0):
-        return find_path_astar(self.game.world.MAP, self.pos, dst, self,
-                               within)
+        """Returns a path to within ``within`` of ``dst``, or None. Long
+        paths are found hierarchically (see hpa.py).
+        """
+        world = self.game.world
+        if max(abs(dst.x - self.pos.x), abs(dst.y - self.pos.y)) >= \
+                HierarchicalPathfinder.MIN_DISTANCE:
+            return world.pathfinder(type(self)).find_path(
+                self.pos, dst, lambda x, y: self.can_move_to(Point(x, y)),
+                within)
+        return find_path_astar(world.terrain, self.pos, dst, self, within)
+
+    def next_step(self, dst, within=0):
+        """Returns the next position on a path to within ``within`` of
+        ``dst``, our own position if we are already there, or None if
+        there is no path.
+
+        The path is planned once and then followed; it is only replanned
+        when the destination changes, we have been moved off it, or its
+        next step has become blocked. If the game has a PathService the
+        planning happens there, and until it is done we keep to the old
+        route if we can or else head straight for ``dst``.
+        """
+        if self.coarse:
+            return self.straight_step(dst, within)
+        route = self._route
+        if route is None or self._route_goal != (dst, within) \
+                or self._route_origin != self.pos \
+                or (route and not self.can_move_to(route[-1])):
+            paths = getattr(self.game, 'paths', None)
+            if paths is not None:
+                return self._next_step_async(paths, dst, within)
+            path = self.find_path_astar(dst, within)
+            if path is None:
+                self._route = None
+                return None
+            route = self._set_route(path, dst, within)
+        return route[-1] if route else self.pos
+
+    def _set_route(self, path, dst, within):
+        self._route = path[:0:-1]
+        self._route_goal = (dst, within)
+        self._route_origin = self.pos
+        return self._route
+
+    def _next_step_async(self, paths, dst, within, replan=True):
+        request = self._path_request
+        if request is None or request.goal != (dst, within):
+            if request is not None:
+                # Don't leave the worker busy with a path we no longer want.
+                request.cancel()
+            request = self._path_request = paths.request(self, dst, within)
+        if not request.done():
+            route = self._route
+            if route and self._route_origin == self.pos \
+                    and self.can_move_to(route[-1]):
+                return route[-1]
+            return self.straight_step(dst, within)
+
+        self._path_request = None
+        path = request.result()
+        if path is None:
+            self._route = None
+            return None
+        if self.pos in path:
+            route = self._set_route(path[path.index(self.pos):], dst, within)
+            if not route or self.can_move_to(route[-1]):
+                return route[-1] if route else self.pos
+        # We have wandered off the path while waiting for it, or its next
+        # step has been blocked since it was planned. Ask again, but only
+        # once, in case the new path is no better.
+        self._route = None
+        if replan:
+            return self._next_step_async(paths, dst, within, False)
+        return self.straight_step(dst, within)
+
+    def straight_step(self, dst, within=0):
+        """Like next_step(), but without pathfinding: returns a free
+        neighbour in the direction of ``dst``, preferring the diagonal, or
+        None if all are blocked.
+        """
+        dx, dy = dst.x - self.pos.x, dst.y - self.pos.y
+        if dx*dx + dy*dy <= within*within:
+            return self.pos
+        sx = (dx > 0) - (dx < 0)
+        sy = (dy > 0) - (dy < 0)
+        for (mx, my) in [(sx, sy), (sx, 0), (0, sy)]:
+            if mx or my:
+                step = Point(self.pos.x + mx, self.pos.y + my)
+                if self.can_move_to(step):
+                    return step
+        return None
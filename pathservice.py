@@ -0,0 +1,174 @@
+"""Asynchronous pathfinding on a pool of worker processes.
+
+NPCs hand their path queries to a PathService, which searches on a worker
+and returns a future; the NPC polls it on later ticks and makes do with a
+straight-line step meanwhile (see NPC.next_step). Since results arrive
+whenever the workers finish, a game using a PathService depends on the
+machine's speed and can't be reproduced from its seed and inputs.
+
+The workers are handed the world's terrain once, when they start: they map
+its file themselves if it has one. Each request then only carries the
+cells that characters and nuts occupy at the time. As NPC.find_path_astar
+does, workers plan long paths hierarchically, each keeping a
+HierarchicalPathfinder per kind of character for as long as the terrain
+is unchanged.
+"""
+import concurrent.futures
+import os
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from astar import find_path_bounded
+from geometry import Point
+from hpa import HierarchicalPathfinder
+from mapfile import load_map
+from terrain import Terrain
+
+
+# In each worker: the token of the world it was started for, that world's
+# terrain, and its hierarchical pathfinders by impassable terrain.
+_worker_state: Tuple[int, Optional[Terrain],
+                     Dict[str, HierarchicalPathfinder]] = (0, None, {})
+
+
+def _init_worker(token: int, terrain) -> None:
+    # ``terrain`` is a Terrain, the path of a map file, or the (width,
+    # height, cells) to build one from.
+    global _worker_state
+    if isinstance(terrain, str):
+        terrain = load_map(terrain).terrain
+    elif not isinstance(terrain, Terrain):
+        terrain = Terrain(*terrain)
+    _worker_state = (token, terrain, {})
+
+
+def _search(token: int, impassable: str, occupied: FrozenSet[int],
+            src: Tuple[int, int], dst: Tuple[int, int],
+            within: int) -> Optional[List[Tuple[int, int]]]:
+    # Runs on a worker; takes and returns only plain data.
+    (worker_token, terrain, pathfinders) = _worker_state
+    if worker_token != token or terrain is None:
+        # A request for a world that has since been replaced.
+        return None
+    width, height = terrain.width, terrain.height
+    pathfinder = pathfinders.get(impassable)
+    if pathfinder is None:
+        pathfinder = pathfinders[impassable] = HierarchicalPathfinder(
+            width, height, terrain.mask(impassable))
+    blocked = pathfinder.blocked
+
+    def passable(x: int, y: int) -> bool:
+        cell = y * width + x
+        return not blocked[cell] and cell not in occupied
+    (src_point, dst_point) = (Point(*src), Point(*dst))
+    if max(abs(dst[0] - src[0]), abs(dst[1] - src[1])) >= \
+            HierarchicalPathfinder.MIN_DISTANCE:
+        path = pathfinder.find_path(src_point, dst_point, passable, within)
+    else:
+        path = find_path_bounded(passable, width, height, src_point,
+                                 dst_point, within)
+    if path is None:
+        return None
+    return [(p.x, p.y) for p in path]
+
+
+class PathRequest:
+    """A path search in flight from ``origin`` to within ``within`` of
+    ``dst``.
+    """
+
+    def __init__(self, origin, dst, within, future):
+        self.origin = origin
+        self.goal = (dst, within)
+        self.future = future
+
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        """Drops the search if no worker has started it yet."""
+        self.future.cancel()
+
+    def result(self) -> Optional[List[Point]]:
+        path = self.future.result()
+        if path is None:
+            return None
+        return [Point(x, y) for (x, y) in path]
+
+
+class PathService:
+    def __init__(self, game, workers=1, processes=True):
+        self.game = game
+        self.workers = workers
+        self.processes = processes
+        self.executor: Optional[concurrent.futures.Executor] = None
+        # The world and terrain version the executor's workers were started
+        # for, and a token naming them.
+        self._world = None
+        self._terrain_version = -1
+        self._token = 0
+        # Searches not yet finished, to cancel on close().
+        self._pending: Set[concurrent.futures.Future] = set()
+        # The occupied cells this frame, once a request has needed them.
+        self._occupied: Optional[FrozenSet[int]] = None
+
+    def new_frame(self):
+        """Forgets the occupied cells; call whenever the world may have
+        changed.
+        """
+        self._occupied = None
+
+    def _executor(self) -> concurrent.futures.Executor:
+        # Starts new workers whenever the world or its terrain has changed
+        # since the current ones were started.
+        world = self.game.world
+        if self.executor is not None \
+                and world.terrain_version == self._terrain_version \
+                and world is self._world:
+            return self.executor
+        self._shutdown(wait=False)
+        self._world = world
+        self._terrain_version = world.terrain_version
+        self._token += 1
+        terrain = world.terrain
+        if self.processes:
+            # Worker processes can't share our terrain, so have them map
+            # the file if it is unchanged, or else send them a copy.
+            source: object
+            if world.map_path is not None and world.terrain_version == 0:
+                source = os.fspath(world.map_path)
+            else:
+                source = (terrain.width, terrain.height, bytes(terrain.cells))
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=_init_worker,
+                initargs=(self._token, source))
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                self.workers, initializer=_init_worker,
+                initargs=(self._token, terrain))
+        return self.executor
+
+    def request(self, character, dst, within=0) -> PathRequest:
+        """Starts a search for a path for ``character`` from where it
+        stands to within ``within`` of ``dst``, through the cells it can
+        move to now.
+        """
+        executor = self._executor()
+        if self._occupied is None:
+            self._occupied = frozenset(self.game.world.blocked_cells())
+        src = character.pos
+        future = executor.submit(
+            _search, self._token, type(character).IMPASSABLE_TERRAIN,
+            self._occupied, (src.x, src.y), (dst.x, dst.y), within)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        return PathRequest(src, dst, within, future)
+
+    def _shutdown(self, wait):
+        for future in list(self._pending):
+            future.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+    def close(self):
+        self._shutdown(wait=True)
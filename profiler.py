@@ -0,0 +1,124 @@
+import collections
+import contextlib
+import csv
+import json
+import math
+import time
+from typing import Deque, Dict, List, Union
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        current = self.profiler.current
+        current[self.name] = current.get(self.name, 0.0) + elapsed_ms
+        return False
+
+
+class FrameProfiler:
+    """Times named stages of each frame.
+
+    Wrap each stage in ``with profiler.stage(name):`` and call end_frame()
+    once per frame. Time spent in a stage entered several times in a frame
+    is summed, and stages may nest (e.g. "foxes" inside "events"). The
+    last ``window`` frames are kept for rolling percentiles; if ``record``
+    is set every frame is also kept so that it can be dumped with dump().
+    """
+
+    STAGES = ["frame", "input", "update", "events", "squirrels", "foxes",
+              "tick", "render", "scale", "display"]
+    PERCENTILES = [50, 95, 99]
+
+    def __init__(self, window=300, record=False):
+        self.window: Deque[Dict[str, float]] = \
+            collections.deque(maxlen=window)
+        self.record = record
+        self.frames: List[Dict[str, float]] = []
+        self.current: Dict[str, float] = {}
+        self._stages: Dict[str, _Stage] = {}
+
+    def stage(self, name):
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(self, name)
+        return stage
+
+    def end_frame(self):
+        self.window.append(self.current)
+        if self.record:
+            self.frames.append(self.current)
+        self.current = {}
+
+    def stage_names(self, frames):
+        names = [name for name in self.STAGES
+                 if any(name in frame for frame in frames)]
+        extra = {name for frame in frames for name in frame} - set(names)
+        return names + sorted(extra)
+
+    def percentiles(self, name):
+        """Returns the PERCENTILES of the stage's time, in milliseconds,
+        over the rolling window; frames that skipped the stage count as
+        zero.
+        """
+        samples = sorted(frame.get(name, 0.0) for frame in self.window)
+        if not samples:
+            return [0.0 for p in self.PERCENTILES]
+        # Nearest-rank percentiles.
+        return [samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+                for p in self.PERCENTILES]
+
+    def summary(self):
+        return {name: self.percentiles(name)
+                for name in self.stage_names(self.window)}
+
+    def dump(self, path):
+        """Writes every recorded frame to ``path``, as JSON if it ends in
+        .json and as CSV otherwise.
+        """
+        names = self.stage_names(self.frames)
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({
+                    'stages': names,
+                    'percentiles': self.PERCENTILES,
+                    'summary': self.summary(),
+                    'frames': self.frames,
+                }, f)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame'] + [f"{name}_ms" for name in names])
+                for (i, frame) in enumerate(self.frames):
+                    writer.writerow([i] + [f"{frame.get(name, 0.0):.4f}"
+                                           for name in names])
+
+
+class NullProfiler:
+    """A stand-in for FrameProfiler that measures nothing."""
+
+    PERCENTILES = FrameProfiler.PERCENTILES
+
+    _stage = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def end_frame(self):
+        pass
+
+    def summary(self) -> Dict[str, List[float]]:
+        return {}
+
+
+Profiler = Union[FrameProfiler, NullProfiler]
+
+NULL_PROFILER = NullProfiler()
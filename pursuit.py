@@ -0,0 +1,110 @@
+import heapq
+import math
+from typing import List, Optional
+
+from astar import COST_EPSILON, NEIGHBOUR_OFFSETS
+from geometry import Point
+
+
+class PursuitField:
+    """A Dijkstra map of path costs towards the player squirrel.
+
+    The field covers the square of cells within ``radius`` of the squirrel
+    and holds, for every cell a pursuer can stand on, the cost of the
+    cheapest path from there to within ``within`` of the squirrel. It is
+    built at most once per invalidate() and then simply descended by every
+    pursuer, so pursuit costs one search however many foxes are chasing.
+    """
+
+    # How far beyond the attack distance the field extends, so that short
+    # detours around trees are still found inside it.
+    MARGIN = 4
+
+    def __init__(self, game, character_cls, radius, within=1):
+        self.game = game
+        self.character_cls = character_cls
+        self.radius = radius
+        self.within = within
+        self.size = 2 * radius + 1
+        self._dist: List[float] = []
+        self._target: Optional[Point] = None
+
+    def invalidate(self):
+        self._target = None
+
+    def _passable(self, x, y):
+        pos = Point(x, y)
+        return self.game.world.can_move_to(pos) \
+            and self.character_cls._can_move_to(self.game, pos)
+
+    def _build(self, target):
+        size, radius, within = self.size, self.radius, self.within
+        ox, oy = target.x - radius, target.y - radius
+        dist = [math.inf] * (size * size)
+        # None until probed, then whether the cell is passable.
+        passable: List[Optional[bool]] = [None] * (size * size)
+
+        fringe = []
+        for dy in range(-within, within + 1):
+            for dx in range(-within, within + 1):
+                if dx*dx + dy*dy > within*within:
+                    continue
+                idx = (radius + dy) * size + radius + dx
+                passable[idx] = self._passable(target.x + dx, target.y + dy)
+                if passable[idx]:
+                    dist[idx] = 0.0
+                    fringe.append((0.0, idx))
+        heapq.heapify(fringe)
+
+        while fringe:
+            (d, idx) = heapq.heappop(fringe)
+            if d > dist[idx]:
+                continue
+            x, y = idx % size, idx // size
+            for (dx, dy, step) in NEIGHBOUR_OFFSETS:
+                nx, ny = x + dx, y + dy
+                if nx < 0 or ny < 0 or nx >= size or ny >= size:
+                    continue
+                nidx = ny * size + nx
+                nd = d + step
+                if nd >= dist[nidx] - COST_EPSILON:
+                    continue
+                p = passable[nidx]
+                if p is None:
+                    p = passable[nidx] = self._passable(ox + nx, oy + ny)
+                if p:
+                    dist[nidx] = nd
+                    heapq.heappush(fringe, (nd, nidx))
+
+        self._dist = dist
+        self._target = target
+
+    def next_step(self, character) -> Optional[Point]:
+        """Returns the next position on a cheapest path from
+        ``character`` to the squirrel, its own position if it is already
+        within reach, or None if no path lies inside the field.
+        """
+        target = self.game.world.squirrel.pos
+        if self._target != target:
+            self._build(target)
+
+        pos: Point = character.pos
+        if (pos.x - target.x)**2 + (pos.y - target.y)**2 \
+                <= self.within * self.within:
+            return pos
+
+        size, dist = self.size, self._dist
+        ox, oy = target.x - self.radius, target.y - self.radius
+        best = None
+        best_cost = math.inf
+        for (dx, dy, step) in NEIGHBOUR_OFFSETS:
+            nx, ny = pos.x + dx - ox, pos.y + dy - oy
+            if nx < 0 or ny < 0 or nx >= size or ny >= size:
+                continue
+            cost = step + dist[ny * size + nx]
+            if cost < best_cost - COST_EPSILON:
+                best = (nx, ny)
+                best_cost = cost
+        if best is None:
+            return None
+        return Point(best[0] + ox, best[1] + oy)
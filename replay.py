@@ -0,0 +1,130 @@
+"""Recording and bit-exact playback of games.
+
+A recording holds a game's seed followed by every Game.input() and
+Game.step() made on it. Since all of a game's randomness comes from its
+seeded rng and all of its timing from the steps, feeding the same calls
+into a new Game with the same seed reproduces the game exactly.
+"""
+import struct
+
+from game import Game, Input
+from geometry import Direction
+
+
+MAGIC = b'GDNR'
+VERSION = 3
+
+_HEADER = struct.Struct('<4sBQ')
+# Records start with a one byte tag.
+_TAG_INPUT = 1
+_TAG_STEP = 2
+_TAG_LONG_STEP = 3
+_INPUT = struct.Struct('<BB')
+_STEP = struct.Struct('<BHB')
+_LONG_STEP = struct.Struct('<BIB')
+
+
+def _held_mask(held_directions):
+    mask = 0
+    for direction in held_directions:
+        mask |= 1 << (direction.value - 1)
+    return mask
+
+
+def _held_directions(mask):
+    # Directions are applied in the order the front end reads the keys.
+    return [direction for direction in Direction
+            if mask & (1 << (direction.value - 1))]
+
+
+class Recorder:
+    """Records every input and step made on ``game`` to ``path``."""
+
+    def __init__(self, path, game):
+        if not 0 <= game.seed < 2**64:
+            raise ValueError(f"Can't record a game with seed {game.seed}")
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, game.seed))
+        self.game = game
+        game.recorder = self
+
+    def input(self, player_input):
+        self._file.write(_INPUT.pack(_TAG_INPUT, player_input.value))
+
+    def step(self, time_delta_ms, held_directions):
+        if time_delta_ms != int(time_delta_ms) or time_delta_ms < 0:
+            raise ValueError(f"Can't record a step of {time_delta_ms} ms")
+        mask = _held_mask(held_directions)
+        if time_delta_ms <= 0xffff:
+            self._file.write(_STEP.pack(_TAG_STEP, time_delta_ms, mask))
+        else:
+            self._file.write(
+                _LONG_STEP.pack(_TAG_LONG_STEP, time_delta_ms, mask))
+
+    def close(self):
+        if self.game.recorder is self:
+            self.game.recorder = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class Player:
+    """Replays a recording made by Recorder."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = f.read()
+        if len(self._data) < _HEADER.size:
+            raise ValueError(f"{path} is not a recording")
+        (magic, version, self.seed) = _HEADER.unpack_from(self._data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        if version != VERSION:
+            raise ValueError(
+                f"{path} is a version {version} recording, "
+                f"expected version {VERSION}")
+        self._offset = _HEADER.size
+
+    def new_game(self, map_path=None):
+        """Returns a new game to replay into. A recording doesn't hold its
+        map, so a game recorded on a map file must be replayed on it too.
+        """
+        return Game(seed=self.seed, map_path=map_path)
+
+    def play_step(self, game):
+        """Replays the recorded inputs up to and including the next step
+        into ``game``. Returns False once the recording is exhausted.
+        """
+        data = self._data
+        while self._offset < len(data):
+            tag = data[self._offset]
+            if tag == _TAG_INPUT:
+                (_, value) = _INPUT.unpack_from(data, self._offset)
+                self._offset += _INPUT.size
+                game.input(Input(value))
+            elif tag in (_TAG_STEP, _TAG_LONG_STEP):
+                record = _STEP if tag == _TAG_STEP else _LONG_STEP
+                (_, time_delta_ms, mask) = record.unpack_from(data,
+                                                              self._offset)
+                self._offset += record.size
+                game.step(time_delta_ms, _held_directions(mask))
+                return True
+            else:
+                raise ValueError(f"Corrupt recording: unknown record {tag}")
+        return False
+
+    def play(self, game=None):
+        """Replays the whole recording, into a new game unless one is
+        given, and returns the game.
+        """
+        if game is None:
+            game = self.new_game()
+        while self.play_step(game):
+            pass
+        return game
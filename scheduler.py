@@ -0,0 +1,123 @@
+import heapq
+import itertools
+import time
+from typing import List, Optional, Tuple
+
+
+class ScheduledEvent:
+    """An action called as ``action(event, timestamp)`` every ``period``
+    milliseconds, or just once after ``period`` milliseconds if
+    ``one_shot``.
+
+    If the clock jumps past several periods at once, a ``catch_up`` event
+    fires once for every period missed, each time with the timestamp it
+    was due at. Otherwise the missed periods are coalesced into a single
+    call and the action can use ``last_timestamp`` to see how much time
+    has passed.
+    """
+
+    def __init__(self, action, period, current_timestamp,
+                 one_shot=False, catch_up=False):
+        self.action = action
+        self.period = period
+        self.last_timestamp = current_timestamp
+        self.one_shot = one_shot
+        self.catch_up = catch_up
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Runs ScheduledEvents against a GameTime clock.
+
+    Events are kept in a heap keyed on the time they are next due, so
+    run_due() only ever looks at events that are actually due.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._queue: List[Tuple[int, int, ScheduledEvent]] = []
+        self._counter = itertools.count()
+        self._running: Optional[ScheduledEvent] = None
+
+    def __len__(self):
+        return sum(1 for (_, _, event) in self._queue if not event.cancelled)
+
+    def schedule(self, action, period, one_shot=False, catch_up=False):
+        event = ScheduledEvent(action, period, self.clock.current_time_ms(),
+                               one_shot, catch_up)
+        self._push(event, event.last_timestamp + period)
+        return event
+
+    def _push(self, event, due):
+        heapq.heappush(self._queue, (due, next(self._counter), event))
+
+    def clear(self):
+        for (_, _, event) in self._queue:
+            event.cancel()
+        self._queue.clear()
+        if self._running is not None:
+            self._running.cancel()
+
+    def run_due(self):
+        current_timestamp = self.clock.current_time_ms()
+        queue = self._queue
+        # Like the rest of the game, an event is due once the clock has
+        # gone strictly past last_timestamp + period.
+        while queue and queue[0][0] < current_timestamp:
+            (due, _, event) = heapq.heappop(queue)
+            if event.cancelled:
+                continue
+            timestamp = due if event.catch_up else current_timestamp
+            self._running = event
+            try:
+                event.action(event, timestamp)
+            finally:
+                self._running = None
+            event.last_timestamp = timestamp
+            if event.one_shot or event.cancelled:
+                continue
+            self._push(event, timestamp + event.period)
+
+
+class StaggeredTicker:
+    """Ticks every item of a population once per ``period`` milliseconds,
+    spreading the ticks evenly over the period rather than running them
+    all at once.
+
+    Each run() calls ``tick(item, sweep, index)`` for the ``items[index]``
+    that have come due, where ``sweep`` counts the passes over the whole
+    population. If ``deadline`` (a time.perf_counter() value) is given,
+    run() stops once it has passed and the remaining ticks are carried
+    over to the next run(); a population that falls more than a whole
+    sweep behind skips the oldest ticks.
+    """
+
+    def __init__(self, name, items, tick, period, current_timestamp):
+        self.name = name
+        self.items = items
+        self.tick = tick
+        self.period = period
+        self._start = current_timestamp
+        self._size = len(items)
+        self._done = 0
+
+    def run(self, current_timestamp, deadline=None):
+        n = len(self.items)
+        if n != self._size:
+            # The population changed; start again from here.
+            self._start = current_timestamp
+            self._size = n
+            self._done = 0
+        if not n:
+            return
+        due = (current_timestamp - self._start) * n // self.period
+        self._done = max(self._done, due - n)
+        while self._done < due:
+            (sweep, index) = divmod(self._done, n)
+            self._done += 1
+            self.tick(self.items[index], sweep, index)
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
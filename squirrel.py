@@ -1,5 +1,4 @@
 import enum
-import random
 
 from geometry import Direction, Rotation
 from npc import NPC, find_path_astar
@@ -28,36 +27,37 @@ class Squirrel(NPC):
         self.energy = min(1000, max(0, energy))
 
     def _maybe_target_random_nut(self):
+        nuts = self.game.world.nuts
         if self.state == Squirrel.SquirrelState.RANDOM \
-                and self.game.world.active_nuts():
-            active_nuts = self.game.world.active_nuts()
-            p = random.random()
+                and nuts.count(Nut.NutState.ACTIVE):
+            p = self.game.rng.random()
             if p <= Squirrel.GET_NUT_PROBABILTY:
                 self.state = Squirrel.SquirrelState.GETTING_NUT
                 self.target_nut_id = \
-                    active_nuts[random.randrange(0, len(active_nuts))].id
+                    nuts.random(Nut.NutState.ACTIVE, self.game.rng).id
 
     def tick(self):
         self._maybe_target_random_nut()
         if self.state == Squirrel.SquirrelState.RANDOM:
             self.move_randomly()
         elif self.state == Squirrel.SquirrelState.GETTING_NUT:
-            target_nut = self.game.world.nuts.get(self.target_nut_id)
-            if target_nut is not None \
-                    and target_nut.state == Nut.NutState.ACTIVE:
-                path = self.find_path_astar(target_nut.pos, within=1)
-                if path is not None and len(path) > 1:
-                    new_pos = path[1]
-                    if self.can_move_to(new_pos):
-                        self.move_to(new_pos)
-                elif path is not None and len(path) == 1:
-                    self.face_towards(target_nut.pos)
-                    del self.game.world.nuts[self.target_nut_id]
-                    self.state = Squirrel.SquirrelState.RANDOM
-                else:
-                    self.state = Squirrel.SquirrelState.RANDOM
+            self._get_nut()
+
+    def _get_nut(self):
+        target_nut = self.game.world.nuts.get(self.target_nut_id)
+        if target_nut is not None \
+                and target_nut.state == Nut.NutState.ACTIVE:
+            step = self.next_step(target_nut.pos, within=1)
+            if step is not None and step != self.pos:
+                self.move_to(step)
+            elif step is not None:
+                self.face_towards(target_nut.pos)
+                self.game.world.remove_nut(target_nut)
+                self.state = Squirrel.SquirrelState.RANDOM
             else:
                 self.state = Squirrel.SquirrelState.RANDOM
+        else:
+            self.state = Squirrel.SquirrelState.RANDOM
 
     def is_carrying_nut(self):
         return self.carrying_nut is not None
@@ -0,0 +1,147 @@
+from typing import Dict, List, Optional, Sequence, Union
+
+
+GROUND = '.'
+TREE = '#'
+
+# Anything Terrain can hold its layers in, such as a view of a mapped file.
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class Terrain:
+    """A map's terrain, stored as one byte per cell.
+
+    Cell ``y * width + x`` holds the map character at (x, y), ``GROUND`` or
+    ``TREE``. Terrain supports ``terrain[y][x]`` like the list of strings
+    it replaces, but queries in bulk should go through mask() instead.
+    """
+
+    def __init__(self, width: int, height: int, cells,
+                 trees: Optional[Buffer] = None):
+        """``cells`` may be any buffer of bytes, such as a memoryview of a
+        mapped file; ``trees``, if given, is the precomputed tree mask.
+        """
+        if len(cells) != width * height:
+            raise ValueError(
+                f"{width}x{height} terrain needs {width * height} cells, "
+                f"got {len(cells)}")
+        self.width = width
+        self.height = height
+        self.cells = cells
+        self._masks: Dict[str, Buffer] = {}
+        if trees is not None:
+            self._masks[TREE] = trees
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[str]) -> 'Terrain':
+        """Returns the terrain of a map given as rows of characters."""
+        return cls(len(rows[0]), len(rows),
+                   bytearray(''.join(rows), 'ascii'))
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y) -> str:
+        start = y * self.width
+        return bytes(self.cells[start:start + self.width]).decode('ascii')
+
+    def rows(self) -> List[str]:
+        return [self[y] for y in range(self.height)]
+
+    def mask(self, chars: str) -> Buffer:
+        """Returns a byte per cell, 1 where it is one of ``chars`` and 0
+        elsewhere.
+        """
+        mask = self._masks.get(chars)
+        if mask is None:
+            mask = self._masks[chars] = self._translate(chars)
+        return mask
+
+    def _translate(self, chars, chunk_size=1 << 20) -> Buffer:
+        cells = self.cells
+        if not chars:
+            # Allocated without touching its pages, so even for a huge map
+            # this costs next to no memory until it is written.
+            return bytes(len(cells))
+        table = bytes(chr(c) in chars for c in range(256))
+        if not isinstance(cells, memoryview):
+            translated: bytes = cells.translate(table)
+            return translated
+        # A view of a mapped file: translate it a piece at a time rather
+        # than copy all of it into memory first.
+        mask = bytearray(len(cells))
+        for start in range(0, len(cells), chunk_size):
+            piece = cells[start:start + chunk_size]
+            mask[start:start + len(piece)] = bytes(piece).translate(table)
+        return mask
+
+    @property
+    def trees(self) -> Buffer:
+        return self.mask(TREE)
+
+    def set(self, x: int, y: int, char: str):
+        """Changes the map character at (x, y)."""
+        self.cells[y * self.width + x] = ord(char)
+        self._masks.clear()
+
+
+def _check_ntiles(ntiles):
+    if not 0 < ntiles <= 256:
+        raise ValueError(f"can't have {ntiles} ground tiles")
+
+
+def random_ground(ncells, ntiles, rng):
+    """Returns ``ncells`` random ground tile variants below ``ntiles``.
+
+    One random byte is drawn per cell and scaled down to a variant, so when
+    ``ntiles`` doesn't divide 256 some variants are very slightly more
+    common than others.
+    """
+    _check_ntiles(ntiles)
+    table = bytes(b * ntiles >> 8 for b in range(256))
+    if not ncells:
+        return bytearray()
+    noise = rng.getrandbits(8 * ncells).to_bytes(ncells, 'little')
+    return bytearray(noise.translate(table))
+
+
+_MASK64 = (1 << 64) - 1
+
+
+class HashedGround:
+    """Random ground tile variants below ``ntiles`` for ``ncells`` cells,
+    like random_ground() returns, but worked out from ``seed`` and the
+    cell's index whenever a cell is read rather than stored, so that they
+    take no memory however large the map is. Only cells that are written
+    are stored.
+    """
+
+    def __init__(self, ncells: int, ntiles: int, seed: int):
+        _check_ntiles(ntiles)
+        self.ncells = ncells
+        self.ntiles = ntiles
+        self.seed = seed
+        self._changed: Dict[int, int] = {}
+
+    def __len__(self):
+        return self.ncells
+
+    def __getitem__(self, cell: int) -> int:
+        tile = self._changed.get(cell)
+        if tile is not None:
+            return tile
+        if not 0 <= cell < self.ncells:
+            raise IndexError(cell)
+        # SplitMix64's output function, for a well-mixed byte per cell.
+        z = (self.seed + (cell + 1) * 0x9E3779B97F4A7C15) & _MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return ((z ^ (z >> 31)) & 0xFF) * self.ntiles >> 8
+
+    def __setitem__(self, cell: int, tile: int):
+        if not 0 <= cell < self.ncells:
+            raise IndexError(cell)
+        self._changed[cell] = tile
+
+    def __iter__(self):
+        return (self[cell] for cell in range(self.ncells))
@@ -1,7 +1,12 @@
+import concurrent.futures
+import threading
+
 import pytest
 
 from geometry import Point
-from astar import find_path_astar, successors
+import astar
+from astar import find_path_astar, search_grid, successors
+from terrain import Terrain
 from world import World
 
 
@@ -115,3 +120,65 @@ class TestAStar:
         assert path == [Point(7, 3), Point(6, 4), Point(5, 4), Point(4, 4),
                         Point(3, 4), Point(2, 4), Point(1, 4), Point(0, 5),
                         Point(1, 6), Point(2, 6), Point(3, 6), Point(4, 7)]
+
+    def test_find_path_astar_reuses_search_grid(self):
+        open_map = ['.....' for y in range(5)]
+        walled_map = [
+            '.....',
+            '.###.',
+            '.#.#.',
+            '.###.',
+            '.....',
+        ]
+        path = find_path_astar(walled_map, Point(2, 2), Point(4, 4), '#')
+        assert path is None
+        path = find_path_astar(open_map, Point(2, 2), Point(4, 4), '#')
+        assert path == [Point(2, 2), Point(3, 3), Point(4, 4)]
+        path = find_path_astar(walled_map, Point(0, 0), Point(4, 0), '#')
+        assert path == [Point(0, 0), Point(1, 0), Point(2, 0), Point(3, 0),
+                        Point(4, 0)]
+
+    def test_terrain(self):
+        walled_map = [
+            '.....',
+            '.###.',
+            '.#.#.',
+            '.###.',
+            '.....',
+        ]
+        terrain = Terrain.from_rows(walled_map)
+        assert successors(terrain, Point(0, 0), '#') == \
+            successors(walled_map, Point(0, 0), '#')
+        assert find_path_astar(terrain, Point(2, 2), Point(4, 4), '#') \
+            is None
+        assert find_path_astar(terrain, Point(0, 0), Point(4, 4), '#') == \
+            find_path_astar(walled_map, Point(0, 0), Point(4, 4), '#')
+
+    def test_large_maps_search_a_window(self, monkeypatch):
+        monkeypatch.setattr(astar, 'MAX_FULL_SEARCH_CELLS', 100)
+        monkeypatch.setattr(astar, 'SEARCH_WINDOW_MARGIN', 2)
+        rows = ['.' * 20 for y in range(20)]
+        # A wall between the two points with a gap 5 rows below them.
+        rows = [row[:10] + ('#' if y < 8 else '.') + row[11:]
+                for (y, row) in enumerate(rows)]
+        terrain = Terrain.from_rows(rows)
+        assert find_path_astar(terrain, Point(5, 2), Point(15, 2), '#') \
+            is None
+        path = find_path_astar(terrain, Point(5, 6), Point(15, 6), '#')
+        assert path[0] == Point(5, 6) and path[-1] == Point(15, 6)
+        assert all(4 <= p.y <= 8 for p in path)
+
+    def test_search_grid_cache(self, monkeypatch):
+        monkeypatch.setattr(astar, '_local', threading.local())
+        grid = search_grid(10, 10)
+        assert search_grid(10, 10) is grid
+        for size in range(1, astar.SEARCH_GRID_CACHE_SIZE + 1):
+            search_grid(size, 3)
+        assert search_grid(10, 10) is not grid
+        assert len(astar._search_grids()) == astar.SEARCH_GRID_CACHE_SIZE
+        big = astar.MAX_FULL_SEARCH_CELLS
+        assert search_grid(big, 2) is not search_grid(big, 2)
+
+        grid = search_grid(10, 10)
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            assert executor.submit(search_grid, 10, 10).result() is not grid
@@ -0,0 +1,37 @@
+import pytest
+
+from balance import game_class, run_batch, summarise
+from game import Game
+
+
+class TestBalance:
+    def test_game_class_overrides(self):
+        cls = game_class({'ENERGY_LOSS_PER_SEC': '12',
+                          'number_foxes_for_level': 'level * 3'})
+        game = cls(seed=0)
+        assert game.ENERGY_LOSS_PER_SEC == 12
+        game.level = 2
+        assert game.number_foxes_for_level() == 6
+        assert Game.number_foxes_for_level is not cls.number_foxes_for_level
+
+    def test_game_class_unknown_attribute(self):
+        with pytest.raises(ValueError):
+            game_class({'NO_SUCH_THING': '1'})
+
+    @pytest.mark.parametrize('policy', ['random', 'forager'])
+    def test_batch_is_deterministic(self, policy):
+        first = run_batch(3, policy, seed=5, workers=1, max_game_ms=60000)
+        second = run_batch(3, policy, seed=5, workers=1, max_game_ms=60000)
+        assert first == second
+        assert [result['seed'] for result in first] == [5, 6, 7]
+
+    def test_pool_matches_serial(self):
+        serial = run_batch(4, seed=1, workers=1, max_game_ms=30000)
+        pooled = run_batch(4, seed=1, workers=2, max_game_ms=30000)
+        assert serial == pooled
+
+    def test_summarise(self):
+        results = run_batch(4, seed=0, workers=1, max_game_ms=30000)
+        summary = summarise(results)
+        assert summary['games'] == 4
+        assert sum(summary['causes'].values()) == pytest.approx(1.0)
@@ -0,0 +1,130 @@
+import random
+
+import pytest
+
+from game import Game, GameState, Input
+from geometry import Direction, Point
+from nut import Nut
+from squirrel import Squirrel
+from world import World
+
+np = pytest.importorskip('numpy')
+
+
+def random_map(width, height, density, seed=0):
+    rng = random.Random(seed)
+    return [''.join('#' if rng.random() < density else '.'
+                    for x in range(width))
+            for y in range(height)]
+
+
+def crowded_game(nsquirrels=300, nfoxes=30, seed=0):
+    game = Game(seed=seed, npc_arrays=True)
+    game.world = World(random_map(30, 30, 0.1), 1, game.rng, True)
+    game._init_squirrels(nsquirrels)
+    game._init_foxes(nfoxes)
+    return game
+
+
+def occupancy(world):
+    squirrels = {}
+    for squirrel in world.squirrels + [world.squirrel]:
+        cell = world._cell(squirrel.pos)
+        squirrels[cell] = squirrels.get(cell, 0) + 1
+    return squirrels
+
+
+class TestNPCArrays:
+    def test_arrays_mirror_positions(self):
+        game = crowded_game()
+        world = game.world
+        for i in range(20):
+            game.tick_squirrels(None, 0)
+            game.tick_foxes(None, 0)
+        for arrays in [world.squirrel_arrays, world.fox_arrays]:
+            for npc in arrays.npcs:
+                assert (arrays.x[npc.slot], arrays.y[npc.slot]) == \
+                    (npc.pos.x, npc.pos.y)
+                assert arrays.facing[npc.slot] == npc.facing.value
+                assert arrays.state[npc.slot] == npc.state.value
+        assert world._squirrels_at == occupancy(world)
+
+    def test_objects_write_through(self):
+        game = crowded_game()
+        world = game.world
+        squirrel = world.squirrels[0]
+        arrays = world.squirrel_arrays
+        squirrel.state = Squirrel.SquirrelState.GETTING_NUT
+        assert arrays.states(Squirrel.SquirrelState.GETTING_NUT).tolist() \
+            == [npc is squirrel for npc in arrays.npcs]
+        squirrel.facing = Direction.LEFT
+        assert arrays.facing[squirrel.slot] == Direction.LEFT.value
+        dst = next(Point(x, y) for y in range(30) for x in range(30)
+                   if world.can_move_to(Point(x, y)))
+        world.move_character(squirrel, dst)
+        assert (arrays.x[squirrel.slot], arrays.y[squirrel.slot]) == \
+            (dst.x, dst.y)
+
+    def test_far_npcs_wander_less_often(self):
+        game = Game(seed=0, npc_arrays=True)
+        game.world = World(random_map(200, 200, 0.1), 1, game.rng, True)
+        game._init_squirrels(300)
+        world = game.world
+        arrays = world.squirrel_arrays
+        # Beyond the view even if they walk towards it the whole time.
+        player = world.squirrel.pos
+        far = (np.abs(arrays.x[:len(arrays)] - player.x)
+               > game.lod.reach_x + 8) \
+            | (np.abs(arrays.y[:len(arrays)] - player.y)
+               > game.lod.reach_y + 8)
+        assert far.any()
+        moves = np.zeros(len(arrays), int)
+        for i in range(8):
+            before = (arrays.x[:len(arrays)].copy(),
+                      arrays.y[:len(arrays)].copy())
+            game.tick_squirrels(None, 0)
+            moves += (arrays.x[:len(arrays)] != before[0]) \
+                | (arrays.y[:len(arrays)] != before[1])
+        # Far squirrels only tick every LOD_FAR_INTERVAL ticks.
+        assert moves[far].max() <= 8 // Game.LOD_FAR_INTERVAL
+
+    def test_wander_respects_blocking(self):
+        game = crowded_game()
+        world = game.world
+        nut_pos = next(Point(x, 0) for x in range(30)
+                       if world.can_move_to(Point(x, 0)))
+        nut = Nut(nut_pos.x, nut_pos.y)
+        world.add_nut(nut)
+        for i in range(20):
+            before = occupancy(world)
+            game.tick_squirrels(None, 0)
+            game.tick_foxes(None, 0)
+            after = occupancy(world)
+            assert all(not world.is_tree(fox.pos) for fox in world.foxes)
+            if nut.id in world.nuts:
+                assert world._cell(nut_pos) not in after
+            # Squirrels never move onto a cell another squirrel is on.
+            for (cell, count) in after.items():
+                assert count == 1 or count <= before.get(cell, 0)
+
+    def test_clear_detaches(self):
+        game = crowded_game()
+        squirrel = game.world.squirrels[0]
+        for i in range(5):
+            game.tick_squirrels(None, 0)
+        (pos, facing) = (squirrel.pos, squirrel.facing)
+        game.world.clear_squirrels()
+        assert squirrel.arrays is None
+        assert (squirrel.pos, squirrel.facing) == (pos, facing)
+        assert len(game.world.squirrel_arrays) == 0
+
+    def test_games_are_reproducible(self):
+        def play(seed):
+            game = Game(seed=seed, npc_arrays=True)
+            game.input(Input.START)
+            game.simulate(60000)
+            return (game.state, game.world.squirrel.pos,
+                    [s.pos for s in game.world.squirrels],
+                    [f.pos for f in game.world.foxes])
+        assert play(3) == play(3)
+        assert play(3)[0] in (GameState.STARTED, GameState.OVER)
@@ -0,0 +1,39 @@
+import pytest
+
+from game import Game, GameState, Season
+from geometry import Direction, Point
+
+
+class TestGame:
+    def test_simulate_until_starved(self):
+        game = Game()
+        game.state = GameState.STARTED
+        game.simulate(10 * 60 * 1000)
+        assert game.state == GameState.OVER
+        assert game.game_over_message is not None
+        assert game.time.current_time_ms() < 10 * 60 * 1000
+
+    def test_simulate_not_started(self):
+        game = Game()
+        game.simulate(1000)
+        assert game.time.current_time_ms() == 0
+
+    def test_season_changes(self):
+        game = Game()
+        game.state = GameState.STARTED
+        game.world.squirrel.energy = 10**9
+        game.simulate(Game.ROUND_DURATION[Season.SUMMER] +
+                      Game.DAY_TRANSITION_LENGTH + 1000)
+        assert game.current_season == Season.WINTER
+        assert game.stats.seasons_survived == 1
+
+    def test_step_held_directions(self):
+        game = Game()
+        game.state = GameState.STARTED
+        start = game.world.squirrel.pos
+        game.step(Game.MOVE_KEYPRESS_INTERVAL + 1, [Direction.UP])
+        assert game.world.squirrel.pos == Point(start.x, start.y - 1)
+        assert game.world.squirrel.facing == Direction.UP
+        # Held keys only repeat every MOVE_KEYPRESS_INTERVAL.
+        game.step(1, [Direction.UP])
+        assert game.world.squirrel.pos == Point(start.x, start.y - 1)
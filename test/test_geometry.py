@@ -1,7 +1,7 @@
 import pytest
 import math
 
-from geometry import pdist, Point
+from geometry import as_point, pdist, Point
 
 
 class TestGeometry:
@@ -13,3 +13,25 @@ class TestGeometry:
         p1 = Point(8, 3)
         p2 = Point(7, 4)
         assert pdist(p1, p2) == pytest.approx(math.sqrt(2))
+
+    def test_point_value_semantics(self):
+        p = Point(3, 4)
+        assert p == Point(3, 4)
+        assert p != Point(4, 3)
+        assert len({p, Point(3, 4), Point(4, 3)}) == 2
+        assert tuple(p) == (3, 4)
+        assert sorted([Point(1, 5), Point(0, 9), Point(1, 2)]) == \
+            [Point(0, 9), Point(1, 2), Point(1, 5)]
+        assert Point(1, 2) <= Point(1, 2) < Point(1, 3)
+
+    def test_point_cells(self):
+        p = Point(3, 4)
+        assert p.to_cell(10) == 43
+        assert Point.from_cell(43, 10) == p
+        assert type(Point.from_cell(43, 10)) is Point
+
+    def test_as_point(self):
+        p = Point(1, 2)
+        assert as_point(p) is p
+        assert type(as_point((1, 2))) is Point
+        assert as_point((1, 2)).y == 2
@@ -0,0 +1,206 @@
+import math
+
+import pytest
+
+import npc
+from astar import find_path_astar, find_path_window
+from fox import Fox
+from geometry import Direction, Point
+from hpa import HierarchicalPathfinder
+from mapgen import generate_map
+from terrain import TREE, Terrain
+from world import World
+
+
+def path_cost(path):
+    return sum(math.hypot(b.x - a.x, b.y - a.y)
+               for (a, b) in zip(path, path[1:]))
+
+
+def assert_valid(path, terrain, src, dst):
+    assert path[0] == src
+    assert path[-1] == dst
+    for (a, b) in zip(path, path[1:]):
+        assert max(abs(a.x - b.x), abs(a.y - b.y)) == 1
+    assert all(terrain[p.y][p.x] != TREE for p in path)
+
+
+class FakeGame:
+    def __init__(self, world_map):
+        self.world = World(world_map)
+
+
+class TestHierarchicalPathfinder:
+    def _pathfinder(self, size=200, seed=1, density=0.2):
+        terrain = generate_map(size, size, seed=seed, density=density).terrain
+        pathfinder = HierarchicalPathfinder(size, size, terrain.trees)
+        return terrain, pathfinder, lambda x, y: terrain[y][x] != TREE
+
+    def test_near_optimal(self):
+        terrain, pathfinder, passable = self._pathfinder()
+        pairs = [(Point(2, 3), Point(190, 195)), (Point(180, 10),
+                 Point(15, 170)), (Point(100, 100), Point(101, 199))]
+        for (src, dst) in pairs:
+            if not (passable(*src) and passable(*dst)):
+                continue
+            path = pathfinder.find_path(src, dst, passable)
+            assert_valid(path, terrain, src, dst)
+            best = find_path_astar(terrain, src, dst, TREE)
+            assert path_cost(path) <= 1.2 * path_cost(best)
+
+    def test_same_cluster_and_within(self):
+        terrain, pathfinder, passable = self._pathfinder(seed=2)
+        src = Point(100, 100)
+        assert pathfinder.find_path(src, src, passable) == [src]
+        assert pathfinder.find_path(src, Point(103, 100), passable,
+                                    within=5) == [src]
+        path = pathfinder.find_path(Point(0, 0), Point(199, 199), passable,
+                                    within=10)
+        if path is not None:
+            end = path[-1]
+            assert (end.x - 199)**2 + (end.y - 199)**2 <= 100
+
+    def test_unreachable(self):
+        rows = ['.' * 100] * 100
+        rows[50] = '#' * 100
+        terrain = Terrain.from_rows(rows)
+        pathfinder = HierarchicalPathfinder(100, 100, terrain.trees)
+
+        def passable(x, y):
+            return terrain[y][x] != TREE
+        assert pathfinder.find_path(Point(5, 5), Point(90, 90),
+                                    passable) is None
+        assert pathfinder.find_path(Point(5, 5), Point(90, 50),
+                                    passable) is None
+
+    def test_blocked_goal(self):
+        rows = ['.' * 100] * 100
+        rows[50] = '.' * 80 + '#' * 20
+        terrain = Terrain.from_rows(rows)
+        pathfinder = HierarchicalPathfinder(100, 100, terrain.trees)
+
+        def passable(x, y):
+            return terrain[y][x] != TREE
+        src, dst = Point(5, 5), Point(90, 50)
+        assert pathfinder.find_path(src, dst, passable) is None
+        for within in [1, 3]:
+            path = pathfinder.find_path(src, dst, passable, within)
+            end = path[-1]
+            assert (end.x - dst.x)**2 + (end.y - dst.y)**2 <= within**2
+            assert_valid(path, terrain, src, end)
+            best = find_path_astar(terrain, src, dst, TREE, within)
+            assert path_cost(path) <= 1.2 * path_cost(best)
+
+    def test_routes_around_characters(self):
+        terrain = Terrain.from_rows(['.' * 100] * 100)
+        pathfinder = HierarchicalPathfinder(100, 100, terrain.trees)
+        # A wall that isn't in the terrain, across a whole cluster row.
+        wall = {Point(x, 40) for x in range(16, 48)}
+
+        def passable(x, y):
+            return Point(x, y) not in wall
+        src, dst = Point(30, 30), Point(30, 99)
+        path = pathfinder.find_path(src, dst, passable)
+        assert_valid(path, terrain, src, dst)
+        assert not wall & set(path)
+
+    def test_replans_around_blocked_entrances(self):
+        rows = ['.' * 100] * 100
+        # A wall along a cluster border, with two one-tile gaps.
+        rows[47] = '#' * 20 + '.' + '#' * 59 + '.' + '#' * 19
+        terrain = Terrain.from_rows(rows)
+        pathfinder = HierarchicalPathfinder(100, 100, terrain.trees)
+        occupied = {Point(20, 47)}
+
+        def passable(x, y):
+            return terrain[y][x] != TREE and Point(x, y) not in occupied
+        src, dst = Point(20, 10), Point(20, 99)
+        path = pathfinder.find_path(src, dst, passable)
+        assert_valid(path, terrain, src, dst)
+        assert Point(80, 47) in path
+
+        occupied.add(Point(80, 47))
+        assert pathfinder.find_path(src, dst, passable) is None
+
+    def test_precompute(self):
+        terrain, pathfinder, passable = self._pathfinder(size=64)
+        pathfinder.precompute()
+        assert len(pathfinder._graphs) == 16
+        src, dst = Point(32, 32), Point(63, 0)
+        if passable(*dst):
+            assert_valid(pathfinder.find_path(src, dst, passable), terrain,
+                         src, dst)
+
+    def test_terrain_changes(self):
+        world = World(Terrain.from_rows(['.' * 100] * 100))
+        pathfinder = world.pathfinder(Fox)
+        src, dst = Point(0, 40), Point(99, 40)
+        path = pathfinder.find_path(
+            src, dst, lambda x, y: not world.is_tree(Point(x, y)))
+        assert_valid(path, world.terrain, src, dst)
+        assert path_cost(path) <= 1.2 * 99
+
+        version = world.terrain_version
+        for y in range(0, 90):
+            world.set_terrain(Point(50, y), TREE)
+        assert world.terrain_version == version + 90
+        assert Point(50, 0) in world.changed_tiles
+        assert world.is_tree(Point(50, 40))
+        path = pathfinder.find_path(
+            src, dst, lambda x, y: not world.is_tree(Point(x, y)))
+        assert_valid(path, world.terrain, src, dst)
+        assert any(p.y >= 90 for p in path)
+
+        for y in range(90, 100):
+            world.set_terrain(Point(50, y), TREE)
+        assert pathfinder.find_path(
+            src, dst, lambda x, y: not world.is_tree(Point(x, y))) is None
+
+    def test_npc_long_paths(self):
+        game = FakeGame(generate_map(200, 200, seed=5, density=0.15))
+        terrain = game.world.terrain
+        src, dst = Point(100, 100), Point(199, 0)
+        if not game.world.can_move_to(dst):
+            pytest.skip("destination is a tree")
+        fox = Fox(game, src, Direction.DOWN)
+        path = fox.find_path_astar(dst)
+        assert_valid(path, terrain, src, dst)
+        assert Fox in game.world._pathfinders
+
+        short = Fox(game, src, Direction.DOWN).find_path_astar(
+            Point(110, 110))
+        assert short == find_path_astar(terrain, src, Point(110, 110), fox)
+
+    def test_npc_long_paths_stay_hierarchical(self, monkeypatch):
+        game = FakeGame(Terrain.from_rows(['.' * 200] * 200))
+        fox = Fox(game, Point(0, 0), Direction.DOWN)
+        game.world.add_fox(fox)
+
+        def find_path_astar(*args, **kwargs):
+            raise AssertionError("searched the whole map")
+        monkeypatch.setattr(npc, 'find_path_astar', find_path_astar)
+        # Wall the destination in.
+        for p in [Point(150, 149), Point(149, 150), Point(149, 149),
+                  Point(151, 149), Point(149, 151), Point(151, 150),
+                  Point(150, 151), Point(151, 151)]:
+            game.world.set_terrain(p, TREE)
+        assert fox.find_path_astar(Point(150, 150)) is None
+        path = fox.find_path_astar(Point(150, 150), within=2)
+        end = path[-1]
+        assert (end.x - 150)**2 + (end.y - 150)**2 <= 4
+
+
+class TestFindPathWindow:
+    def test_stays_in_window(self):
+        rows = ['.' * 20] * 20
+        rows[5] = '.' * 15 + '#' * 5
+        terrain = Terrain.from_rows(rows)
+
+        def passable(x, y):
+            return terrain[y][x] != TREE
+        path = find_path_window(passable, Point(17, 2), Point(17, 8),
+                                10, 0, 20, 10)
+        assert_valid(path, terrain, Point(17, 2), Point(17, 8))
+        assert all(10 <= p.x < 20 and p.y < 10 for p in path)
+        assert find_path_window(passable, Point(17, 2), Point(17, 8),
+                                15, 0, 20, 10) is None
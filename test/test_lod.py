@@ -0,0 +1,52 @@
+from fox import Fox
+from game import Game
+from geometry import Direction, Point
+
+
+class TestLevelOfDetail:
+    def _game_with_fox(self, pos):
+        game = Game(seed=0)
+        game.world.clear_foxes()
+        game.world.clear_squirrels()
+        game.world.move_character(game.world.squirrel, Point(5, 5))
+        fox = Fox(game, pos, Direction.DOWN)
+        game.world.add_fox(fox)
+        return game, fox
+
+    def test_far_npcs_tick_less_often(self):
+        game, fox = self._game_with_fox(Point(35, 35))
+        ticks = []
+        for i in range(8):
+            game._tick_npcs("foxes", [fox], ticks.append)
+        assert fox.coarse
+        assert len(ticks) == 8 // game.LOD_FAR_INTERVAL
+
+    def test_near_npcs_tick_every_time(self):
+        game, fox = self._game_with_fox(Point(8, 8))
+        ticks = []
+        for i in range(8):
+            game._tick_npcs("foxes", [fox], ticks.append)
+        assert not fox.coarse
+        assert len(ticks) == 8
+
+    def test_coarse_npcs_do_not_pathfind(self, monkeypatch):
+        game, fox = self._game_with_fox(Point(35, 35))
+        monkeypatch.setattr(fox, 'find_path_astar', None)
+        fox.coarse = True
+        step = fox.next_step(Point(30, 35))
+        assert step.x == 34
+        assert fox.next_step(Point(36, 35), within=1) == fox.pos
+
+    def test_approaching_npcs_are_promoted(self):
+        game, fox = self._game_with_fox(Point(35, 35))
+        game._tick_npcs("foxes", [fox], lambda npc: None)
+        assert fox.coarse
+        game.world.move_character(game.world.squirrel, Point(30, 30))
+        game._tick_npcs("foxes", [fox], lambda npc: None)
+        assert not fox.coarse
+
+    def test_disabled(self):
+        class FullAIGame(Game):
+            LOD_MARGIN = None
+        game = FullAIGame(seed=0)
+        assert game.lod is None
@@ -0,0 +1,76 @@
+import sys
+
+import pytest
+
+from game import Game
+from geometry import Point
+from map import MAP
+from mapfile import load_map, main, save_map
+from terrain import HashedGround, Terrain
+from world import World
+
+
+class TestMapFile:
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / 'map.gdnm')
+        terrain = Terrain.from_rows(MAP)
+        ground = bytearray(i % 5 for i in range(len(terrain.cells)))
+        save_map(path, terrain, ground, [Point(3, 4), Point(5, 6)])
+
+        game_map = load_map(path)
+        assert game_map.terrain.rows() == list(MAP)
+        assert bytes(game_map.terrain.trees) == terrain.trees
+        assert bytes(game_map.ground) == ground
+        assert game_map.spawns == [Point(3, 4), Point(5, 6)]
+
+        world = World(path, 5)
+        assert world.squirrel.pos == Point(3, 4)
+        assert world.ground == ground
+        assert world.is_tree(Point(33, 1))
+        world.set_ground_tile(Point(0, 0), 4)
+        assert load_map(path).ground[0] == 0
+
+        with pytest.raises(ValueError):
+            World(path, 4)
+
+    def test_without_ground(self, tmp_path):
+        path = str(tmp_path / 'map.gdnm')
+        save_map(path, Terrain.from_rows(['..#', '#..']))
+        game_map = load_map(path)
+        assert game_map.ground is None
+        assert game_map.spawns == []
+        world = World(game_map, 3)
+        assert len(world.ground) == 6
+        assert all(0 <= tile < 3 for tile in world.ground)
+        assert isinstance(world.ground, HashedGround)
+        assert world.is_tree(Point(2, 0))
+        assert not world.is_tree(Point(1, 0))
+
+    def test_bad_files(self, tmp_path):
+        path = str(tmp_path / 'map.gdnm')
+        for data in [b'', b'GDNR' + bytes(16)]:
+            with open(path, 'wb') as f:
+                f.write(data)
+            with pytest.raises(ValueError):
+                load_map(path)
+
+        save_map(path, Terrain.from_rows(['..#', '#..']))
+        with open(path, 'ab') as f:
+            f.write(b'.')
+        with pytest.raises(ValueError):
+            load_map(path)
+
+    def test_game(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'map.gdnm')
+        monkeypatch.setattr(
+            sys, 'argv',
+            ['mapfile', path, '--spawn', '1,2', '--ground-tiles', '30'])
+        main()
+
+        game = Game(seed=1, map_path=path)
+        assert game.world.squirrel.pos == Point(1, 2)
+        game.reset()
+        assert game.world.squirrel.pos == Point(1, 2)
+        game.reset(path)
+        assert game.map_path == path
+        assert bytes(game.world.ground) == bytes(load_map(path).ground)
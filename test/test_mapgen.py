@@ -0,0 +1,49 @@
+import pytest
+
+from game import Game, GameState, Input
+from geometry import Point
+from mapgen import generate_map, parse_size
+from world import World
+
+
+class TestMapGen:
+    def test_deterministic(self):
+        a = generate_map(200, 150, seed=4)
+        assert a.terrain.cells == generate_map(200, 150, seed=4).terrain.cells
+        assert a.terrain.cells != generate_map(200, 150, seed=5).terrain.cells
+        assert (a.terrain.width, a.terrain.height) == (200, 150)
+        assert a.spawns == [Point(100, 75)]
+        assert set(a.terrain.cells) == {ord('.'), ord('#')}
+
+    @pytest.mark.parametrize('density', [0.0, 0.1, 0.4])
+    def test_density(self, density):
+        trees = generate_map(500, 500, seed=1, density=density).terrain.trees
+        assert sum(trees) / len(trees) == pytest.approx(density, abs=0.02)
+
+    def test_clusters_at_edges(self):
+        game_map = generate_map(7, 5, seed=2, density=0.5, max_radius=5)
+        assert len(game_map.terrain.cells) == 35
+        assert game_map.terrain[2][3] == '.'
+
+    def test_bad_arguments(self):
+        with pytest.raises(ValueError):
+            generate_map(0, 10)
+        with pytest.raises(ValueError):
+            generate_map(10, 10, density=1)
+        with pytest.raises(ValueError):
+            generate_map(10, 10, min_radius=3, max_radius=2)
+
+    def test_game(self):
+        game_map = generate_map(300, 200, seed=3)
+        world = World(game_map, 30)
+        assert world.squirrel.pos == Point(150, 100)
+        game = Game(seed=1, map_path=game_map)
+        game.input(Input.START)
+        assert game.state == GameState.STARTED
+        game.simulate(5000)
+        assert game.world.WIDTH_TILES == 300
+        assert game.time.current_time_ms() > 0
+
+    def test_parse_size(self):
+        assert parse_size('2000x1000') == (2000, 1000)
+        assert parse_size('3X4') == (3, 4)
@@ -0,0 +1,60 @@
+import pytest
+
+from geometry import Direction, Point
+from fox import Fox
+from map import MAP
+from squirrel import Squirrel
+from world import World
+
+
+class FakeGame:
+    def __init__(self):
+        self.world = World(MAP)
+
+
+class TestNPC:
+    def _counting_fox(self, monkeypatch, pos):
+        fox = Fox(FakeGame(), pos, Direction.DOWN)
+        fox.game.world.add_fox(fox)
+        calls = []
+        find_path_astar = fox.find_path_astar
+
+        def counting_find_path_astar(dst, within=0):
+            calls.append((fox.pos, dst))
+            return find_path_astar(dst, within)
+        monkeypatch.setattr(fox, 'find_path_astar', counting_find_path_astar)
+        return fox, calls
+
+    def test_next_step_follows_cached_path(self, monkeypatch):
+        fox, calls = self._counting_fox(monkeypatch, Point(0, 0))
+        dst = Point(5, 0)
+        for x in range(1, 6):
+            step = fox.next_step(dst)
+            assert step == Point(x, 0)
+            fox.move_to(step)
+        assert fox.next_step(dst) == dst
+        assert len(calls) == 1
+
+    def test_next_step_replans_when_blocked(self, monkeypatch):
+        fox, calls = self._counting_fox(monkeypatch, Point(0, 0))
+        dst = Point(5, 0)
+        fox.move_to(fox.next_step(dst))
+        fox.game.world.add_squirrel(
+            Squirrel(fox.game, Point(2, 0), Direction.DOWN))
+        step = fox.next_step(dst)
+        assert step == Point(2, 1)
+        assert len(calls) == 2
+
+    def test_next_step_replans_when_moved_or_retargeted(self, monkeypatch):
+        fox, calls = self._counting_fox(monkeypatch, Point(0, 0))
+        fox.next_step(Point(5, 0))
+        fox.next_step(Point(5, 1))
+        assert len(calls) == 2
+        fox.game.world.move_character(fox, Point(0, 3))
+        assert fox.next_step(Point(5, 1)).x == 1
+        assert len(calls) == 3
+
+    def test_next_step_no_path(self):
+        fox = Fox(FakeGame(), Point(0, 0), Direction.DOWN)
+        # Foxes can't climb trees.
+        assert fox.next_step(Point(33, 1)) is None
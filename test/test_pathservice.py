@@ -0,0 +1,170 @@
+import concurrent.futures
+
+import pytest
+
+from astar import find_path_astar
+from fox import Fox
+from geometry import Direction, Point
+from map import MAP
+from mapgen import generate_map
+from mapfile import save_map
+from nut import Nut
+import pathservice
+from pathservice import PathRequest, PathService
+from world import World
+
+
+class FakeGame:
+    def __init__(self):
+        self.world = World(MAP)
+        self.paths = None
+
+
+class ManualPaths:
+    """Hands out requests whose results the test sets."""
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, character, dst, within=0):
+        request = PathRequest(character.pos, dst, within,
+                              concurrent.futures.Future())
+        self.requests.append(request)
+        return request
+
+
+def fox_at(pos):
+    game = FakeGame()
+    fox = Fox(game, pos, Direction.DOWN)
+    game.world.add_fox(fox)
+    return fox
+
+
+class TestPathService:
+    @pytest.mark.parametrize('processes', [False, True])
+    def test_matches_synchronous_search(self, processes):
+        fox = fox_at(Point(0, 0))
+        paths = PathService(fox.game, processes=processes)
+        try:
+            for (dst, within) in [(Point(20, 20), 0), (Point(30, 5), 1)]:
+                request = paths.request(fox, dst, within)
+                assert request.future.result(timeout=30) is not None
+                assert request.result() == \
+                    find_path_astar(MAP, fox.pos, dst, fox, within)
+        finally:
+            paths.close()
+
+    def test_map_files(self, tmp_path):
+        path = str(tmp_path / 'map.gdnm')
+        terrain = generate_map(300, 300, seed=1).terrain
+        save_map(path, terrain)
+        game = FakeGame()
+        game.world = World(path)
+        fox = Fox(game, Point(150, 150), Direction.DOWN)
+        paths = PathService(game)
+        try:
+            dst = Point(170, 140)
+            request = paths.request(fox, dst)
+            request.future.result(timeout=30)
+            assert request.result() == \
+                find_path_astar(terrain, fox.pos, dst, fox)
+        finally:
+            paths.close()
+
+    def test_long_paths_are_hierarchical(self, monkeypatch):
+        game = FakeGame()
+        game.world = World(generate_map(200, 200, seed=5, density=0.15))
+        fox = Fox(game, Point(100, 100), Direction.DOWN)
+        game.world.add_fox(fox)
+        dst = Point(20, 190)
+        while not game.world.can_move_to(dst):
+            dst = Point(dst.x + 1, dst.y)
+
+        def find_path_bounded(*args, **kwargs):
+            raise AssertionError("searched with plain A*")
+        monkeypatch.setattr(pathservice, 'find_path_bounded',
+                            find_path_bounded)
+        paths = PathService(game, processes=False)
+        try:
+            request = paths.request(fox, dst)
+            request.future.result(timeout=30)
+            assert request.result() == fox.find_path_astar(dst)
+            assert request.result()[-1] == dst
+        finally:
+            paths.close()
+
+    def test_concurrent_threads(self):
+        fox = fox_at(Point(0, 0))
+        paths = PathService(fox.game, workers=4, processes=False)
+        try:
+            dsts = [Point(x, y) for x in range(20, 38, 3)
+                    for y in range(5, 38, 4)]
+            requests = [paths.request(fox, dst) for dst in dsts]
+            for (dst, request) in zip(dsts, requests):
+                request.future.result(timeout=30)
+                assert request.result() == \
+                    find_path_astar(MAP, fox.pos, dst, fox)
+        finally:
+            paths.close()
+
+    def test_new_world(self):
+        fox = fox_at(Point(0, 0))
+        paths = PathService(fox.game, processes=False)
+        try:
+            request = paths.request(fox, Point(20, 20))
+            request.future.result(timeout=30)
+            executor = paths.executor
+            fox.game.world = World(['.' * 5] * 5)
+            request = paths.request(fox, Point(4, 4))
+            assert paths.executor is not executor
+            request.future.result(timeout=30)
+            assert request.result() == [Point(i, i) for i in range(5)]
+        finally:
+            paths.close()
+        assert paths.executor is None
+
+    def test_npc_steps_greedily_until_the_path_arrives(self):
+        fox = fox_at(Point(0, 0))
+        fox.game.paths = paths = ManualPaths()
+        dst = Point(5, 0)
+
+        step = fox.next_step(dst)
+        assert step == Point(1, 0)
+        assert len(paths.requests) == 1
+        fox.move_to(step)
+        # Still waiting: no new request.
+        assert fox.next_step(dst) == Point(2, 0)
+        assert len(paths.requests) == 1
+
+        paths.requests[0].future.set_result(
+            [(x, 0) for x in range(0, 6)])
+        assert fox.next_step(dst) == Point(2, 0)
+        fox.move_to(Point(2, 0))
+        assert fox.next_step(dst) == Point(3, 0)
+        assert len(paths.requests) == 1
+
+    def test_no_path(self):
+        fox = fox_at(Point(0, 0))
+        fox.game.paths = paths = ManualPaths()
+        fox.next_step(Point(5, 0))
+        paths.requests[0].future.set_result(None)
+        assert fox.next_step(Point(5, 0)) is None
+
+    def test_path_blocked_before_it_arrives(self):
+        fox = fox_at(Point(0, 0))
+        fox.game.paths = paths = ManualPaths()
+        dst = Point(5, 0)
+        fox.next_step(dst)
+        paths.requests[0].future.set_result([(x, 0) for x in range(0, 6)])
+        fox.game.world.add_nut(Nut(1, 0))
+        # The fox asks again, and can't step straight past the nut.
+        assert fox.next_step(dst) is None
+        assert len(paths.requests) == 2
+
+    def test_retargeting_cancels_the_old_request(self):
+        fox = fox_at(Point(0, 0))
+        fox.game.paths = paths = ManualPaths()
+        fox.next_step(Point(5, 0))
+        fox.next_step(Point(0, 5))
+        assert paths.requests[0].future.cancelled()
+        assert not paths.requests[1].future.cancelled()
@@ -0,0 +1,61 @@
+import csv
+import json
+
+import pytest
+
+from profiler import FrameProfiler, NULL_PROFILER
+
+
+class TestFrameProfiler:
+    def _profiler(self, record=False):
+        profiler = FrameProfiler(window=100, record=record)
+        for i in range(1, 101):
+            profiler.current = {'frame': float(i), 'foxes': 1.0}
+            profiler.end_frame()
+        return profiler
+
+    def test_percentiles(self):
+        profiler = self._profiler()
+        assert profiler.percentiles('frame') == [50.0, 95.0, 99.0]
+        assert profiler.percentiles('foxes') == [1.0, 1.0, 1.0]
+        assert profiler.percentiles('render') == [0.0, 0.0, 0.0]
+        assert list(profiler.summary()) == ['frame', 'foxes']
+
+    def test_stage_accumulates(self):
+        profiler = FrameProfiler()
+        with profiler.stage('foxes'):
+            pass
+        first = profiler.current['foxes']
+        with profiler.stage('foxes'):
+            pass
+        assert profiler.current['foxes'] >= first
+        profiler.end_frame()
+        assert profiler.current == {}
+        assert profiler.frames == []
+
+    def test_dump_csv(self, tmp_path):
+        profiler = self._profiler(record=True)
+        path = str(tmp_path / 'frames.csv')
+        profiler.dump(path)
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ['frame', 'frame_ms', 'foxes_ms']
+        assert len(rows) == 101
+        assert float(rows[-1][1]) == 100.0
+
+    def test_dump_json(self, tmp_path):
+        profiler = self._profiler(record=True)
+        path = str(tmp_path / 'frames.json')
+        profiler.dump(path)
+        with open(path) as f:
+            data = json.load(f)
+        assert data['stages'] == ['frame', 'foxes']
+        assert len(data['frames']) == 100
+        assert data['summary']['frame'] == [50.0, 95.0, 99.0]
+
+    def test_null_profiler(self):
+        with NULL_PROFILER.stage('frame'):
+            pass
+        NULL_PROFILER.end_frame()
+        assert NULL_PROFILER.PERCENTILES == FrameProfiler.PERCENTILES
+        assert NULL_PROFILER.summary() == {}
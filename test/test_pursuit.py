@@ -0,0 +1,60 @@
+import pytest
+
+from geometry import Direction, Point
+from fox import Fox
+from map import MAP
+from pursuit import PursuitField
+from world import World
+
+
+class FakeGame:
+    def __init__(self):
+        self.world = World(MAP)
+        # Just to the right of the trees at (32..35, 1..4).
+        self.world.move_character(self.world.squirrel, Point(36, 3))
+        self.pursuit = PursuitField(self, Fox, 12)
+
+
+def path_cost(path):
+    return sum(((a.x - b.x)**2 + (a.y - b.y)**2)**0.5
+               for (a, b) in zip(path, path[1:]))
+
+
+class TestPursuitField:
+    def test_descends_cheapest_path(self):
+        game = FakeGame()
+        for start in [Point(30, 3), Point(33, 0), Point(34, 10)]:
+            fox = Fox(game, start, Direction.DOWN)
+            expected = fox.find_path_astar(game.world.squirrel.pos, 1)
+            path = [fox.pos]
+            while True:
+                step = game.pursuit.next_step(fox)
+                if step == fox.pos:
+                    break
+                fox.pos = step
+                path.append(step)
+            assert path_cost(path) == pytest.approx(path_cost(expected))
+
+    def test_built_once_for_all_pursuers(self, monkeypatch):
+        game = FakeGame()
+        builds = []
+        build = game.pursuit._build
+
+        def counting_build(target):
+            builds.append(target)
+            build(target)
+        monkeypatch.setattr(game.pursuit, '_build', counting_build)
+
+        for start in [Point(30, 3), Point(33, 0), Point(34, 10)]:
+            fox = Fox(game, start, Direction.DOWN)
+            assert game.pursuit.next_step(fox) is not None
+        assert len(builds) == 1
+
+        game.pursuit.invalidate()
+        game.pursuit.next_step(fox)
+        assert len(builds) == 2
+
+    def test_out_of_field(self):
+        game = FakeGame()
+        fox = Fox(game, Point(0, 0), Direction.DOWN)
+        assert game.pursuit.next_step(fox) is None
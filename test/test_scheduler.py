@@ -0,0 +1,123 @@
+import pytest
+
+from game import GameTime
+from scheduler import Scheduler, StaggeredTicker
+
+
+class TestScheduler:
+    def _scheduler(self):
+        clock = GameTime()
+        return clock, Scheduler(clock)
+
+    def test_periodic_coalesces_missed_periods(self):
+        clock, scheduler = self._scheduler()
+        calls = []
+        scheduler.schedule(lambda e, t: calls.append((t, e.last_timestamp)),
+                           100)
+        clock.update(100)
+        scheduler.run_due()
+        assert calls == []
+        clock.update(250)
+        scheduler.run_due()
+        assert calls == [(350, 0)]
+        clock.update(101)
+        scheduler.run_due()
+        assert calls == [(350, 0), (451, 350)]
+
+    def test_catch_up(self):
+        clock, scheduler = self._scheduler()
+        calls = []
+        scheduler.schedule(lambda e, t: calls.append(t), 100, catch_up=True)
+        clock.update(350)
+        scheduler.run_due()
+        assert calls == [100, 200, 300]
+        clock.update(60)
+        scheduler.run_due()
+        assert calls == [100, 200, 300, 400]
+
+    def test_due_events_run_in_time_order(self):
+        clock, scheduler = self._scheduler()
+        calls = []
+        scheduler.schedule(lambda e, t: calls.append(('a', t)), 150,
+                           catch_up=True)
+        scheduler.schedule(lambda e, t: calls.append(('b', t)), 100,
+                           catch_up=True)
+        clock.update(310)
+        scheduler.run_due()
+        assert calls == [('b', 100), ('a', 150), ('b', 200), ('a', 300),
+                         ('b', 300)]
+
+    def test_one_shot_and_cancel(self):
+        clock, scheduler = self._scheduler()
+        calls = []
+        scheduler.schedule(lambda e, t: calls.append('once'), 10,
+                           one_shot=True)
+        cancelled = scheduler.schedule(lambda e, t: calls.append('never'), 10)
+        cancelled.cancel()
+        assert len(scheduler) == 1
+        clock.update(100)
+        scheduler.run_due()
+        clock.update(100)
+        scheduler.run_due()
+        assert calls == ['once']
+        assert len(scheduler) == 0
+
+    def test_clear_from_action(self):
+        clock, scheduler = self._scheduler()
+        calls = []
+
+        def restart(event, timestamp):
+            calls.append('restart')
+            scheduler.clear()
+            scheduler.schedule(lambda e, t: calls.append('new'), 10)
+        scheduler.schedule(restart, 10)
+        scheduler.schedule(lambda e, t: calls.append('old'), 20)
+        clock.update(25)
+        scheduler.run_due()
+        assert calls == ['restart']
+        clock.update(11)
+        scheduler.run_due()
+        assert calls == ['restart', 'new']
+
+
+class TestStaggeredTicker:
+    def _ticker(self, items, period=1000):
+        calls = []
+        ticker = StaggeredTicker("test", items,
+                                 lambda item, sweep, index:
+                                     calls.append((item, sweep)),
+                                 period, 0)
+        return ticker, calls
+
+    def test_spreads_ticks_over_the_period(self):
+        ticker, calls = self._ticker(list("abcd"))
+        per_run = []
+        for now in range(50, 2001, 50):
+            before = len(calls)
+            ticker.run(now)
+            per_run.append(len(calls) - before)
+        assert max(per_run) == 1
+        assert calls == [(c, 0) for c in "abcd"] + [(c, 1) for c in "abcd"]
+
+    def test_deadline_carries_work_over(self):
+        ticker, calls = self._ticker(list("abcd"))
+        ticker.run(1000, deadline=0)
+        assert calls == [("a", 0)]
+        ticker.run(1000, deadline=0)
+        ticker.run(1000)
+        assert [item for (item, sweep) in calls] == list("abcd")
+
+    def test_skips_ticks_more_than_a_sweep_behind(self):
+        ticker, calls = self._ticker(list("ab"))
+        ticker.run(5000)
+        assert calls == [("a", 4), ("b", 4)]
+
+    def test_restarts_when_the_population_changes(self):
+        items = list("ab")
+        ticker, calls = self._ticker(items)
+        ticker.run(600)
+        items.append("c")
+        ticker.run(700)
+        assert calls == [("a", 0)]
+        ticker.run(1100)
+        assert calls == [("a", 0), ("a", 0)]
@@ -0,0 +1,44 @@
+import pytest
+
+from terrain import HashedGround, Terrain
+
+
+class TestTerrain:
+    def test_from_rows(self):
+        terrain = Terrain.from_rows(['..#', '#..'])
+        assert (terrain.width, terrain.height) == (3, 2)
+        assert len(terrain) == 2
+        assert terrain[0][2] == '#'
+        assert terrain[1][2] == '.'
+        assert terrain.rows() == ['..#', '#..']
+
+    def test_masks(self):
+        terrain = Terrain.from_rows(['..#', '#x.'])
+        assert terrain.trees == bytes([0, 0, 1, 1, 0, 0])
+        assert terrain.mask('#x') == bytes([0, 0, 1, 1, 1, 0])
+        assert terrain.mask('') == bytes(6)
+
+    def test_masks_of_views(self):
+        cells = memoryview(bytearray(b'..#' * 1000))
+        terrain = Terrain(3, 1000, cells)
+        assert terrain._translate('#', chunk_size=7) == \
+            Terrain.from_rows(['..#'] * 1000).trees
+
+    def test_size_mismatch(self):
+        with pytest.raises(ValueError):
+            Terrain(3, 2, bytearray(5))
+
+    def test_hashed_ground(self):
+        ground = HashedGround(10000, 30, seed=7)
+        assert len(ground) == 10000
+        tiles = list(ground)
+        assert tiles == list(HashedGround(10000, 30, seed=7))
+        assert tiles != list(HashedGround(10000, 30, seed=8))
+        assert set(tiles) == set(range(30))
+        ground[5] = 29
+        assert ground[5] == 29
+        assert ground[6] == tiles[6]
+        with pytest.raises(IndexError):
+            ground[10000]
+        with pytest.raises(ValueError):
+            HashedGround(10, 0, seed=7)
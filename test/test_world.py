@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from geometry import Direction, Point
+from fox import Fox
+from map import MAP
+from nut import Nut
+from squirrel import Squirrel
+from world import World
+
+
+class TestWorld:
+    def test_can_move_to_occupancy(self):
+        world = World(MAP)
+        assert not world.can_move_to(world.squirrel.pos)
+        assert world.can_move_to(Point(3, 3))
+        assert not world.can_move_to(Point(-1, 3))
+
+        squirrel = Squirrel(None, Point(3, 3), Direction.DOWN)
+        world.add_squirrel(squirrel)
+        assert not world.can_move_to(Point(3, 3))
+        world.move_character(squirrel, Point(4, 3))
+        assert world.can_move_to(Point(3, 3))
+        assert not world.can_move_to(Point(4, 3))
+        world.clear_squirrels()
+        assert world.can_move_to(Point(4, 3))
+
+    def test_foxes_do_not_block(self):
+        world = World(MAP)
+        fox = Fox(None, Point(5, 5), Direction.DOWN)
+        world.add_fox(fox)
+        assert world.can_move_to(Point(5, 5))
+        assert world.is_npc(Point(5, 5))
+        assert not world.can_bury_nut(Point(5, 5))
+        world.move_character(fox, Point(5, 6))
+        assert not world.is_npc(Point(5, 5))
+        assert world.is_npc(Point(5, 6))
+        assert not world.is_npc(world.squirrel.pos)
+
+    def test_nut_index(self):
+        world = World(MAP)
+        nut = Nut(7, 8)
+        world.add_nut(nut)
+        assert world.is_nut(Point(7, 8)) is nut
+        assert not world.can_move_to(Point(7, 8))
+        assert not world.can_bury_nut(Point(7, 8))
+
+        world.set_nut_state(nut, Nut.NutState.BURIED)
+        assert world.is_nut(Point(7, 8)) is nut
+        assert world.can_move_to(Point(7, 8))
+
+        world.set_nut_state(nut, Nut.NutState.ACTIVE)
+        assert not world.can_move_to(Point(7, 8))
+
+        world.remove_nut(nut)
+        assert world.is_nut(Point(7, 8)) is None
+        assert world.can_move_to(Point(7, 8))
+        assert world.can_bury_nut(Point(7, 8))
+
+
+class TestNutStore:
+    def test_state_partitions(self):
+        world = World(MAP)
+        nuts = [Nut(1, 1), Nut(2, 1), Nut(3, 1, Nut.NutState.BURIED)]
+        for nut in nuts:
+            world.add_nut(nut)
+        assert len(world.nuts) == 3
+        assert world.nuts.count(Nut.NutState.ACTIVE) == 2
+        assert world.nuts.count(Nut.NutState.BURIED) == 1
+        assert set(world.active_nuts()) == {nuts[0], nuts[1]}
+        assert world.buried_nuts() == [nuts[2]]
+
+        world.set_nut_state(nuts[0], Nut.NutState.BURIED)
+        assert world.active_nuts() == [nuts[1]]
+        assert set(world.buried_nuts()) == {nuts[0], nuts[2]}
+
+        world.remove_nut(nuts[2])
+        assert world.buried_nuts() == [nuts[0]]
+        assert world.nuts.get(nuts[2].id) is None
+        assert world.nuts[nuts[0].id] is nuts[0]
+
+    def test_random(self):
+        world = World(MAP)
+        active = Nut(1, 1)
+        world.add_nut(active)
+        world.add_nut(Nut(2, 1, Nut.NutState.BURIED))
+        for _ in range(10):
+            assert world.nuts.random(Nut.NutState.ACTIVE) is active
+
+    def test_terrain_layers(self):
+        world = World(MAP, 30, random.Random(1))
+        assert world.terrain.rows() == [row for row in MAP]
+        for (y, row) in enumerate(MAP):
+            for (x, c) in enumerate(row):
+                assert world.is_tree(Point(x, y)) == (c == '#')
+        assert not world.is_tree(Point(-1, 0))
+        assert all(tile < 30 for tile in world.ground)
+        assert len(set(world.ground)) == 30
+        assert world.ground == World(MAP, 30, random.Random(1)).ground
+
+        world.set_ground_tile(Point(3, 4), 7)
+        assert world.ground_tile(Point(3, 4)) == 7
+        assert Point(3, 4) in world.changed_tiles
@@ -1,85 +1,231 @@
+import os
 import random
-from typing import List
+from typing import Dict, Iterator, List, Sequence, Set, Type, Union
 
+from character import Character
+from crowd import NPCArrays
+from fox import Fox
 from geometry import Direction, Point
+from hpa import HierarchicalPathfinder
+from mapfile import GameMap, load_map
 from nut import Nut
 from squirrel import Squirrel
+from terrain import HashedGround, Terrain, random_ground
 
 
 class World:
-    def __init__(self, world_map, N_GROUND_TILES=1):
-        self.MAP = world_map
-        self.WIDTH_TILES = len(self.MAP[0])
-        self.HEIGHT_TILES = len(self.MAP)
+    def __init__(self, world_map, N_GROUND_TILES=1, rng=None,
+                 npc_arrays=False):
+        """``world_map`` is the path of a map file, a GameMap, a Terrain or
+        rows of map characters.
+        """
+        self.rng = rng if rng is not None else random.Random()
+        own_ground = False
+        # The file the map was loaded from, if any.
+        self.map_path = None
+        if isinstance(world_map, (str, os.PathLike)):
+            self.map_path = world_map
+            # Map our own copy-on-write view of the file, so that its ground
+            # can be changed in place without reading all of it in.
+            world_map = load_map(world_map, copy_on_write=True)
+            own_ground = True
+        ground, spawns = None, []
+        hashed_ground = False
+        if isinstance(world_map, GameMap):
+            ground, spawns = world_map.ground, world_map.spawns
+            hashed_ground = True
+            world_map = world_map.terrain
+        elif not isinstance(world_map, Terrain):
+            world_map = Terrain.from_rows(world_map)
+        self.terrain = world_map
+        self.WIDTH_TILES = world_map.width
+        self.HEIGHT_TILES = world_map.height
         self.N_GROUND_TILES = N_GROUND_TILES
+        # One byte per cell: 1 where there is a tree.
+        self.trees = world_map.trees
+        # Bumped whenever the terrain changes, for anything derived from it.
+        self.terrain_version = 0
+        # Per character class, lazily: the HierarchicalPathfinder for the
+        # terrain it can cross.
+        self._pathfinders: Dict[Type[Character], HierarchicalPathfinder] = {}
 
-        self.GROUND_LAYER: List[List[dict]] = \
-            [[{} for x in range(self.WIDTH_TILES)]
-             for y in range(self.HEIGHT_TILES)]
+        # The ground tile variant of each cell; random unless the map has
+        # its own. Maps from files and generators can be huge, so when they
+        # have none theirs are derived per cell as they are read.
+        self.ground: Union[bytearray, memoryview, HashedGround]
+        if ground is not None:
+            self.ground = ground if own_ground else bytearray(ground)
+            _check_ground(ground, N_GROUND_TILES)
+        elif hashed_ground:
+            self.ground = HashedGround(
+                self.WIDTH_TILES * self.HEIGHT_TILES, N_GROUND_TILES,
+                self.rng.getrandbits(64))
+        else:
+            self.ground = random_ground(
+                self.WIDTH_TILES * self.HEIGHT_TILES, N_GROUND_TILES,
+                self.rng)
+        # Cells whose ground tile has changed since the renderer last
+        # looked; it clears this once it has redrawn them.
+        self.changed_tiles: Set[Point] = set()
 
-        for x in range(self.WIDTH_TILES):
-            for y in range(self.HEIGHT_TILES):
-                self.GROUND_LAYER[y][x]['tileidx'] = \
-                    random.randint(0, self.N_GROUND_TILES-1)
+        # Occupancy layer: sparse per-cell character counts keyed by cell
+        # index, kept up to date by the methods below so that movement
+        # queries don't need to scan every character. Nuts are indexed
+        # the same way by the NutStore.
+        self._squirrels_at: Dict[int, int] = {}
+        self._npcs_at: Dict[int, int] = {}
 
-        self.squirrel = Squirrel(self, Point(23, 22), Direction.DOWN)
+        spawn = spawns[0] if spawns else Point(23, 22)
+        self.squirrel = Squirrel(self, spawn, Direction.DOWN)
+        self._occupy(self.squirrel, self.squirrel.pos, 1)
         self.squirrels = []
         self.foxes = []
-        self.nuts = {}
+        self.nuts = NutStore(self.WIDTH_TILES)
+        # Optional NumPy mirrors of the NPCs, ticked by crowd.py.
+        self.squirrel_arrays = None
+        self.fox_arrays = None
+        if npc_arrays:
+            self.squirrel_arrays = NPCArrays(self, Squirrel, self.rng)
+            self.fox_arrays = NPCArrays(self, Fox, self.rng)
+
+    def _cell(self, pos):
+        return pos.y * self.WIDTH_TILES + pos.x
+
+    def _occupy(self, character, pos, delta):
+        cell = self._cell(pos)
+        if isinstance(character, Squirrel):
+            _add_count(self._squirrels_at, cell, delta)
+        if character is not self.squirrel:
+            _add_count(self._npcs_at, cell, delta)
+
+    def add_squirrel(self, squirrel):
+        self.squirrels.append(squirrel)
+        self._occupy(squirrel, squirrel.pos, 1)
+        if self.squirrel_arrays is not None:
+            self.squirrel_arrays.add(squirrel)
+
+    def clear_squirrels(self):
+        for squirrel in self.squirrels:
+            self._occupy(squirrel, squirrel.pos, -1)
+        self.squirrels.clear()
+        if self.squirrel_arrays is not None:
+            self.squirrel_arrays.clear()
+
+    def add_fox(self, fox):
+        self.foxes.append(fox)
+        self._occupy(fox, fox.pos, 1)
+        if self.fox_arrays is not None:
+            self.fox_arrays.add(fox)
+
+    def clear_foxes(self):
+        for fox in self.foxes:
+            self._occupy(fox, fox.pos, -1)
+        self.foxes.clear()
+        if self.fox_arrays is not None:
+            self.fox_arrays.clear()
+
+    def move_character(self, character, dst):
+        self._occupy(character, character.pos, -1)
+        character.pos = dst
+        self._occupy(character, dst, 1)
+
+    def move_characters(self, character_cls, src_cells, dst_cells):
+        """Moves NPCs of ``character_cls`` from each of ``src_cells`` to the
+        cell of the same index in ``dst_cells``, like move_character() but
+        in bulk. Only updates which cells are occupied: the positions are
+        up to the caller (see crowd.NPCArrays.wander()).
+        """
+        counts = [self._npcs_at]
+        if issubclass(character_cls, Squirrel):
+            counts.append(self._squirrels_at)
+        for at in counts:
+            for cell in src_cells:
+                n = at[cell] - 1
+                if n:
+                    at[cell] = n
+                else:
+                    del at[cell]
+            for cell in dst_cells:
+                at[cell] = at.get(cell, 0) + 1
+
+    def add_nut(self, nut):
+        self.nuts.add(nut)
+
+    def remove_nut(self, nut):
+        self.nuts.remove(nut)
+
+    def set_nut_state(self, nut, state):
+        self.nuts.set_state(nut, state)
 
     def active_nuts(self):
-        return list(filter(lambda nut: nut.state == Nut.NutState.ACTIVE,
-                           self.nuts.values()))
+        return list(self.nuts.in_state(Nut.NutState.ACTIVE))
 
     def buried_nuts(self):
-        return list(filter(lambda nut: nut.state == Nut.NutState.BURIED,
-                           self.nuts.values()))
+        return list(self.nuts.in_state(Nut.NutState.BURIED))
+
+    def set_terrain(self, pos, char):
+        """Changes the map character at ``pos``, e.g. to plant a tree."""
+        self.terrain.set(pos.x, pos.y, char)
+        self.trees = self.terrain.trees
+        self.terrain_version += 1
+        self.changed_tiles.add(pos)
+        for (character_cls, pathfinder) in self._pathfinders.items():
+            pathfinder.update(
+                self.terrain.mask(character_cls.IMPASSABLE_TERRAIN), pos)
+
+    def pathfinder(self, character_cls: Type[Character]) \
+            -> HierarchicalPathfinder:
+        """Returns the hierarchical pathfinder for ``character_cls``."""
+        pathfinder = self._pathfinders.get(character_cls)
+        if pathfinder is None:
+            pathfinder = self._pathfinders[character_cls] = \
+                HierarchicalPathfinder(
+                    self.WIDTH_TILES, self.HEIGHT_TILES,
+                    self.terrain.mask(character_cls.IMPASSABLE_TERRAIN))
+        return pathfinder
+
+    def ground_tile(self, pos):
+        return self.ground[pos.y * self.WIDTH_TILES + pos.x]
+
+    def set_ground_tile(self, pos, tileidx):
+        self.ground[pos.y * self.WIDTH_TILES + pos.x] = tileidx
+        self.changed_tiles.add(pos)
 
     def random_point(self):
-        x = random.randint(0, self.WIDTH_TILES - 1)
-        y = random.randint(0, self.HEIGHT_TILES - 1)
+        x = self.rng.randint(0, self.WIDTH_TILES - 1)
+        y = self.rng.randint(0, self.HEIGHT_TILES - 1)
         return Point(x, y)
 
     def in_world_bounds(self, pos):
-        if pos.x < 0 or pos.x >= self.WIDTH_TILES or pos.y < 0 \
-                or pos.y >= self.HEIGHT_TILES:
-            return False
-        return True
+        x, y = pos.x, pos.y
+        return 0 <= x < self.WIDTH_TILES and 0 <= y < self.HEIGHT_TILES
+
+    def blocked_cells(self):
+        """Returns the cell indices that can_move_to() rejects."""
+        return list(self._squirrels_at) + self.nuts.active_cells()
 
     def can_move_to(self, pos):
-        if not self.in_world_bounds(pos):
+        # The bounds check and cell index are inlined: this is the hottest
+        # query in pathfinding.
+        x, y = pos.x, pos.y
+        if x < 0 or x >= self.WIDTH_TILES or y < 0 or y >= self.HEIGHT_TILES:
             return False
-        if pos == self.squirrel.pos:
-            return False
-        for squirrel in self.squirrels:
-            if pos == squirrel.pos:
-                return False
-        for nut in self.nuts.values():
-            if nut.state == Nut.NutState.ACTIVE and pos == nut.pos:
-                return False
-        return True
+        cell = y * self.WIDTH_TILES + x
+        return cell not in self._squirrels_at \
+            and not self.nuts.is_active_at(cell)
 
     def is_tree(self, pos):
-        return self.in_world_bounds(pos) and self.MAP[pos.y][pos.x] == '#'
+        x, y = pos.x, pos.y
+        return 0 <= x < self.WIDTH_TILES and 0 <= y < self.HEIGHT_TILES \
+            and self.trees[y * self.WIDTH_TILES + x] == 1
 
     def is_nut(self, pos):
         if not self.in_world_bounds(pos):
             return None
-        for nut in self.nuts.values():
-            if nut.pos.x == pos.x and nut.pos.y == pos.y:
-                return nut
-        return None
+        return self.nuts.first_at(self._cell(pos))
 
     def is_npc(self, pos):
-        for squirrel in self.squirrels:
-            if pos == squirrel.pos:
-                return True
-
-        for fox in self.foxes:
-            if pos == fox.pos:
-                return True
-
-        return False
+        return self.in_world_bounds(pos) and self._cell(pos) in self._npcs_at
 
     def can_bury_nut(self, pos):
         if self.is_tree(pos) or self.is_nut(pos):
@@ -87,3 +233,124 @@ class World:
         if self.is_npc(pos):
             return False
         return self.in_world_bounds(pos)
+
+
+def _check_ground(ground, ntiles, chunk_size=1 << 20):
+    tiles = bytes(range(ntiles))
+    for start in range(0, len(ground), chunk_size):
+        if bytes(ground[start:start + chunk_size]).translate(None, tiles):
+            raise ValueError(
+                f"map has ground tiles beyond the {ntiles} there are")
+
+
+class NutStore:
+    """All nuts lying in the world, indexed by id, state and cell.
+
+    Every state transition must go through add(), remove() or set_state()
+    so that the per-state lists and the cell index stay in step; in return
+    counting, listing and picking a random nut of a given state are O(1)
+    rather than a filter over every nut.
+    """
+
+    def __init__(self, width):
+        self._width = width
+        self._by_id: Dict[int, Nut] = {}
+        self._by_state: Dict[Nut.NutState, List[Nut]] = \
+            {state: [] for state in Nut.NutState}
+        # Index of each nut (by id) within its _by_state list.
+        self._slot: Dict[int, int] = {}
+        self._at: Dict[int, List[Nut]] = {}
+        self._active_at: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._by_id)
+
+    def __contains__(self, nut_id):
+        return nut_id in self._by_id
+
+    def __getitem__(self, nut_id) -> Nut:
+        return self._by_id[nut_id]
+
+    def get(self, nut_id, default=None):
+        return self._by_id.get(nut_id, default)
+
+    def values(self):
+        return self._by_id.values()
+
+    def _cell(self, nut):
+        return nut.pos.y * self._width + nut.pos.x
+
+    def add(self, nut):
+        self._by_id[nut.id] = nut
+        self._add_to_state(nut)
+        cell = self._cell(nut)
+        self._at.setdefault(cell, []).append(nut)
+        if nut.state == Nut.NutState.ACTIVE:
+            _add_count(self._active_at, cell, 1)
+
+    def remove(self, nut):
+        del self._by_id[nut.id]
+        self._remove_from_state(nut)
+        cell = self._cell(nut)
+        nuts_here = self._at[cell]
+        nuts_here.remove(nut)
+        if not nuts_here:
+            del self._at[cell]
+        if nut.state == Nut.NutState.ACTIVE:
+            _add_count(self._active_at, cell, -1)
+
+    def set_state(self, nut, state):
+        if nut.state == state:
+            return
+        self._remove_from_state(nut)
+        if nut.state == Nut.NutState.ACTIVE:
+            _add_count(self._active_at, self._cell(nut), -1)
+        nut.state = state
+        self._add_to_state(nut)
+        if nut.state == Nut.NutState.ACTIVE:
+            _add_count(self._active_at, self._cell(nut), 1)
+
+    def _add_to_state(self, nut):
+        nuts = self._by_state[nut.state]
+        self._slot[nut.id] = len(nuts)
+        nuts.append(nut)
+
+    def _remove_from_state(self, nut):
+        # Swap the last nut into the vacated slot to keep removal O(1).
+        nuts = self._by_state[nut.state]
+        slot = self._slot.pop(nut.id)
+        last = nuts.pop()
+        if last is not nut:
+            nuts[slot] = last
+            self._slot[last.id] = slot
+
+    def in_state(self, state) -> Sequence[Nut]:
+        return self._by_state[state]
+
+    def count(self, state):
+        return len(self._by_state[state])
+
+    def random(self, state, rng=random):
+        nuts = self._by_state[state]
+        return nuts[rng.randrange(0, len(nuts))]
+
+    def first_at(self, cell):
+        nuts_here = self._at.get(cell)
+        return nuts_here[0] if nuts_here else None
+
+    def is_active_at(self, cell):
+        return cell in self._active_at
+
+    def active_cells(self):
+        return list(self._active_at)
+
+
+def _add_count(counts, cell, delta):
+    n = counts.get(cell, 0) + delta
+    if n:
+        counts[cell] = n
+    else:
+        del counts[cell]